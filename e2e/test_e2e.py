@@ -264,6 +264,13 @@ def test_create_and_close_harvest_run(api_client, flower_client, reset_db, reset
     assert first_task['state'] == 'SUCCESS'
     assert '10.17026/AR/0AKDPK' in first_task['args']
 
+    # the batch is recorded as done
+    res_progress = api_client.get('/index/progress', params={'harvest_run_id': create_response['id']})
+
+    assert res_progress.status_code == 200
+    assert res_progress.json()['batches_done'] == 1
+    assert res_progress.json()['events_remaining'] == 0
+
     response_config = api_client.get("/config")
 
     assert response_config.status_code == 200
@@ -0,0 +1,75 @@
+#!/usr/bin/env -S uv run --script
+
+import argparse
+import itertools
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+from fastembed import TextEmbedding
+
+# setting path
+sys.path.append("..")
+sys.path.append("../..")
+
+from src.utils.embedding_utils import get_embedding_text_from_fields
+from src.utils.normalize_datacite_xml import normalize_datacite_xml
+
+
+def optional_int(value: str) -> Optional[int]:
+    """
+    Parses an int, "none" stands for the default of the setting (see `EmbeddingConfig`).
+    """
+    return None if value.lower() == 'none' else int(value)
+
+
+def measure(model: TextEmbedding, texts: list[str], batch_size: int, parallel: Optional[int], rounds: int) -> float:
+    """
+    Embeds the texts the given number of rounds, including the start-up of the subprocesses if parallel is set.
+
+    :return: texts per second.
+    """
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for _ in model.embed(texts, batch_size=batch_size, parallel=parallel):
+            pass
+    duration = time.perf_counter() - started
+
+    return len(texts) * rounds / duration
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Reports the embedding throughput per setting to size the embedding workers')
+    parser.add_argument('-i', help='input directory with OAI-PMH XML records', type=Path, required=True)
+    parser.add_argument('-m', help='embedding model', type=str, default='BAAI/bge-small-en-v1.5')
+    parser.add_argument('-b', help='batch sizes (EMBEDDING_BATCH_SIZE)', type=int, nargs='+', default=[32, 256])
+    parser.add_argument('-p', help='numbers of subprocesses, 0 for all cores (EMBEDDING_PARALLEL)',
+                        type=optional_int, nargs='+', default=[None])
+    parser.add_argument('-t', help='numbers of ONNX threads (EMBEDDING_THREADS)', type=optional_int, nargs='+', default=[None])
+    parser.add_argument('-r', help='number of rounds', type=int, default=1)
+
+    args = parser.parse_args()
+
+    texts = []
+    for file in args.i.rglob('*.xml'):
+        with open(file) as f:
+            normalized = normalize_datacite_xml(f.read())
+
+        if normalized is not None:
+            texts.append(get_embedding_text_from_fields(normalized))
+
+    if len(texts) == 0:
+        print(f'No DataCite records found in {args.i}', file=sys.stderr)
+        exit(1)
+
+    print(f'{len(texts)} texts, {args.r} rounds, model {args.m}')
+    print(f'{"threads":>8} {"batch":>6} {"parallel":>8} {"texts/s":>10}')
+
+    for threads in args.t:
+        model = TextEmbedding(model_name=args.m, threads=threads)
+        # warm-up so that loading the model is not measured
+        list(model.embed(texts[:8]))
+
+        for batch_size, parallel in itertools.product(args.b, args.p):
+            rate = measure(model, texts, batch_size, parallel, args.r)
+            print(f'{str(threads):>8} {batch_size:>6} {str(parallel):>8} {rate:>10.1f}')
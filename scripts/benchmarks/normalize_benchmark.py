@@ -0,0 +1,70 @@
+#!/usr/bin/env -S uv run --script
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional
+import xmltodict
+
+# setting path
+sys.path.append("..")
+sys.path.append("../..")
+
+from src.utils.normalize_datacite_json import normalize_datacite_json
+from src.utils.normalize_datacite_xml import normalize_datacite_xml
+
+OAI = 'http://www.openarchives.org/OAI/2.0/'
+DATACITE_RESOURCE = 'http://datacite.org/schema/kernel-4:resource'
+
+
+def normalize_with_xmltodict(xml: str) -> Optional[dict[str, Any]]:
+    metadata = xmltodict.parse(xml, process_namespaces=True)[f'{OAI}:record'][f'{OAI}:metadata']
+
+    if DATACITE_RESOURCE not in metadata:
+        return None
+
+    return normalize_datacite_json(metadata[DATACITE_RESOURCE])
+
+
+def measure(normalize: Callable[[str], Optional[dict[str, Any]]], records: list[str], rounds: int) -> float:
+    """
+    Normalizes the records the given number of rounds.
+
+    :return: records per second.
+    """
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for xml in records:
+            normalize(xml)
+    duration = time.perf_counter() - started
+
+    return len(records) * rounds / duration
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compares the throughput of the xmltodict and lxml based normalization')
+    parser.add_argument('-i', help='input directory with OAI-PMH XML records', type=Path, required=True)
+    parser.add_argument('-r', help='number of rounds', type=int, default=5)
+
+    args = parser.parse_args()
+
+    records = []
+    for file in args.i.rglob('*.xml'):
+        with open(file) as f:
+            records.append(f.read())
+
+    if len(records) == 0:
+        print(f'No XML records found in {args.i}', file=sys.stderr)
+        exit(1)
+
+    mismatches = sum(normalize_with_xmltodict(xml) != normalize_datacite_xml(xml) for xml in records)
+    if mismatches > 0:
+        print(f'{mismatches} of {len(records)} records are normalized differently', file=sys.stderr)
+
+    xmltodict_rate = measure(normalize_with_xmltodict, records, args.r)
+    lxml_rate = measure(normalize_datacite_xml, records, args.r)
+
+    print(f'{len(records)} records, {args.r} rounds')
+    print(f'xmltodict: {xmltodict_rate:.1f} records/s')
+    print(f'lxml:      {lxml_rate:.1f} records/s ({lxml_rate / xmltodict_rate:.2f}x)')
@@ -0,0 +1,103 @@
+#!/usr/bin/env -S uv run --script
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+import numpy as np
+from opensearchpy.serializer import JSONSerializer
+
+# setting path
+sys.path.append("..")
+sys.path.append("../..")
+
+from src.utils.json_utils import dumps_document
+from src.utils.normalize_datacite_xml import normalize_datacite_xml
+
+SerializeBatch = Callable[[list[dict[str, Any]], list[np.ndarray[Any, Any]]], Any]
+
+
+def serialize_lists(batch: list[dict[str, Any]], embeddings: list[np.ndarray[Any, Any]]) -> Any:
+    """
+    Serializes a batch like before json_utils: the embeddings are converted to lists,
+    the documents are copied for records.datacite_json and serialized with json twice.
+    """
+    sources = [{**src, 'emb': emb.tolist()} for src, emb in zip(batch, embeddings)]
+    serializer = JSONSerializer()
+    return [(serializer.dumps(src), json.dumps({**src, 'emb': None})) for src in sources]
+
+
+def serialize_arrays(batch: list[dict[str, Any]], embeddings: list[np.ndarray[Any, Any]]) -> Any:
+    """
+    Serializes a batch like `tasks.write_records`: the embeddings are kept as arrays
+    and each document is serialized once with orjson, see `json_utils.dumps_document`.
+    """
+    sources = [{**src, 'emb': emb} for src, emb in zip(batch, embeddings)]
+    return [dumps_document(src) for src in sources]
+
+
+def measure(serialize: SerializeBatch, batches: list[tuple[list[dict[str, Any]], list[np.ndarray[Any, Any]]]],
+            rounds: int) -> tuple[float, float]:
+    """
+    Serializes the batches the given number of rounds.
+
+    :return: milliseconds per batch and peak of the memory allocated by a batch in KiB (measured in a separate round with tracemalloc).
+    """
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for batch, embeddings in batches:
+            serialize(batch, embeddings)
+    duration = time.perf_counter() - started
+
+    peaks = []
+    tracemalloc.start()
+    for batch, embeddings in batches:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        serialize(batch, embeddings)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return duration * 1000 / (rounds * len(batches)), sum(peaks) / len(peaks) / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compares the serialization of batches of documents with embeddings '
+                                                 'as lists with json and as arrays with orjson')
+    parser.add_argument('-i', help='input directory with OAI-PMH XML records', type=Path, required=True)
+    parser.add_argument('-d', help='embedding dimensions', type=int, default=384)
+    parser.add_argument('-b', help='batch size (CELERY_BATCH_SIZE)', type=int, default=125)
+    parser.add_argument('-r', help='number of rounds', type=int, default=5)
+
+    args = parser.parse_args()
+
+    documents = []
+    for file in args.i.rglob('*.xml'):
+        with open(file) as f:
+            normalized = normalize_datacite_xml(f.read())
+
+        if normalized is not None:
+            documents.append(normalized)
+
+    if len(documents) == 0:
+        print(f'No DataCite records found in {args.i}', file=sys.stderr)
+        exit(1)
+
+    # embeddings as returned by the model
+    rng = np.random.default_rng(0)
+    embeddings = [rng.random(args.d, dtype=np.float32) for _ in documents]
+    batches = [(documents[i:i + args.b], embeddings[i:i + args.b]) for i in range(0, len(documents), args.b)]
+
+    print(f'{len(documents)} documents in {len(batches)} batches, {args.d} dimensions, {args.r} rounds')
+    print(f'{"serialization":>16} {"ms/batch":>10} {"KiB/batch":>10}')
+
+    results = {}
+    for name, serialize in (('lists + json', serialize_lists), ('arrays + orjson', serialize_arrays)):
+        results[name] = measure(serialize, batches, args.r)
+        print(f'{name:>16} {results[name][0]:>10.2f} {results[name][1]:>10.1f}')
+
+    print(f'saved per batch: {results["lists + json"][0] - results["arrays + orjson"][0]:.2f} ms, '
+          f'{results["lists + json"][1] - results["arrays + orjson"][1]:.1f} KiB allocated')
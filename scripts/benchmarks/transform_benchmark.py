@@ -0,0 +1,234 @@
+#!/usr/bin/env -S uv run --script
+
+import argparse
+import copy
+import importlib
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Optional
+import numpy as np
+import orjson
+from lxml import etree
+from opensearchpy import OpenSearch
+
+# setting path
+sys.path.append("..")
+sys.path.append("../..")
+# the modules of the workers import each other relative to src
+SRC = Path(__file__).resolve().parent.parent.parent / 'src'
+sys.path.append(str(SRC))
+
+from src.utils.json_utils import OrjsonSerializer
+from src.utils.normalize_datacite_json import DATACITE
+from src.utils.normalize_datacite_xml import OAI, ONEDATA
+from src.utils.queue_utils import HarvestEventQueue
+
+TEMPLATE = SRC.parent / 'tests/testdata/doi_10.17026_SS_78HHDK.oai_datacite.xml'
+
+# layouts of the OAI-PMH records the workers accept, see tasks.extract_resource
+LAYOUTS = ['datacite', 'hal', 'onedata']
+
+
+def find(element: etree._Element, path: str) -> etree._Element:
+    found = element.find(path)
+    if found is None:
+        raise ValueError(f'{path} not found in {TEMPLATE}')
+    return found
+
+
+def create_records(count: int, layouts: list[str]) -> list[str]:
+    """
+    Creates synthetic OAI-PMH records from the DataCite record in tests/testdata,
+    each with its own identifier and title so that every record is embedded.
+
+    :param count: number of records.
+    :param layouts: layouts of the records, used in turns.
+    :return: the records as XML.
+    """
+    template = etree.parse(TEMPLATE).getroot()
+    records = []
+
+    for i in range(count):
+        record = copy.deepcopy(template)
+        find(record, f'{{{OAI}}}header/{{{OAI}}}identifier').text = f'doi:10.1234/bench.{i}'
+
+        metadata = find(record, f'{{{OAI}}}metadata')
+        resource = find(metadata, f'{{{DATACITE}}}resource')
+        find(resource, f'{{{DATACITE}}}identifier').text = f'10.1234/bench.{i}'
+        title = find(resource, f'{{{DATACITE}}}titles/{{{DATACITE}}}title')
+        title.text = f'{title.text} {i}'
+
+        layout = layouts[i % len(layouts)]
+        if layout == 'hal':
+            # the resource element is in the OAI-PMH namespace, its children in the DataCite namespace
+            hal_resource = etree.SubElement(metadata, f'{{{OAI}}}resource', nsmap={'datacite': DATACITE})
+            hal_resource.extend(list(resource))
+            metadata.remove(resource)
+            # declares the namespace once on the resource instead of on each child
+            etree.cleanup_namespaces(record)
+        elif layout == 'onedata':
+            metadata.remove(resource)
+            wrapper = etree.SubElement(metadata, f'{{{ONEDATA}}}oai_datacite')
+            etree.SubElement(wrapper, f'{{{ONEDATA}}}payload').append(resource)
+
+        records.append(etree.tostring(record, encoding='unicode'))
+
+    return records
+
+
+def create_harvest_event(xml: str) -> HarvestEventQueue:
+    return HarvestEventQueue(id=str(uuid.uuid4()), xml=xml, repository_id=str(uuid.uuid4()), endpoint_id=str(uuid.uuid4()),
+                             record_identifier=str(uuid.uuid4()), code='bench', harvest_url='https://example.org/oai',
+                             additional_metadata=None, is_deleted=False, datestamp='2025-01-01T00:00:00Z')
+
+
+class StubEmbedding:
+    """
+    Stand-in for the embedding model returning random vectors.
+    """
+    def __init__(self, dims: int) -> None:
+        self.rng = np.random.default_rng(0)
+        self.dims = dims
+
+    def embed(self, texts: list[str], **kwargs: Any) -> Iterator[np.ndarray[Any, Any]]:
+        for _ in texts:
+            yield self.rng.random(self.dims, dtype=np.float32)
+
+
+class StubCopy:
+    def __init__(self, cursor: 'StubCursor') -> None:
+        self.cursor = cursor
+
+    def write_row(self, row: Iterable[Any]) -> None:
+        self.cursor.copied += 1
+
+
+class StubCursor:
+    """
+    Stand-in for a psycopg cursor: the statements are not executed,
+    the upsert reports all records copied to the staging table as created and lookups find nothing.
+    """
+    def __init__(self) -> None:
+        self.copied = 0
+        self.rows: list[dict[str, Any]] = []
+        self.rowcount = 0
+
+    @contextmanager
+    def copy(self, statement: str) -> Iterator[StubCopy]:
+        self.copied = 0
+        yield StubCopy(self)
+
+    def execute(self, query: str, params: Optional[Any] = None) -> 'StubCursor':
+        self.rows = [{'created': True}] * self.copied if 'RETURNING' in query else []
+        self.rowcount = 0
+        return self
+
+    def fetchall(self) -> list[dict[str, Any]]:
+        return self.rows
+
+
+class StubConnection:
+    def cursor(self) -> StubCursor:
+        return StubCursor()
+
+
+class StubPostgresConfig:
+    def get_pool_stats(self) -> dict[str, int]:
+        return {}
+
+
+def stub_bulk(body: str, **kwargs: Any) -> dict[str, Any]:
+    """
+    Stand-in for OpenSearch's bulk API reporting all actions as successful.
+    """
+    lines = iter(body.splitlines())
+    items = []
+    for line in lines:
+        op_type, meta = next(iter(orjson.loads(line).items()))
+        items.append({op_type: {'_id': meta.get('_id'), 'status': 200 if op_type == 'delete' else 201}})
+        if op_type != 'delete':
+            # source
+            next(lines)
+
+    return {'errors': False, 'items': items}
+
+
+class BenchmarkTask:
+    """
+    Provides the resources of `tasks.TransformTask` with stand-ins for OpenSearch, PostgreSQL and, optionally, the model.
+    """
+    def __init__(self, tasks: Any, embedding_transformer: Any) -> None:
+        # the request is serialized like by the workers, but not sent
+        self.client = OpenSearch(serializer=OrjsonSerializer())
+        self.client.bulk = stub_bulk
+        self.opensearch_config = tasks.get_opensearch_config()
+        self.validator = tasks.get_validator()
+        self.embedding_transformer = embedding_transformer
+        self.postgres_config = StubPostgresConfig()
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    Returns the percentile of the values (nearest rank).
+    """
+    ranked = sorted(values)
+    return ranked[max(0, int(np.ceil(p / 100 * len(ranked))) - 1)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Runs the transformation of a batch (tasks.process_batch) on synthetic records '
+                                                 'with stand-ins for OpenSearch and PostgreSQL and reports throughput '
+                                                 'and p50/p99 per stage')
+    parser.add_argument('-n', help='number of records', type=int, default=2000)
+    parser.add_argument('-b', help='batch size (CELERY_BATCH_SIZE)', type=int, default=125)
+    parser.add_argument('-l', help='layouts of the records', choices=LAYOUTS, nargs='+', default=LAYOUTS)
+    parser.add_argument('-p', help='XML parser (TRANSFORM_XML_PARSER)', choices=['xmltodict', 'lxml'], default='xmltodict')
+    parser.add_argument('-m', help='embedding model, random vectors if not given', type=str)
+    parser.add_argument('-d', help='dimensions of the random vectors', type=int, default=384)
+
+    args = parser.parse_args()
+
+    # read by the workers' modules when imported
+    os.environ['TRANSFORM_XML_PARSER'] = args.p
+    os.environ['EMBEDDING_MODEL'] = args.m if args.m else 'stub'
+    os.environ['EMBEDDING_CACHE'] = 'false'
+
+    # the workers read their config files relative to src
+    os.chdir(SRC)
+    tasks = importlib.import_module('tasks')
+    metrics_utils = importlib.import_module('utils.metrics_utils')
+    logging.disable(logging.INFO)
+
+    durations: dict[str, list[float]] = defaultdict(list)
+    metrics_utils.STAGE_LISTENERS.append(lambda stage, duration: durations[stage].append(duration))
+
+    model = tasks.get_embedding_transformer() if args.m else StubEmbedding(args.d)
+    task = BenchmarkTask(tasks, model)
+
+    events = [create_harvest_event(xml) for xml in create_records(args.n, args.l)]
+    batches = [events[i:i + args.b] for i in range(0, len(events), args.b)]
+
+    # warm-up, e.g., of the first inference
+    tasks.process_batch(task, StubConnection(), batches[0][:2], 'bench')
+    durations.clear()
+
+    started = time.perf_counter()
+    success = sum(tasks.process_batch(task, StubConnection(), batch, 'bench') for batch in batches)
+    duration = time.perf_counter() - started
+
+    print(f'{len(events)} records ({", ".join(args.l)}) in {len(batches)} batches, parser {args.p}, '
+          f'model {args.m if args.m else f"random vectors ({args.d} dimensions)"}')
+    print(f'{success} documents indexed in {duration:.2f}s ({len(events) / duration:.1f} records/s)')
+    print(f'{"stage":>16} {"total s":>9} {"share":>6} {"p50 ms":>9} {"p99 ms":>9}')
+
+    batch_total = sum(durations['batch'])
+    for stage, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        print(f'{stage:>16} {sum(values):>9.3f} {sum(values) / batch_total:>6.1%} '
+              f'{percentile(values, 50) * 1000:>9.2f} {percentile(values, 99) * 1000:>9.2f}')
@@ -4,6 +4,13 @@ from opensearchpy import OpenSearch
 import json
 from dotenv import load_dotenv
 import os
+import sys
+
+# setting path
+sys.path.append("..")
+sys.path.append("../..")
+
+from src.utils.opensearch_utils import get_versioned_index_name, create_index, swap_alias
 
 load_dotenv()
 
@@ -21,20 +28,21 @@ client = OpenSearch(
     use_ssl=False
 )
 
-try:
-    client.indices.delete(
-        index=INDEX_NAME
-    )
-    print(f'index {INDEX_NAME} deleted')
-except Exception as e:
-    print(e)
+# the index is versioned and searched by the alias INDEX_NAME, see README (Blue/green index builds)
+index_name = get_versioned_index_name(INDEX_NAME)
 
 try:
     with open('../../src/config/opensearch_mapping.json') as f:
         os_mapping = json.load(f)
-        # dynamically set embeddings dims
-        os_mapping['mappings']['properties']['emb']['dimension'] = embedding_dims
-        client.indices.create(index=INDEX_NAME, body=os_mapping)
-        print(f'index {INDEX_NAME} created')
+
+    create_index(client, index_name, os_mapping, int(embedding_dims))
+    print(f'index {index_name} created')
+
+    # replaces the indices behind the alias or an index named INDEX_NAME (created before aliases were used) atomically
+    old = swap_alias(client, INDEX_NAME, index_name, delete_old=True)
+    print(f'alias {INDEX_NAME} points to {index_name}')
+
+    for name in old:
+        print(f'index {name} deleted')
 except Exception as e:
     print(e)
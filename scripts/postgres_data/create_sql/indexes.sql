@@ -15,6 +15,7 @@ CREATE INDEX IF NOT EXISTS idx_endpoints_is_active ON endpoints(is_active) WHERE
 CREATE INDEX IF NOT EXISTS idx_harvest_events_repository_id ON harvest_events(repository_id);
 CREATE INDEX IF NOT EXISTS idx_harvest_events_endpoint_id ON harvest_events(endpoint_id);
 CREATE INDEX IF NOT EXISTS idx_harvest_events_record_identifier ON harvest_events(record_identifier);
+CREATE INDEX IF NOT EXISTS idx_harvest_events_harvest_run_id_id ON harvest_events(harvest_run_id, id);
 
 -- Records Indexes
 CREATE INDEX IF NOT EXISTS idx_records_endpoint_id ON records(endpoint_id);
@@ -27,8 +28,13 @@ CREATE INDEX IF NOT EXISTS idx_records_created_at ON records USING brin(created_
 CREATE INDEX IF NOT EXISTS idx_records_updated_at ON records USING brin(updated_at);
 CREATE INDEX IF NOT EXISTS idx_records_datacite_json ON records USING gin(datacite_json);
 CREATE INDEX IF NOT EXISTS idx_records_title_fulltext ON records USING gin(to_tsvector('english', title));
+CREATE INDEX IF NOT EXISTS idx_records_embedding_cache ON records(embedding_model, embedding_text_hash) WHERE embedding_text_hash IS NOT NULL;
 
 -- Harvest Runs Indexes
 CREATE INDEX IF NOT EXISTS idx_harvest_runs_endpoint_id ON harvest_runs(endpoint_id);
 CREATE INDEX IF NOT EXISTS idx_harvest_runs_started_at ON harvest_runs(started_at);
 CREATE INDEX IF NOT EXISTS idx_harvest_runs_status ON harvest_runs(status);
+
+-- Index Batches Indexes
+CREATE INDEX IF NOT EXISTS idx_index_batches_harvest_run_id ON index_batches(harvest_run_id);
+CREATE INDEX IF NOT EXISTS idx_index_batches_completed_at ON index_batches(completed_at) WHERE status = 'done';
@@ -75,6 +75,7 @@ CREATE TABLE IF NOT EXISTS harvest_runs (
     records_created INTEGER NOT NULL DEFAULT 0,
     records_updated INTEGER NOT NULL DEFAULT 0,
     records_deleted INTEGER NOT NULL DEFAULT 0,
+    records_unchanged INTEGER NOT NULL DEFAULT 0,
     from_date TIMESTAMP WITH TIME ZONE,
     until_date TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
     CONSTRAINT harvest_runs_pkey PRIMARY KEY (id),
@@ -88,6 +89,11 @@ WHERE status = 'open';
 
 COMMENT ON TABLE harvest_runs IS 'Track harvest execution history';
 COMMENT ON COLUMN harvest_runs.status IS 'running, completed, failed, partial';
+COMMENT ON COLUMN harvest_runs.records_harvested IS 'Number of harvest events, set when the harvest run is closed';
+COMMENT ON COLUMN harvest_runs.records_created IS 'Number of records created when indexing the harvest run';
+COMMENT ON COLUMN harvest_runs.records_updated IS 'Number of records updated when indexing the harvest run';
+COMMENT ON COLUMN harvest_runs.records_deleted IS 'Number of records deleted when indexing the harvest run';
+COMMENT ON COLUMN harvest_runs.records_unchanged IS 'Number of harvest events skipped when indexing the harvest run because their record is unchanged';
 COMMENT ON COLUMN harvest_runs.from_date IS 'Harvest from date parameter';
 COMMENT ON COLUMN harvest_runs.until_date IS 'Harvest until date parameter';
 
@@ -139,8 +145,10 @@ CREATE TABLE IF NOT EXISTS records (
     metadata_protocol harvest_protocol NOT NULL,
     datacite_json JSONB,
     additional_metadata TEXT,
-    embeddings FLOAT8[],
+    embeddings BYTEA,
     embedding_model VARCHAR(100),
+    embedding_text_hash CHAR(64),
+    content_hash CHAR(64),
     datestamp TIMESTAMP WITH TIME ZONE NOT NULL,
     version INTEGER NOT NULL DEFAULT 1,
     opensearch_synced BOOLEAN NOT NULL DEFAULT false,
@@ -169,13 +177,71 @@ COMMENT ON COLUMN records.metadata_format IS 'Format of the raw metadata';
 COMMENT ON COLUMN records.metadata_protocol IS 'Protocol used to harvest this record';
 COMMENT ON COLUMN records.datacite_json IS 'Processed DataCite JSON';
 COMMENT ON COLUMN records.additional_metadata IS 'Additional metadata from REST APIs, etc.';
-COMMENT ON COLUMN records.embeddings IS 'Vector embeddings array for storage (search happens in OpenSearch)';
+COMMENT ON COLUMN records.embeddings IS 'Vector embeddings as float32 in network byte order (search happens in OpenSearch)';
 COMMENT ON COLUMN records.embedding_model IS 'Model used for embeddings';
+COMMENT ON COLUMN records.embedding_text_hash IS 'SHA-256 of the embedded text, key of the embedding cache together with embedding_model';
+COMMENT ON COLUMN records.content_hash IS 'SHA-256 of the canonicalized metadata and the additional metadata, used to detect unchanged records';
 COMMENT ON COLUMN records.datestamp IS 'From OAI-PMH header';
 COMMENT ON COLUMN records.version IS 'Version number';
 COMMENT ON COLUMN records.opensearch_synced IS 'Whether synced to OpenSearch';
 COMMENT ON COLUMN records.opensearch_synced_at IS 'When last synced to OpenSearch';
 
+-- Index Batches Table
+CREATE TABLE IF NOT EXISTS index_batches (
+    id BIGSERIAL NOT NULL,
+    harvest_run_id UUID NOT NULL,
+    index_name VARCHAR(255) NOT NULL,
+    first_event_id UUID NOT NULL,
+    last_event_id UUID NOT NULL,
+    number_of_events INTEGER NOT NULL,
+    number_of_bytes BIGINT,
+    status VARCHAR(10) NOT NULL DEFAULT 'scheduled',
+    error TEXT,
+    scheduled_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP WITH TIME ZONE,
+    duration REAL,
+    CONSTRAINT index_batches_pkey PRIMARY KEY (id),
+    CONSTRAINT index_batches_status_check CHECK (status IN ('scheduled', 'done', 'failed')),
+    CONSTRAINT index_batches_harvest_run_id_fkey FOREIGN KEY (harvest_run_id)
+        REFERENCES harvest_runs(id) ON DELETE CASCADE
+);
+
+COMMENT ON TABLE index_batches IS 'Batches of the latest /index of a harvest run, to resume it and report its progress';
+COMMENT ON COLUMN index_batches.index_name IS 'OpenSearch index the batch is written to';
+COMMENT ON COLUMN index_batches.first_event_id IS 'First harvest event of the batch, in the order of harvest_events.id';
+COMMENT ON COLUMN index_batches.last_event_id IS 'Last harvest event of the batch, in the order of harvest_events.id';
+COMMENT ON COLUMN index_batches.number_of_events IS 'Number of harvest events in the batch';
+COMMENT ON COLUMN index_batches.number_of_bytes IS 'Size of the raw and additional metadata of the harvest events in bytes';
+COMMENT ON COLUMN index_batches.status IS 'scheduled, done (set in the transaction of the batch) or failed';
+COMMENT ON COLUMN index_batches.error IS 'Error of the failed batch';
+COMMENT ON COLUMN index_batches.scheduled_at IS 'When the batch was put in the Celery queue';
+COMMENT ON COLUMN index_batches.completed_at IS 'When the batch was done or failed';
+COMMENT ON COLUMN index_batches.duration IS 'Seconds the worker took to write the batch, used to tune CELERY_BATCH_BYTES';
+
+-- OpenSearch Outbox Table
+CREATE TABLE IF NOT EXISTS opensearch_outbox (
+    id BIGSERIAL NOT NULL,
+    index_name VARCHAR(255) NOT NULL,
+    op_type VARCHAR(10) NOT NULL,
+    document_id VARCHAR(2048) NOT NULL,
+    record_id VARCHAR(510),
+    harvest_event_id UUID NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT opensearch_outbox_pkey PRIMARY KEY (id),
+    CONSTRAINT opensearch_outbox_op_type_check CHECK (op_type IN ('index', 'delete'))
+);
+
+COMMENT ON TABLE opensearch_outbox IS 'Pending OpenSearch actions, written in the same transaction as records and sent by the drain_outbox task';
+COMMENT ON COLUMN opensearch_outbox.index_name IS 'OpenSearch index the action is sent to';
+COMMENT ON COLUMN opensearch_outbox.op_type IS 'Bulk action: index or delete';
+COMMENT ON COLUMN opensearch_outbox.document_id IS 'Id of the OpenSearch document';
+COMMENT ON COLUMN opensearch_outbox.record_id IS 'Record whose datacite_json and embeddings are indexed, NULL for delete';
+COMMENT ON COLUMN opensearch_outbox.harvest_event_id IS 'Harvest event the action results from, errors are written to it';
+COMMENT ON COLUMN opensearch_outbox.attempts IS 'Number of failed attempts';
+COMMENT ON COLUMN opensearch_outbox.last_error IS 'Error of the last failed attempt';
+
 
 
 
@@ -8,7 +8,7 @@ SELECT
     COUNT(*) as count
 FROM information_schema.tables
 WHERE table_schema = 'public'
-    AND table_name IN ('repositories', 'endpoints', 'harvest_events', 'records', 'harvest_runs');
+    AND table_name IN ('repositories', 'endpoints', 'harvest_events', 'records', 'harvest_runs', 'index_batches', 'opensearch_outbox');
 
 SELECT
     'Custom types created' as status,
@@ -1,5 +1,11 @@
 #!/usr/bin/env -S uv run --script
+import argparse
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
+from typing import Any
 from lxml import etree as ET
 import requests
 import traceback
@@ -19,8 +25,157 @@ TIMEOUT_FASTAPI = 30
 
 TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f%z'
 
+# print progress every n harvest events
+PROGRESS_INTERVAL = 1000
+# seconds to wait before the first retry, doubled for every further retry
+RETRY_BACKOFF = 0.5
 
-def import_data(repo_code: str, harvest_url: str, data_dir: Path, additional_dir: Optional[Path]) -> None:
+
+class AdditionalFileIndex:
+    """
+    Index of the files in a directory with additional metadata, built once per directory.
+    Looking up a file takes O(log n) instead of walking the whole directory for every harvest event.
+    """
+
+    names: list[str]
+    files: list[Path]
+
+    def __init__(self, additional_dir: Path) -> None:
+        entries = sorted((file.name, file) for file in additional_dir.rglob('*') if file.is_file())
+        self.names = [name for name, _ in entries]
+        self.files = [file for _, file in entries]
+
+    def find(self, prefix: str) -> Optional[Path]:
+        """
+        Returns the file whose name starts with the given prefix if it is unique.
+
+        :param prefix: prefix of the file name.
+        :return: the file or None if no or several files start with prefix.
+        """
+        start = bisect_left(self.names, prefix)
+        end = start
+        # names are sorted, so all names starting with prefix are adjacent
+        while end < len(self.names) and end - start < 2 and self.names[end].startswith(prefix):
+            end += 1
+
+        return self.files[start] if end - start == 1 else None
+
+
+class ImportProgress:
+    """Thread-safe counters for the harvest events of an import."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.imported = 0
+        self.failed = 0
+
+    def add(self, success: bool) -> None:
+        with self.lock:
+            if success:
+                self.imported += 1
+            else:
+                self.failed += 1
+
+            if (self.imported + self.failed) % PROGRESS_INTERVAL == 0:
+                print(self.summary())
+
+    def summary(self) -> str:
+        duration = time.perf_counter() - self.started
+        rate = (self.imported + self.failed) / duration if duration > 0 else 0.0
+        return f'{self.imported} harvest events imported, {self.failed} failed in {duration:.1f}s ({rate:.1f} events/s)'
+
+
+thread_local = threading.local()
+
+
+def get_session() -> requests.Session:
+    """Returns an HTTP session for the current thread so connections to the API are reused."""
+    if not hasattr(thread_local, 'session'):
+        thread_local.session = requests.Session()
+
+    session: requests.Session = thread_local.session
+    return session
+
+
+def create_payload(file: Path, repo_code: str, harvest_url: str, harvest_run_id: str,
+                   additional_index: Optional[AdditionalFileIndex]) -> dict[str, Any]:
+    with open(file) as f:
+        xml = f.read()
+
+    # https://stackoverflow.com/questions/15830421/xml-unicode-strings-with-encoding-declaration-are-not-supported
+    root = ET.fromstring(bytes(xml, encoding='utf-8'))
+    identifier = root.find('./oai:header/oai:identifier', namespaces=NS)
+
+    datestamp = root.find('./oai:header/oai:datestamp', namespaces=NS)
+
+    if identifier is None or datestamp is None:
+        raise ValueError(f'XML OAI-PMH record {file} without identifier or datestamp')
+
+    additional_metadata = None
+    if additional_index:
+        name_parts = os.path.basename(file).split('.oai')
+
+        additional_file = additional_index.find(name_parts[0])
+
+        if additional_file is not None:
+            with open(additional_file) as f2:
+                additional_metadata = f2.read()
+
+    return {
+        'record_identifier': identifier.text,
+        'datestamp': datestamp.text,
+        'raw_metadata': xml,
+        'additional_metadata': additional_metadata,
+        'harvest_url': harvest_url,
+        'repo_code': repo_code,
+        'harvest_run_id': harvest_run_id,
+        'is_deleted': False
+    }
+
+
+def post_harvest_event(payload: dict[str, Any], retries: int) -> None:
+    """
+    Registers a harvest event, retrying with exponential backoff on connection errors and server errors.
+
+    :param payload: the harvest event.
+    :param retries: number of retries.
+    """
+    for attempt in range(retries + 1):
+        try:
+            res = get_session().post(f'http://{FASTAPI_ADDRESS}:{FASTAPI_PORT}/harvest_event', json=payload,
+                                     timeout=TIMEOUT_FASTAPI)
+
+            # client errors like an already existing record identifier are not retried
+            if res.status_code < 500 and res.status_code != 429:
+                res.raise_for_status()
+                return
+
+            if attempt == retries:
+                res.raise_for_status()
+
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == retries:
+                raise e
+
+        time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+
+def import_file(file: Path, repo_code: str, harvest_url: str, harvest_run_id: str,
+                additional_index: Optional[AdditionalFileIndex], retries: int, progress: ImportProgress) -> None:
+    try:
+        payload = create_payload(file, repo_code, harvest_url, harvest_run_id, additional_index)
+        post_harvest_event(payload, retries)
+        progress.add(True)
+
+    except Exception as e:
+        print(f'An error occurred when creating harvest event for {file}: {e}', file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        progress.add(False)
+
+
+def import_data(repo_code: str, harvest_url: str, data_dir: Path, additional_dir: Optional[Path],
+                concurrency: int = 1, retries: int = 0) -> None:
     harvest_run_id = None
 
     try:
@@ -44,53 +199,24 @@ def import_data(repo_code: str, harvest_url: str, data_dir: Path, additional_dir
 
     started = datetime.now(timezone.utc)
 
-    files = data_dir.rglob("*.xml")
-    for file in files:
-        try:
-            with open(file) as f:
-                xml = f.read()
-
-            # https://stackoverflow.com/questions/15830421/xml-unicode-strings-with-encoding-declaration-are-not-supported
-            root = ET.fromstring(bytes(xml, encoding='utf-8'))
-            identifier = root.find('./oai:header/oai:identifier', namespaces=NS)
-
-            datestamp = root.find('./oai:header/oai:datestamp', namespaces=NS)
-
-            if identifier is None or datestamp is None:
-                raise ValueError(f'XML OAI-PMH record {file} without identifier or datestamp')
-
-            additional_metadata = None
-            if additional_dir:
-                name_parts = os.path.basename(file).split('.oai')
-
-                additional_file = list(additional_dir.rglob(f'{name_parts[0]}*'))
+    additional_index = AdditionalFileIndex(additional_dir) if additional_dir else None
+    progress = ImportProgress()
 
-                if len(additional_file) == 1:
-                    with open(additional_file[0]) as f2:
-                        additional_metadata = f2.read()
-
-
-            payload = {
-                'record_identifier': identifier.text,
-                'datestamp': datestamp.text,
-                'raw_metadata': xml,
-                'additional_metadata': additional_metadata,
-                'harvest_url': harvest_url,
-                'repo_code': repo_code,
-                'harvest_run_id': harvest_run_id,
-                'is_deleted': False
-            }
-
-            res = requests.post(f'http://{FASTAPI_ADDRESS}:{FASTAPI_PORT}/harvest_event', json=payload, timeout=TIMEOUT_FASTAPI)
+    files = data_dir.rglob("*.xml")
 
-            res.raise_for_status()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending: set[Future[None]] = set()
+        for file in files:
+            # bound the number of submitted files so that the directory is not read into memory at once
+            if len(pending) >= concurrency * 2:
+                _, pending = wait(pending, return_when=FIRST_COMPLETED)
 
-            print(identifier.text)
+            pending.add(executor.submit(import_file, file, repo_code, harvest_url, harvest_run_id, additional_index,
+                                        retries, progress))
 
-        except Exception as e:
-            print(f'An error occurred when creating harvest event: {e}', file=sys.stderr)
-            traceback.print_exc(file=sys.stderr)
+        wait(pending)
 
+    print(f'{harvest_url}: {progress.summary()}')
 
     completed = datetime.now(timezone.utc)
 
@@ -122,5 +248,16 @@ HARVEST_ENDPOINTS = [
 ]
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', help='number of harvest events sent concurrently', type=int, default=1)
+    parser.add_argument('-r', help='number of retries for a harvest event on connection or server errors', type=int,
+                        default=3)
+
+    args = parser.parse_args()
+
+    if args.c < 1 or args.r < 0:
+        parser.print_help()
+        exit(1)
+
     for repo, harvest_url_repo, path, add in HARVEST_ENDPOINTS:
-        import_data(repo, harvest_url_repo, path, add)
+        import_data(repo, harvest_url_repo, path, add, args.c, args.r)
@@ -0,0 +1,63 @@
+#!/usr/bin/env -S uv run --script
+import sys
+import os
+from dotenv import load_dotenv
+import psycopg
+import traceback
+
+load_dotenv()
+
+USER = os.environ.get('POSTGRES_ADMIN')
+PW = os.environ.get('POSTGRES_PASSWORD')
+DB = os.environ.get('POSTGRES_DB')
+ADDRESS = os.environ.get('POSTGRES_ADDRESS')
+PORT = os.environ.get('POSTGRES_PORT')
+
+if not USER or not PW:
+    raise ValueError('Missing POSTGRES_ADMIN or POSTGRES_PASSWORD in environment.')
+
+# migrations of an existing DB, given as arguments, e.g., embeddings_bytea.sql (see README)
+sql_files = sys.argv[1:]
+
+if len(sql_files) == 0:
+    raise ValueError(f'Usage: {sys.argv[0]} <file in migrate_sql> ...')
+
+
+def split_statements(sql: str) -> list[str]:
+    """
+    Splits a migration into its statements (at semicolons, comments are left out).
+
+    :param sql: the content of the migration.
+    :return: the statements.
+    """
+    statements = []
+    for statement in sql.split(';'):
+        code = '\n'.join(line for line in statement.splitlines() if not line.strip().startswith('--')).strip()
+        if code:
+            statements.append(code)
+
+    return statements
+
+
+try:
+    # each migration is applied in its own transaction, except for migrations building indices CONCURRENTLY,
+    # which cannot run in a transaction: their statements are run one by one
+    # https://www.postgresql.org/docs/current/sql-createindex.html#SQL-CREATEINDEX-CONCURRENTLY
+    with psycopg.connect(dbname=DB, user=USER, host=ADDRESS if ADDRESS else '127.0.0.1', password=PW,
+                         port=int(PORT) if PORT else 5432, autocommit=True) as conn:
+        cur = conn.cursor()
+        for sql_f in sql_files:
+            with open(f'migrate_sql/{sql_f}') as f:
+                sql_statements = f.read()
+
+            if 'CONCURRENTLY' in sql_statements:
+                for statement in split_statements(sql_statements):
+                    cur.execute(statement)
+            else:
+                with conn.transaction():
+                    cur.execute(sql_statements)
+            print(f'Executed {sql_f}')
+except Exception as e:
+    print(f'An error occurred when migrating DB: {e}', file=sys.stderr)
+    traceback.print_exc(file=sys.stderr)
+    sys.exit(1)
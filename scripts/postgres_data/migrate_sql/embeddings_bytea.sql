@@ -0,0 +1,13 @@
+-- Converts records.embeddings from FLOAT8[] to float32 in network byte order (BYTEA),
+-- see postgres_utils.embedding_to_bytes. float4send returns the network byte order.
+-- The table is rewritten, so run it while no transformation is running.
+
+CREATE FUNCTION pg_temp.float8_array_to_float4_bytea(a FLOAT8[]) RETURNS BYTEA
+LANGUAGE SQL IMMUTABLE STRICT AS $$
+    SELECT coalesce(string_agg(float4send(e::FLOAT4), ''::BYTEA ORDER BY i), ''::BYTEA)
+    FROM unnest(a) WITH ORDINALITY AS u(e, i)
+$$;
+
+ALTER TABLE records ALTER COLUMN embeddings TYPE BYTEA USING pg_temp.float8_array_to_float4_bytea(embeddings);
+
+COMMENT ON COLUMN records.embeddings IS 'Vector embeddings as float32 in network byte order (search happens in OpenSearch)';
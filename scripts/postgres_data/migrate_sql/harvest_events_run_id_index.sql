@@ -0,0 +1,5 @@
+-- Adds the index create_jobs_in_queue reads the harvest events of a harvest run with, in id order.
+-- It is built without locking harvest_events against writes, so it can run while harvesting.
+-- If the build fails, drop the invalid index with DROP INDEX CONCURRENTLY idx_harvest_events_harvest_run_id_id and run it again.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_harvest_events_harvest_run_id_id ON harvest_events(harvest_run_id, id);
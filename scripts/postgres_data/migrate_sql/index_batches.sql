@@ -0,0 +1,22 @@
+-- Adds the table index_batches for resuming /index and its progress, see create_sql/tables.sql for the column comments.
+
+CREATE TABLE IF NOT EXISTS index_batches (
+    id BIGSERIAL NOT NULL,
+    harvest_run_id UUID NOT NULL,
+    index_name VARCHAR(255) NOT NULL,
+    first_event_id UUID NOT NULL,
+    last_event_id UUID NOT NULL,
+    number_of_events INTEGER NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'scheduled',
+    error TEXT,
+    scheduled_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP WITH TIME ZONE,
+    CONSTRAINT index_batches_pkey PRIMARY KEY (id),
+    CONSTRAINT index_batches_status_check CHECK (status IN ('scheduled', 'done', 'failed')),
+    CONSTRAINT index_batches_harvest_run_id_fkey FOREIGN KEY (harvest_run_id)
+        REFERENCES harvest_runs(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_index_batches_harvest_run_id ON index_batches(harvest_run_id);
+
+COMMENT ON TABLE index_batches IS 'Batches of the latest /index of a harvest run, to resume it and report its progress';
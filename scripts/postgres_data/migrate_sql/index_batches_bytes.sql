@@ -0,0 +1,10 @@
+-- Adds the size and the duration of the batches of /index for CELERY_BATCH_BYTES and CELERY_BATCH_TARGET_SECONDS
+-- to table index_batches (see index_batches.sql), see create_sql/tables.sql for the column comments.
+
+ALTER TABLE index_batches ADD COLUMN IF NOT EXISTS number_of_bytes BIGINT;
+ALTER TABLE index_batches ADD COLUMN IF NOT EXISTS duration REAL;
+
+CREATE INDEX IF NOT EXISTS idx_index_batches_completed_at ON index_batches(completed_at) WHERE status = 'done';
+
+COMMENT ON COLUMN index_batches.number_of_bytes IS 'Size of the raw and additional metadata of the harvest events in bytes';
+COMMENT ON COLUMN index_batches.duration IS 'Seconds the worker took to write the batch, used to tune CELERY_BATCH_BYTES';
@@ -0,0 +1,17 @@
+-- Adds the table opensearch_outbox for OPENSEARCH_SYNC=outbox, see create_sql/tables.sql for the column comments.
+
+CREATE TABLE IF NOT EXISTS opensearch_outbox (
+    id BIGSERIAL NOT NULL,
+    index_name VARCHAR(255) NOT NULL,
+    op_type VARCHAR(10) NOT NULL,
+    document_id VARCHAR(2048) NOT NULL,
+    record_id VARCHAR(510),
+    harvest_event_id UUID NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT opensearch_outbox_pkey PRIMARY KEY (id),
+    CONSTRAINT opensearch_outbox_op_type_check CHECK (op_type IN ('index', 'delete'))
+);
+
+COMMENT ON TABLE opensearch_outbox IS 'Pending OpenSearch actions, written in the same transaction as records and sent by the drain_outbox task';
@@ -0,0 +1,8 @@
+-- Adds the content hash of the records for skip_unchanged and the number of unchanged records of a harvest run,
+-- see create_sql/tables.sql for the column comments.
+
+ALTER TABLE records ADD COLUMN IF NOT EXISTS content_hash CHAR(64);
+ALTER TABLE harvest_runs ADD COLUMN IF NOT EXISTS records_unchanged INTEGER NOT NULL DEFAULT 0;
+
+COMMENT ON COLUMN records.content_hash IS 'SHA-256 of the canonicalized metadata and the additional metadata, used to detect unchanged records';
+COMMENT ON COLUMN harvest_runs.records_unchanged IS 'Number of harvest events skipped when indexing the harvest run because their record is unchanged';
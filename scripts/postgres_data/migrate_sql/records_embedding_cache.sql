@@ -0,0 +1,9 @@
+-- Adds the key of the embedding cache (EMBEDDING_CACHE) to table records, see create_sql/tables.sql for the column comments.
+-- The index is built without locking records against writes.
+-- If the build fails, drop the invalid index with DROP INDEX CONCURRENTLY idx_records_embedding_cache and run it again.
+
+ALTER TABLE records ADD COLUMN IF NOT EXISTS embedding_text_hash CHAR(64);
+
+COMMENT ON COLUMN records.embedding_text_hash IS 'SHA-256 of the embedded text, key of the embedding cache together with embedding_model';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_records_embedding_cache ON records(embedding_model, embedding_text_hash) WHERE embedding_text_hash IS NOT NULL;
@@ -0,0 +1,34 @@
+from celery import Celery
+
+# The Celery app without the tasks, which are defined in tasks.py.
+# The API sends tasks by name so that it does not have to import the tasks and their dependencies
+# (embedding model, OpenSearch client etc.), the workers import tasks.py (celery -A tasks worker).
+
+# queues of the pipeline stages, see README
+EMBEDDING_QUEUE = 'embeddings'
+SINK_QUEUE = 'sink'
+# queue of the drainer of the OpenSearch outbox (OPENSEARCH_SYNC=outbox)
+OUTBOX_QUEUE = 'outbox'
+
+# task names
+TRANSFORM_BATCH = 'tasks.transform_batch'
+TRANSFORM_BATCH_BY_IDS = 'tasks.transform_batch_by_ids'
+NORMALIZE_BATCH = 'tasks.normalize_batch'
+NORMALIZE_BATCH_BY_IDS = 'tasks.normalize_batch_by_ids'
+EMBED_BATCH = 'tasks.embed_batch'
+WRITE_BATCH = 'tasks.write_batch'
+REINDEX_RECORDS = 'tasks.reindex_records'
+FINALIZE_INDEX_BUILD = 'tasks.finalize_index_build'
+DRAIN_OUTBOX = 'tasks.drain_outbox'
+
+celery_app = Celery('tasks')
+
+# https://docs.celeryq.dev/en/stable/userguide/routing.html
+celery_app.conf.task_routes = {
+    EMBED_BATCH: {'queue': EMBEDDING_QUEUE},
+    WRITE_BATCH: {'queue': SINK_QUEUE},
+    DRAIN_OUTBOX: {'queue': OUTBOX_QUEUE}
+}
+
+# celery_app.task_serializer = 'json'
+# celery_app.ignore_result = False
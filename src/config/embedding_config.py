@@ -0,0 +1,68 @@
+import os
+from typing import Any, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from fastembed import TextEmbedding
+
+class EmbeddingConfig:
+
+    model_name: str
+    batch_size: int
+    parallel: Optional[int]
+    threads: Optional[int]
+    providers: Optional[list[str]]
+    cache_dir: Optional[str]
+    local_files_only: bool
+
+    def __init__(self) -> None:
+        model_name = os.environ.get('EMBEDDING_MODEL')
+        batch_size = os.environ.get('EMBEDDING_BATCH_SIZE')
+        parallel = os.environ.get('EMBEDDING_PARALLEL')
+        threads = os.environ.get('EMBEDDING_THREADS')
+        providers = os.environ.get('EMBEDDING_PROVIDERS')
+        cache_dir = os.environ.get('EMBEDDING_CACHE_DIR')
+        local_files_only = os.environ.get('EMBEDDING_LOCAL_FILES_ONLY')
+
+        if not model_name:
+            raise ValueError('Missing EMBEDDING_MODEL in environment (docker-compose.yml).')
+
+        self.model_name = model_name
+        # number of texts the model processes at once
+        self.batch_size = int(batch_size) if batch_size else 256
+        # number of data-parallel subprocesses, 0 uses all cores, None embeds in the worker process
+        self.parallel = int(parallel) if parallel else None
+        # number of threads of the ONNX runtime, None uses the runtime's default
+        self.threads = int(threads) if threads else None
+        # ONNX execution providers, e.g., "CUDAExecutionProvider,CPUExecutionProvider"
+        self.providers = [provider.strip() for provider in providers.split(',')] if providers else None
+        self.cache_dir = cache_dir if cache_dir else None
+        # if true, the model is only loaded from cache_dir (pre-downloaded) without contacting the model hub
+        self.local_files_only = local_files_only is not None and local_files_only.lower() == 'true'
+
+        if self.batch_size < 1:
+            raise ValueError('EMBEDDING_BATCH_SIZE must be greater than 0.')
+
+    def create_model(self) -> 'TextEmbedding':
+        """
+        Creates the embedding model with the configured runtime settings.
+        See https://qdrant.github.io/fastembed/examples/FastEmbed_Multi_GPU/ for the settings.
+        """
+        # imported here since it takes a while and is only needed by the workers that embed
+        from fastembed import TextEmbedding
+
+        return TextEmbedding(model_name=self.model_name, cache_dir=self.cache_dir, threads=self.threads,
+                             providers=self.providers, local_files_only=self.local_files_only)
+
+    def get_embedding_dims(self) -> int:
+        """Returns the dimension of the model's embeddings without loading the model."""
+        from fastembed import TextEmbedding
+
+        return TextEmbedding.get_embedding_size(self.model_name)
+
+    @property
+    def embed_params(self) -> dict[str, Any]:
+        """Parameters for TextEmbedding.embed."""
+        return {
+            'batch_size': self.batch_size,
+            'parallel': self.parallel
+        }
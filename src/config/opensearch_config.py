@@ -1,13 +1,65 @@
 import os
+from typing import Any
 
 class OpenSearchConfig:
 
     host: str
     port: int
+    bulk_chunk_size: int
+    bulk_max_chunk_bytes: int
+    bulk_threads: int
+    bulk_max_retries: int
+    bulk_initial_backoff: float
+    bulk_max_backoff: float
+    reindex_threads: int
+    sync_mode: str
+    outbox_chunk_size: int
+    outbox_max_attempts: int
 
     def __init__(self) -> None:
         address = os.environ.get('OPENSEARCH_ADDRESS')
         port = os.environ.get('OPENSEARCH_PORT')
+        bulk_chunk_size = os.environ.get('OPENSEARCH_BULK_CHUNK_SIZE')
+        bulk_max_chunk_bytes = os.environ.get('OPENSEARCH_BULK_MAX_CHUNK_BYTES')
+        bulk_threads = os.environ.get('OPENSEARCH_BULK_THREADS')
+        bulk_max_retries = os.environ.get('OPENSEARCH_BULK_MAX_RETRIES')
+        bulk_initial_backoff = os.environ.get('OPENSEARCH_BULK_INITIAL_BACKOFF')
+        bulk_max_backoff = os.environ.get('OPENSEARCH_BULK_MAX_BACKOFF')
+        reindex_threads = os.environ.get('OPENSEARCH_REINDEX_THREADS')
+        sync_mode = os.environ.get('OPENSEARCH_SYNC')
+        outbox_chunk_size = os.environ.get('OPENSEARCH_OUTBOX_CHUNK_SIZE')
+        outbox_max_attempts = os.environ.get('OPENSEARCH_OUTBOX_MAX_ATTEMPTS')
 
         self.host = address if address else 'opensearch'
         self.port = int(port) if port else 9200
+        # maximum number of documents and bytes per bulk request
+        self.bulk_chunk_size = int(bulk_chunk_size) if bulk_chunk_size else 500
+        self.bulk_max_chunk_bytes = int(bulk_max_chunk_bytes) if bulk_max_chunk_bytes else 10 * 1024 * 1024
+        # number of bulk requests sent in parallel
+        self.bulk_threads = int(bulk_threads) if bulk_threads else 1
+        # retries of documents rejected with 429 or 503, with exponential backoff (in seconds)
+        self.bulk_max_retries = int(bulk_max_retries) if bulk_max_retries else 5
+        self.bulk_initial_backoff = float(bulk_initial_backoff) if bulk_initial_backoff else 2
+        self.bulk_max_backoff = float(bulk_max_backoff) if bulk_max_backoff else 60
+        # number of bulk requests sent in parallel when rebuilding an index from the records table
+        self.reindex_threads = int(reindex_threads) if reindex_threads else 4
+        # "direct": the batches write to OpenSearch themselves,
+        # "outbox": the batches add their actions to table opensearch_outbox, which the task drain_outbox sends to OpenSearch
+        self.sync_mode = sync_mode.lower() if sync_mode else 'direct'
+        if self.sync_mode not in ('direct', 'outbox'):
+            raise ValueError(f'Invalid OPENSEARCH_SYNC {sync_mode}, must be "direct" or "outbox"')
+        # number of outbox entries sent per transaction and attempts after which a failing entry is left for inspection
+        self.outbox_chunk_size = int(outbox_chunk_size) if outbox_chunk_size else 5000
+        self.outbox_max_attempts = int(outbox_max_attempts) if outbox_max_attempts else 5
+
+    @property
+    def bulk_params(self) -> dict[str, Any]:
+        """Parameters for opensearch_utils.bulk_write."""
+        return {
+            'chunk_size': self.bulk_chunk_size,
+            'max_chunk_bytes': self.bulk_max_chunk_bytes,
+            'thread_count': self.bulk_threads,
+            'max_retries': self.bulk_max_retries,
+            'initial_backoff': self.bulk_initial_backoff,
+            'max_backoff': self.bulk_max_backoff
+        }
@@ -1,5 +1,7 @@
 import os
-from typing import Any
+from typing import Any, Optional
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
 
 class PostgresConfig:
 
@@ -8,6 +10,11 @@ class PostgresConfig:
     password: str
     address: str
     port: int
+    pool_min_size: int
+    pool_max_size: int
+    pool_timeout: float
+
+    _pool: Optional[ConnectionPool[Any]] = None
 
     def __init__(self) -> None:
         user = os.environ.get('POSTGRES_USER')
@@ -15,6 +22,9 @@ class PostgresConfig:
         password = os.environ.get('POSTGRES_PASSWORD')
         address = os.environ.get('POSTGRES_ADDRESS')
         port = os.environ.get('POSTGRES_PORT')
+        pool_min_size = os.environ.get('POSTGRES_POOL_MIN_SIZE')
+        pool_max_size = os.environ.get('POSTGRES_POOL_MAX_SIZE')
+        pool_timeout = os.environ.get('POSTGRES_POOL_TIMEOUT')
 
         if user and password and db:
             self.user = user
@@ -25,6 +35,13 @@ class PostgresConfig:
         else:
             raise ValueError('Missing POSTGRES_USER or POSTGRES_PASSWORD or POSTGRES_DB in environment (docker-compose.yml).')
 
+        self.pool_min_size = int(pool_min_size) if pool_min_size else 1
+        self.pool_max_size = int(pool_max_size) if pool_max_size else 10
+        self.pool_timeout = float(pool_timeout) if pool_timeout else 30.0
+
+        if self.pool_min_size > self.pool_max_size:
+            raise ValueError('POSTGRES_POOL_MIN_SIZE must not be greater than POSTGRES_POOL_MAX_SIZE.')
+
     @property
     def connection_params(self) -> dict[str, Any]:
         """Connection parameters for psycopg."""
@@ -35,3 +52,38 @@ class PostgresConfig:
             'password': self.password,
             'port': self.port
         }
+
+    def get_pool(self) -> ConnectionPool[Any]:
+        """
+        Returns the connection pool for this config, creating and opening it on first use.
+        Connections return rows as dicts.
+
+        The pool is created lazily so that forked worker processes do not share the pool's connections and threads.
+        See https://www.psycopg.org/psycopg3/docs/advanced/pool.html
+        """
+        if self._pool is None:
+            self._pool = ConnectionPool(
+                kwargs={**self.connection_params, 'row_factory': dict_row},
+                min_size=self.pool_min_size,
+                max_size=self.pool_max_size,
+                timeout=self.pool_timeout,
+                # health check: a connection is verified before it is handed out
+                check=ConnectionPool.check_connection,
+                open=True
+            )
+
+        return self._pool
+
+    def close_pool(self) -> None:
+        """Closes the connection pool if it was opened."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def get_pool_stats(self) -> Optional[dict[str, int]]:
+        """Returns the statistics of the connection pool or None if it was not opened yet."""
+        if self._pool is None:
+            return None
+
+        # https://www.psycopg.org/psycopg3/docs/advanced/pool.html#pool-stats
+        return self._pool.get_stats()
@@ -1,26 +1,50 @@
+import time
+
+# start of the worker's startup, see warm_up
+STARTUP_STARTED = time.perf_counter()
+
+import functools
 import json
 import os
+from collections.abc import Iterator
 from pathlib import Path
 from config.logging_config import LOGGING_CONFIG
 from logging.config import dictConfig
-from fastembed import TextEmbedding
-from celery import Celery, Task
-from jsonschema.validators import validate
+from celery import Task
+from celery.concurrency.thread import TaskPool as ThreadTaskPool
+from celery_batches import Batches, SimpleRequest  # type: ignore
 from opensearchpy import OpenSearch
-from opensearchpy.helpers import bulk, BulkIndexError
 import xmltodict
 from config.postgres_config import PostgresConfig
 from config.opensearch_config import OpenSearchConfig
-from utils.queue_utils import HarvestEventQueue
-from utils.embedding_utils import preprocess_batch, add_embeddings_to_source, SourceWithEmbeddingText, \
+from config.embedding_config import EmbeddingConfig
+from celery_app import celery_app, TRANSFORM_BATCH, TRANSFORM_BATCH_BY_IDS, NORMALIZE_BATCH, NORMALIZE_BATCH_BY_IDS, \
+    EMBED_BATCH, WRITE_BATCH, REINDEX_RECORDS, FINALIZE_INDEX_BUILD, DRAIN_OUTBOX
+from utils.queue_utils import HarvestEventQueue, HARVEST_EVENTS_SELECT, harvest_event_from_row
+from utils.embedding_utils import add_embeddings_to_source, SourceWithEmbeddingText, \
     get_embedding_text_from_fields, OpenSearchSourceWithEmbedding
+from utils.postgres_utils import RecordRow, UpsertResult, RecordToDelete, OutboxEntry, upsert_records, get_cached_embeddings, \
+    get_content_hashes, get_records_to_delete, delete_records, set_harvest_event_errors, add_harvest_run_counts, \
+    embedding_to_bytes, embedding_from_bytes, enqueue_index_actions, enqueue_delete_actions, lock_outbox_entries, \
+    complete_outbox_entries, fail_outbox_entries, complete_index_batch, fail_index_batch
+from utils.json_utils import OrjsonSerializer, dumps_document
+from utils.metrics_utils import measure_stage, observe_stage, start_metrics_server, BATCH_SIZE, RECORDS, ERRORS, DELETES
+from utils.opensearch_utils import BulkResult, BulkError, bulk_write, get_versioned_index_name, create_index, publish_index
 from utils import normalize_datacite_json
-from typing import Any
+from utils.normalize_datacite_xml import parse_record, get_content_hash
+from utils.validation_utils import RecordValidator
+from typing import Any, NamedTuple, Optional, TYPE_CHECKING
 from celery.utils.log import get_task_logger
-from celery.signals import after_setup_logger
+from celery.signals import after_setup_logger, worker_process_init, worker_ready
 import datetime
+import numpy as np
 import psycopg
-from psycopg.rows import dict_row
+
+if TYPE_CHECKING:
+    # fastembed (and onnxruntime) is only imported when the model is loaded, see EmbeddingConfig
+    from fastembed import TextEmbedding
+
+IMPORT_DURATION = time.perf_counter() - STARTUP_STARTED
 
 @after_setup_logger.connect()  # type: ignore
 def configurate_celery_task_logger(**kwargs: Any) -> None:
@@ -43,248 +67,896 @@ EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL')
 if not EMBEDDING_MODEL:
     raise ValueError('Missing EMBEDDING_MODEL environment variable')
 
-celery_app = Celery('tasks')
+# 'lxml': extract the DataCite resource with precompiled XPath expressions, only converting the fields needed for normalization
+# 'xmltodict': convert the whole OAI-PMH record
+XML_PARSER = (os.environ.get('TRANSFORM_XML_PARSER') or 'xmltodict').lower()
+if XML_PARSER not in ['lxml', 'xmltodict']:
+    raise ValueError(f'Invalid TRANSFORM_XML_PARSER {XML_PARSER}, must be lxml or xmltodict')
+
+# if true, all validation errors of a record are written to harvest_events.error_message as a JSON list
+VALIDATION_COLLECT_ALL_ERRORS = os.environ.get('VALIDATION_COLLECT_ALL_ERRORS', 'false').lower() == 'true'
+
+# if true, the embedding model is loaded and warmed up when a worker process starts instead of on its first task
+EMBEDDING_WARM_UP = os.environ.get('EMBEDDING_WARM_UP', 'true').lower() != 'false'
+
+# if true, embeddings stored in table records for the same model and embedding text are reused instead of recalculated
+EMBEDDING_CACHE = os.environ.get('EMBEDDING_CACHE', 'true').lower() != 'false'
+
+# the embedding stage embeds the records of this many normalize_batch tasks together, or of all received within the interval (in seconds)
+EMBEDDING_FLUSH_EVERY = int(os.environ.get('EMBEDDING_FLUSH_EVERY') or 8)
+EMBEDDING_FLUSH_INTERVAL = float(os.environ.get('EMBEDDING_FLUSH_INTERVAL') or 5)
+
+# number of records fetched at once when reindexing from the records table
+REINDEX_FETCH_SIZE = 1000
+
+# port the worker serves its Prometheus metrics on, 0 to disable
+WORKER_METRICS_PORT = int(os.environ.get('WORKER_METRICS_PORT') or 9100)
+
+# The resources are created on first use and shared by all tasks of a worker process,
+# so that a worker only loads what the tasks of its queues need (e.g., a sink worker does not load the embedding model).
+
+@functools.cache
+def get_embedding_config() -> EmbeddingConfig:
+    return EmbeddingConfig()
+
+
+@functools.cache
+def get_embedding_transformer() -> 'TextEmbedding':
+    embedding_config = get_embedding_config()
+    logger.info(f'Setting up embedding transformer with model {embedding_config.model_name} '
+                f'(threads: {embedding_config.threads}, providers: {embedding_config.providers}, '
+                f'batch size: {embedding_config.batch_size}, parallel: {embedding_config.parallel})')
+    return embedding_config.create_model()
+
+
+@functools.cache
+def get_opensearch_config() -> OpenSearchConfig:
+    return OpenSearchConfig()
+
+
+@functools.cache
+def get_opensearch_client() -> OpenSearch:
+    opensearch_config = get_opensearch_config()
+    return OpenSearch(
+        hosts=[{'host': opensearch_config.host, 'port': opensearch_config.port}],
+        http_auth=None,
+        use_ssl=False,
+        logger=logger,
+        serializer=OrjsonSerializer()
+    )
+
+
+@functools.cache
+def get_postgres_config() -> PostgresConfig:
+    return PostgresConfig()
+
+
+@functools.cache
+def get_opensearch_mapping() -> dict[str, Any]:
+    with open('config/opensearch_mapping.json') as f:
+        mapping: dict[str, Any] = json.load(f)
+        return mapping
+
+
+@functools.cache
+def get_validator() -> RecordValidator:
+    with open('config/schema.json') as f:
+        schema = json.load(f)
+
+    # compiled once per worker instead of once per record
+    return RecordValidator(schema, collect_all_errors=VALIDATION_COLLECT_ALL_ERRORS)
+
+
+def warm_up() -> None:
+    """
+    Loads the embedding model (if EMBEDDING_WARM_UP is set) and the validator,
+    so that the first task of a worker process does not wait for them, and logs the startup time.
+    """
+    started = time.perf_counter()
+
+    if EMBEDDING_WARM_UP:
+        # the first inference initializes the ONNX runtime session
+        list(get_embedding_transformer().embed(['warm-up']))
+    get_validator()
 
+    warm_up_duration = time.perf_counter() - started
+    logger.info(f'Worker process ready {time.perf_counter() - STARTUP_STARTED:.2f}s after startup '
+                f'(imports: {IMPORT_DURATION:.2f}s, warm-up: {warm_up_duration:.2f}s)')
+
+
+@worker_process_init.connect()  # type: ignore
+def warm_up_worker_process(**kwargs: Any) -> None:
+    # sent by the prefork and solo pools in the processes that execute the tasks
+    warm_up()
+
+
+@worker_ready.connect()  # type: ignore
+def warm_up_thread_pool(sender: Any, **kwargs: Any) -> None:
+    # the threads pool does not send worker_process_init, its tasks run in the worker's process
+    if isinstance(sender.pool, ThreadTaskPool):
+        warm_up()
+
+
+@worker_ready.connect()  # type: ignore
+def serve_metrics(**kwargs: Any) -> None:
+    # served by the worker's main process, see metrics_utils.start_metrics_server for the prefork pool
+    if WORKER_METRICS_PORT > 0:
+        start_metrics_server(WORKER_METRICS_PORT)
 
-# celery_app.task_serializer = 'json'
-# celery_app.ignore_result = False
 
 class TransformTask(Task):  # type: ignore
 
-    embedding_transformer: TextEmbedding
-    client: OpenSearch
-    schema: dict[Any, Any]
-    postgres_config: PostgresConfig
+    @property
+    def embedding_config(self) -> EmbeddingConfig:
+        return get_embedding_config()
 
-    def __init__(self) -> None:
-        if EMBEDDING_MODEL:
-            self.embedding_transformer = TextEmbedding(model_name=EMBEDDING_MODEL)
-            logger.info(f'Setting up embedding transformer with model {EMBEDDING_MODEL}')
+    @property
+    def embedding_transformer(self) -> 'TextEmbedding':
+        return get_embedding_transformer()
 
-        opensearch_config = OpenSearchConfig()
-        self.client = OpenSearch(
-            hosts=[{'host': opensearch_config.host, 'port': opensearch_config.port}],
-            http_auth=None,
-            use_ssl=False,
-            logger=logger
-        )
+    @property
+    def opensearch_config(self) -> OpenSearchConfig:
+        return get_opensearch_config()
 
-        self.postgres_config = PostgresConfig()
+    @property
+    def client(self) -> OpenSearch:
+        return get_opensearch_client()
 
-        with open('config/schema.json') as f:
-            self.schema = json.load(f)
+    @property
+    def validator(self) -> RecordValidator:
+        return get_validator()
 
+    @property
+    def postgres_config(self) -> PostgresConfig:
+        return get_postgres_config()
 
-@celery_app.task(base=TransformTask, bind=True, ignore_result=True)
-def transform_batch(self: Any, batch: list[HarvestEventQueue], index_name: str) -> Any:
-    if not self.client.indices.exists(index=index_name):
-        raise ValueError(f'Index {index_name} does not exist in OpenSearch')
 
-    # transform to JSON and normalize
+class NormalizedBatch(NamedTuple):
+    records: list[SourceWithEmbeddingText] # records to be embedded and written
+    deleted: list[HarvestEventQueue] # harvest events of deleted records
+    unchanged: int # number of harvest events skipped because their record is unchanged
+
 
+@celery_app.task(name=TRANSFORM_BATCH, base=TransformTask, bind=True, ignore_result=True)
+def transform_batch(self: Any, batch: list[HarvestEventQueue], index_name: str, harvest_run_id: Optional[str] = None,
+                    skip_unchanged: bool = False, new_index: bool = False, batch_id: Optional[int] = None) -> Any:
     # Error handling: if an error is thrown, psycopg will roll back the whole transaction and the whole batch fails because the exception is re-raised,
     # making sure that only the whole batch is synced with PostgreSQL. See https://www.psycopg.org/psycopg3/docs/basic/transactions.html:
     # "Thankfully, if you use the connection context, Psycopg will commit the connection at the end of the block
     # (or roll it back if the block is exited with an exception)"
+    # The same applies to connections obtained from the pool, see https://www.psycopg.org/psycopg3/docs/advanced/pool.html
     # However, this is not true for OpenSearch since we use a different client to write or delete data in OpenSearch and this actions will take immediate effect.
-    with psycopg.connect(**self.postgres_config.connection_params, row_factory=dict_row) as conn:
+    # The batch's entry in index_batches (batch_id, see transform.create_jobs_in_queue) is marked as done in the same transaction.
+    started = time.perf_counter()
+    try:
+        check_index(self, index_name, new_index)
+
+        with self.postgres_config.get_pool().connection() as conn:
+            # reconstruct HarvestEvent from serialized list
+            success = process_batch(self, conn, [HarvestEventQueue(*ele) for ele in batch], index_name, harvest_run_id,
+                                    skip_unchanged)
+
+            if batch_id is not None:
+                # the duration is used by /index to tune the size of the batches, see transform.BatchBudget
+                complete_index_batch(conn.cursor(), batch_id, time.perf_counter() - started)
+    except Exception as e:
+        record_batch_failure(self, batch_id, e)
+        raise e
+
+    # the outbox entries of the batch are committed now
+    schedule_outbox_drain(self)
 
-        cur = conn.cursor()
+    return success
+
+
+@celery_app.task(name=TRANSFORM_BATCH_BY_IDS, base=TransformTask, bind=True, ignore_result=True)
+def transform_batch_by_ids(self: Any, event_ids: list[str], index_name: str, harvest_run_id: Optional[str] = None,
+                           skip_unchanged: bool = False, new_index: bool = False, batch_id: Optional[int] = None) -> Any:
+    # see transform_batch for error handling
+    started = time.perf_counter()
+    try:
+        check_index(self, index_name, new_index)
+
+        with self.postgres_config.get_pool().connection() as conn:
+            with measure_stage('fetch'):
+                batch = fetch_harvest_events(conn.cursor(), event_ids)
+            success = process_batch(self, conn, batch, index_name, harvest_run_id, skip_unchanged)
+
+            if batch_id is not None:
+                complete_index_batch(conn.cursor(), batch_id, time.perf_counter() - started)
+    except Exception as e:
+        record_batch_failure(self, batch_id, e)
+        raise e
+
+    schedule_outbox_drain(self)
+
+    return success
+
+
+def record_batch_failure(task: TransformTask, batch_id: Optional[int], error: Exception) -> None:
+    """
+    Marks a batch of /index as failed after its transaction was rolled back, so that /index?resume=true schedules it again.
+
+    :param task: the task providing the PostgreSQL config.
+    :param batch_id: id of the batch in table index_batches, None if the batch is not tracked.
+    :param error: the error the batch failed with.
+    """
+    if batch_id is None:
+        return
+
+    try:
+        with task.postgres_config.get_pool().connection() as conn:
+            fail_index_batch(conn.cursor(), batch_id, str(error))
+    except Exception as e:
+        # the batch stays scheduled and is resumed as well
+        logger.error(f'Batch {batch_id} could not be marked as failed: {e}')
+
+
+@celery_app.task(name=NORMALIZE_BATCH, base=TransformTask, bind=True, ignore_result=True)
+def normalize_batch(self: Any, batch: list[HarvestEventQueue], index_name: str, harvest_run_id: Optional[str] = None,
+                    skip_unchanged: bool = False) -> Any:
+    """
+    First stage of the pipeline: parses, normalizes and validates a batch of harvest events
+    and passes the records on to the embedding stage and the deleted records to the sink.
+    """
+    if not self.client.indices.exists(index=index_name):
+        raise ValueError(f'Index {index_name} does not exist in OpenSearch')
+
+    with self.postgres_config.get_pool().connection() as conn:
+        # reconstruct HarvestEvent from serialized list
+        return normalize_and_forward(self, conn, [HarvestEventQueue(*ele) for ele in batch], index_name,
+                                     harvest_run_id, skip_unchanged)
+
+
+@celery_app.task(name=NORMALIZE_BATCH_BY_IDS, base=TransformTask, bind=True, ignore_result=True)
+def normalize_batch_by_ids(self: Any, event_ids: list[str], index_name: str, harvest_run_id: Optional[str] = None,
+                           skip_unchanged: bool = False) -> Any:
+    """Same as normalize_batch, but fetches the harvest events from PostgreSQL."""
+    if not self.client.indices.exists(index=index_name):
+        raise ValueError(f'Index {index_name} does not exist in OpenSearch')
 
-        normalized: list[SourceWithEmbeddingText] = []
-        for ele in batch:
-
-            harvest_event = HarvestEventQueue(*ele) # reconstruct HarvestEvent from serialized list
-
-            if harvest_event.is_deleted:
-                # find record in DB
-                cur.execute("""
-                SELECT id, doi, url FROM records
-                WHERE endpoint_id = %s and record_identifier = %s
-                """, (harvest_event.endpoint_id, harvest_event.record_identifier))
-
-                record_to_delete = cur.fetchone()
-
-                if record_to_delete is not None:
-
-                    id = record_to_delete['id']
-                    doi = record_to_delete.get('doi')
-
-                    opensearch_id = doi if doi is not None else record_to_delete['url']
-
-                    try:
-                        # delete document from OpenSearch
-                        self.client.delete(
-                            index=index_name,
-                            id=opensearch_id,
-                            ignore=404 # https://github.com/opensearch-project/opensearch-py/blob/4ef46e5c17234e3e9b09338c98a599e18d42f572/guides/document_lifecycle.md
-                        )
-                    except Exception as e:
-                        logger.warning(f"Failed to delete {opensearch_id} from OpenSearch: {e}")
-                        raise e
-
-                    # delete record in DB
-                    cur.execute("""
-                    DELETE FROM records WHERE id = %s;
-                    """, [id])
-
-
-                continue
-
-            logger.debug(f'Processing {harvest_event}')
-            converted = xmltodict.parse(harvest_event.xml, process_namespaces=True)  # named tuple serialized as list in broker
-
-            if OAI_RECORD in converted and OAI_METADATA in converted[OAI_RECORD]:
-                rec_id = converted[OAI_RECORD][f'{OAI}:header'][
-                    f'{OAI}:identifier']
-
-                logger.debug(f'{rec_id}')
-
-                metadata = converted[OAI_RECORD][OAI_METADATA]
-            else:
-                # Converted JSON cannot be processed, log this
-                logger.debug(f'Cannot access {OAI_METADATA} in : {converted}')
-                continue
-
-            if DATACITE_RESOURCE in metadata:
-                resource = metadata[DATACITE_RESOURCE]
-            elif HAL_RESOURCE in metadata:
-                # HAL
-                resource = metadata[HAL_RESOURCE]
-            elif ONEDATA_WRAPPER in metadata and ONEDATA_PAYLOAD in metadata[ONEDATA_WRAPPER] and DATACITE_RESOURCE in metadata[ONEDATA_WRAPPER][ONEDATA_PAYLOAD]:
-                # extra layer structure from Onedata
-                resource = metadata[ONEDATA_WRAPPER][ONEDATA_PAYLOAD][DATACITE_RESOURCE]
-            else:
-                # JSON cannot be processed, log this
-                logger.debug(f'Cannot access resource element {DATACITE_RESOURCE} or {HAL_RESOURCE} or {ONEDATA_WRAPPER}{ONEDATA_PAYLOAD} in : {metadata}')
-                continue
-
-            # Catch and log errors
-            try:
-                normalized_record = normalize_datacite_json.normalize_datacite_json(resource)
-                validate(instance=normalized_record, schema=self.schema)
-                normalized.append(SourceWithEmbeddingText(src=normalized_record,
-                                                          textToEmbed=get_embedding_text_from_fields(normalized_record),
-                                                          event=harvest_event
-                                                          ))
-
-            except Exception as e:
-                logger.info(f'An error occurred for {rec_id} in harvest_event {harvest_event.id} during transformation or validation: {e}')
-
-                cur.execute(
-                    """
-                    UPDATE harvest_events 
-                    SET error_message = %s
-                    WHERE id = %s  
-                    """, (str(e), harvest_event.id)
-                )
-                continue
+    with self.postgres_config.get_pool().connection() as conn:
+        batch = fetch_harvest_events(conn.cursor(), event_ids)
+        return normalize_and_forward(self, conn, batch, index_name, harvest_run_id, skip_unchanged)
+
+
+@celery_app.task(name=EMBED_BATCH, base=Batches, ignore_result=True, flush_every=EMBEDDING_FLUSH_EVERY,
+                 flush_interval=EMBEDDING_FLUSH_INTERVAL)
+def embed_batch(requests: list[SimpleRequest]) -> None:
+    """
+    Second stage of the pipeline: calculates the embeddings of the records sent by several normalize_batch tasks
+    with one call of the embedding model and passes them on to the sink.
+    Each request has the args records, index name and harvest run id.
+    If the embeddings cannot be calculated or passed on, the error is written to the harvest events
+    of the requests not passed on yet, since Batches tasks are not retried.
+    See https://celery-batches.readthedocs.io
+    """
+    # reconstruct SourceWithEmbeddingText from serialized lists
+    batches = [[SourceWithEmbeddingText(src, text, HarvestEventQueue(*event), content_hash)
+                for src, text, event, content_hash in request.args[0]] for request in requests]
+    # number of requests passed on to the sink
+    sent = 0
+
+    try:
+        with get_postgres_config().get_pool().connection() as conn:
+            src_with_emb = embed_records(conn.cursor(), get_embedding_transformer(),
+                                         [rec for batch in batches for rec in batch])
+
+        # the task arguments are serialized to JSON by Celery
+        for rec in src_with_emb:
+            rec.src['emb'] = np.asarray(rec.src['emb']).tolist()
+
+        # one sink task per normalize_batch task, so that a batch is written in one transaction
+        offset = 0
+        for request, batch in zip(requests, batches):
+            write_batch.delay(src_with_emb[offset:offset + len(batch)], [], request.args[1], request.args[2])
+            offset += len(batch)
+            sent += 1
+    except Exception as e:
+        errors = {rec.event.id: str(e) for batch in batches[sent:] for rec in batch}
+        logger.error(f'Embedding batch failed, {len(errors)} harvest events are not written: {e}')
+        ERRORS.labels('embed').inc(len(errors))
 
         try:
-            logger.info(f'About to Calculate embeddings for {len(normalized)}')
-            src_with_emb: list[OpenSearchSourceWithEmbedding] = add_embeddings_to_source(normalized,
-                                                                                       self.embedding_transformer)
-            logger.info(f'Calculated embeddings for {len(src_with_emb)}')
-            preprocessed = preprocess_batch([src_with_emb_ele.src for src_with_emb_ele in src_with_emb], index_name)
-        except Exception as e:
-            logger.error(f'Could not calculate embeddings: {e}')
-            raise e
+            with get_postgres_config().get_pool().connection() as conn:
+                set_harvest_event_errors(conn.cursor(), errors)
+        except Exception as db_error:
+            logger.error(f'Errors of the harvest events could not be written: {db_error}')
+
+        raise e
+
+
+@celery_app.task(name=WRITE_BATCH, base=TransformTask, bind=True, ignore_result=True)
+def write_batch(self: Any, records: list[OpenSearchSourceWithEmbedding], deleted: list[HarvestEventQueue], index_name: str,
+                harvest_run_id: Optional[str] = None) -> Any:
+    """
+    Last stage of the pipeline: writes records with embeddings to OpenSearch and the records table
+    and deletes the records of deleted harvest events.
+    """
+    # see transform_batch for error handling
+    with self.postgres_config.get_pool().connection() as conn:
+        cur = conn.cursor()
+
+        to_delete = get_records_to_delete(cur, [HarvestEventQueue(*ele) for ele in deleted])
+
+        # reconstruct OpenSearchSourceWithEmbedding from serialized lists
+        with measure_stage('write_batch', harvest_run_id=harvest_run_id, index_name=index_name, batch_size=len(records)):
+            success, upserted, deleted_count = write_records(self, cur, [
+                OpenSearchSourceWithEmbedding(src, HarvestEventQueue(*event), embedding_text_hash, content_hash)
+                for src, event, embedding_text_hash, content_hash in records
+            ], index_name, to_delete)
+
+        logger.info(f'Records created: {upserted.created} updated: {upserted.updated} deleted: {deleted_count}')
+
+        if harvest_run_id is not None:
+            add_harvest_run_counts(cur, harvest_run_id, upserted.created, upserted.updated, deleted_count, 0)
+
+    schedule_outbox_drain(self)
+
+    return success
+
+
+@celery_app.task(name=DRAIN_OUTBOX, base=TransformTask, bind=True, ignore_result=True)
+def drain_outbox(self: Any) -> int:
+    """
+    Sends the pending actions of table opensearch_outbox (OPENSEARCH_SYNC=outbox) to OpenSearch until it is drained,
+    one transaction per chunk of OPENSEARCH_OUTBOX_CHUNK_SIZE entries. Scheduled after each batch.
+    Entries that fail are retried by the next drain, up to OPENSEARCH_OUTBOX_MAX_ATTEMPTS times.
+
+    :return: number of successful OpenSearch actions.
+    """
+    success = 0
+    failed: list[int] = []
+
+    while True:
+        with self.postgres_config.get_pool().connection() as conn:
+            cur = conn.cursor()
+
+            entries = lock_outbox_entries(cur, self.opensearch_config.outbox_chunk_size,
+                                          self.opensearch_config.outbox_max_attempts, failed)
+            if len(entries) == 0:
+                break
+
+            with measure_stage('drain_outbox', entries=len(entries)):
+                chunk_success, chunk_failed = send_outbox_entries(self, cur, entries)
+
+        success += chunk_success
+        # not retried in this run
+        failed.extend(chunk_failed)
+
+    if success > 0 or len(failed) > 0:
+        logger.info(f'Outbox drained: success {success} failed: {len(failed)}')
+
+    return success
+
+
+def send_outbox_entries(task: TransformTask, cur: psycopg.Cursor[dict[str, Any]], entries: list[OutboxEntry]) -> tuple[int, list[int]]:
+    """
+    Sends locked outbox entries to OpenSearch with bulk requests, removes the entries OpenSearch accepted and marks their records as synced.
+    The failed entries are kept and their errors are written to their harvest events.
+
+    :param task: the task providing the OpenSearch client and config.
+    :param cur: cursor of the connection whose transaction locked the entries.
+    :param entries: the entries, see `postgres_utils.lock_outbox_entries`.
+    :return: number of successful OpenSearch actions and the ids of the failed entries.
+    """
+    # only the latest action per document is sent since the bulk requests may be sent in parallel,
+    # index actions of records deleted in the meantime are dropped (their delete action follows)
+    latest = {(entry.index_name, entry.document_id): entry for entry in entries}
+    to_send = [entry for entry in latest.values() if entry.op_type == 'delete' or entry.source is not None]
+
+    actions = [
+        {'_op_type': entry.op_type, '_id': entry.document_id, '_index': entry.index_name, '_source': entry.source}
+        if entry.op_type == 'index' else {'_op_type': entry.op_type, '_id': entry.document_id, '_index': entry.index_name}
+        for entry in to_send
+    ]
+    bulk_result = bulk_write(task.client, actions, **task.opensearch_config.bulk_params)
+    ERRORS.labels('opensearch').inc(len(bulk_result.errors))
+
+    errors: dict[str, BulkError] = {error.id: error for error in bulk_result.errors}
+    failed = [entry for entry in to_send if entry.document_id in errors]
+    failed_ids = {entry.id for entry in failed}
+    if failed:
+        logger.error(f'OpenSearch failed {len(failed)} outbox actions, e.g., {errors[failed[0].document_id]}')
+
+    complete_outbox_entries(cur, [entry.id for entry in entries if entry.id not in failed_ids],
+                            [entry.record_id for entry in to_send
+                             if entry.record_id is not None and entry.id not in failed_ids])
+    fail_outbox_entries(cur, {entry.id: str(errors[entry.document_id]) for entry in failed})
+    set_harvest_event_errors(cur, {entry.harvest_event_id: str(errors[entry.document_id]) for entry in failed})
+
+    return bulk_result.success, sorted(failed_ids)
+
+
+def schedule_outbox_drain(task: TransformTask) -> None:
+    """
+    Schedules drain_outbox if the batches write to the outbox, to be called when the batch is committed.
+
+    :param task: the task providing the OpenSearch config.
+    """
+    if task.opensearch_config.sync_mode == 'outbox':
+        drain_outbox.delay()
+
+
+@celery_app.task(name=REINDEX_RECORDS, base=TransformTask, bind=True)
+def reindex_records(self: Any, alias: str, delete_old: bool = False) -> dict[str, Any]:
+    """
+    Rebuilds an index from the normalized records and embeddings in the records table, without parsing and embedding again.
+    The records are streamed into a new index which then replaces the index behind the alias.
+
+    :param alias: the alias searches use, e.g., INDEX_NAME.
+    :param delete_old: if True, the indices the alias pointed to before are deleted.
+    :return: name of the new index, number of documents indexed, the previous indices and the duration.
+    """
+    index_name = get_versioned_index_name(alias)
+
+    create_index(self.client, index_name, get_opensearch_mapping(), self.embedding_config.get_embedding_dims(), bulk_settings=True)
+    logger.info(f'Reindexing records into {index_name}')
+
+    return index_records_and_publish(self, alias, index_name, 'index', delete_old)
+
+
+@celery_app.task(name=FINALIZE_INDEX_BUILD, base=TransformTask, bind=True)
+def finalize_index_build(self: Any, results: list[Any], alias: str, index_name: str, delete_old: bool = False) -> dict[str, Any]:
+    """
+    Last step of building a new index for a harvest run (/index with new_index), called when all batches are written:
+    adds the records not written by the batches (e.g., of other endpoints or unchanged) from the records table
+    and replaces the index behind the alias.
+
+    :param results: results of the batch tasks.
+    :param alias: the alias searches use.
+    :param index_name: the new index the batches were written to.
+    :param delete_old: if True, the indices the alias pointed to before are deleted.
+    :return: name of the new index, number of documents indexed, the previous indices and the duration.
+    """
+    logger.info(f'{len(results)} batches written to {index_name}, adding the other records')
+
+    # the batches create the index, unless the harvest run has no harvest events
+    create_index(self.client, index_name, get_opensearch_mapping(), self.embedding_config.get_embedding_dims(), bulk_settings=True)
+
+    # documents written by the batches are newer than the records read here and must not be overwritten
+    return index_records_and_publish(self, alias, index_name, 'create', delete_old)
+
+
+def index_records_and_publish(task: TransformTask, alias: str, index_name: str, op_type: str, delete_old: bool) -> dict[str, Any]:
+    """
+    Streams all records from the records table into an index built with bulk settings
+    and, if all of them could be indexed, points the alias to the index.
+
+    :param task: the task providing the OpenSearch client and config.
+    :param alias: the alias searches use.
+    :param index_name: the new index.
+    :param op_type: "index" to overwrite documents in the index, "create" to keep them.
+    :param delete_old: if True, the indices the alias pointed to before are deleted.
+    :return: name of the new index, number of documents indexed, the previous indices and the duration.
+    """
+    started = time.perf_counter()
+
+    with task.postgres_config.get_pool().connection() as conn:
+        actions = ({'_op_type': op_type, '_id': record['id'], '_index': index_name, '_source': record}
+                   for record in read_records(conn))
+
+        bulk_result = bulk_write(task.client, actions,
+                                 **{**task.opensearch_config.bulk_params, 'thread_count': task.opensearch_config.reindex_threads})
+
+        if bulk_result.errors:
+            # the alias keeps pointing to the current index, the new one is kept for inspection
+            raise ValueError(f'{len(bulk_result.errors)} records could not be indexed into {index_name} '
+                             f'(e.g., {bulk_result.errors[0]}), alias {alias} was not changed')
+
+        old = publish_index(task.client, alias, index_name, get_opensearch_mapping(), delete_old)
+
+        # all records are in the index behind the alias now
+        conn.execute("""
+        UPDATE records
+        SET opensearch_synced = true, opensearch_synced_at = now()
+        WHERE embedding_model = %s AND embeddings IS NOT NULL AND datacite_json IS NOT NULL AND NOT opensearch_synced
+        """, [EMBEDDING_MODEL])
+
+    duration = time.perf_counter() - started
+    logger.info(f'Indexed {bulk_result.success} records into {index_name} in {duration:.2f}s, alias {alias} pointed to {old}')
+
+    return {'index_name': index_name, 'documents': bulk_result.success, 'previous_indices': old, 'duration': duration}
+
+
+def read_records(conn: psycopg.Connection[dict[str, Any]]) -> Iterator[dict[str, Any]]:
+    """
+    Streams the normalized records with their embeddings from the records table with a server-side cursor.
+
+    :param conn: connection returning rows as dicts.
+    :return: the OpenSearch documents.
+    """
+    # https://www.psycopg.org/psycopg3/docs/advanced/cursors.html#server-side-cursors
+    with conn.cursor(name='read_records') as cur:
+        cur.itersize = REINDEX_FETCH_SIZE
+        cur.execute("""
+        SELECT datacite_json, embeddings
+        FROM records
+        WHERE embedding_model = %s AND embeddings IS NOT NULL AND datacite_json IS NOT NULL
+        """, [EMBEDDING_MODEL])
+
+        for row in cur:
+            # the array is converted to a list when the bulk request is serialized
+            yield {**row['datacite_json'], 'emb': embedding_from_bytes(row['embeddings'])}
+
+
+def check_index(task: TransformTask, index_name: str, new_index: bool) -> None:
+    """
+    Makes sure that the index to write to exists.
+
+    :param task: the task providing the OpenSearch client.
+    :param index_name: name of the index.
+    :param new_index: if True, the index is a new one built for a harvest run and is created if it does not exist yet,
+        see finalize_index_build.
+    """
+    if new_index:
+        create_index(task.client, index_name, get_opensearch_mapping(), task.embedding_config.get_embedding_dims(), bulk_settings=True)
+    elif not task.client.indices.exists(index=index_name):
+        raise ValueError(f'Index {index_name} does not exist in OpenSearch')
+
+
+def fetch_harvest_events(cur: psycopg.Cursor[dict[str, Any]], event_ids: list[str]) -> list[HarvestEventQueue]:
+    """
+    Fetches a batch of harvest events with a single query instead of receiving the XML via the broker.
+
+    :param cur: cursor returning rows as dicts.
+    :param event_ids: IDs of the harvest events.
+    :return: the harvest events found, ordered by id.
+    """
+    cur.execute(HARVEST_EVENTS_SELECT + """
+    WHERE he.id = ANY(%s)
+    ORDER BY he.id
+    """, [event_ids])
+
+    batch = [harvest_event_from_row(doc) for doc in cur.fetchall()]
+
+    if len(batch) < len(event_ids):
+        logger.warning(f'Only {len(batch)} of {len(event_ids)} harvest events could be found')
 
+    return batch
+
+
+def extract_resource(xml: str) -> tuple[Optional[str], Optional[dict[str, Any]]]:
+    """
+    Converts an OAI-PMH record with xmltodict and extracts its DataCite resource.
+
+    :param xml: the OAI-PMH record.
+    :return: the record's identifier and resource, resource is None if it cannot be accessed.
+    """
+    converted = xmltodict.parse(xml, process_namespaces=True)
+
+    if OAI_RECORD in converted and OAI_METADATA in converted[OAI_RECORD]:
+        rec_id = converted[OAI_RECORD][f'{OAI}:header'][
+            f'{OAI}:identifier']
+
+        metadata = converted[OAI_RECORD][OAI_METADATA]
+    else:
+        # Converted JSON cannot be processed, log this
+        logger.debug(f'Cannot access {OAI_METADATA} in : {converted}')
+        return None, None
+
+    if DATACITE_RESOURCE in metadata:
+        return rec_id, metadata[DATACITE_RESOURCE]
+    elif HAL_RESOURCE in metadata:
+        # HAL
+        return rec_id, metadata[HAL_RESOURCE]
+    elif ONEDATA_WRAPPER in metadata and ONEDATA_PAYLOAD in metadata[ONEDATA_WRAPPER] and DATACITE_RESOURCE in metadata[ONEDATA_WRAPPER][ONEDATA_PAYLOAD]:
+        # extra layer structure from Onedata
+        return rec_id, metadata[ONEDATA_WRAPPER][ONEDATA_PAYLOAD][DATACITE_RESOURCE]
+    else:
+        # JSON cannot be processed, log this
+        logger.debug(f'Cannot access resource element {DATACITE_RESOURCE} or {HAL_RESOURCE} or {ONEDATA_WRAPPER}{ONEDATA_PAYLOAD} in : {metadata}')
+        return rec_id, None
+
+
+
+def normalize_and_forward(task: TransformTask, conn: psycopg.Connection[dict[str, Any]], batch: list[HarvestEventQueue],
+                          index_name: str, harvest_run_id: Optional[str], skip_unchanged: bool) -> int:
+    """
+    Normalizes a batch of harvest events and sends the results to the next stages of the pipeline.
+
+    :return: number of records sent to the embedding stage.
+    """
+    cur = conn.cursor()
+
+    BATCH_SIZE.observe(len(batch))
+
+    with measure_stage('normalize_batch', harvest_run_id=harvest_run_id, index_name=index_name, batch_size=len(batch)):
+        normalized = normalize_events(task, cur, batch, skip_unchanged)
+
+    if harvest_run_id is not None and normalized.unchanged > 0:
+        add_harvest_run_counts(cur, harvest_run_id, 0, 0, 0, normalized.unchanged)
+
+    # commit before sending, so that no records are passed on if the transaction fails
+    conn.commit()
+
+    if normalized.records:
+        # the Batches task receives the args of all buffered calls as requests
+        embed_batch.apply_async((normalized.records, index_name, harvest_run_id))
+
+    if normalized.deleted:
+        write_batch.delay([], normalized.deleted, index_name, harvest_run_id)
+
+    return len(normalized.records)
+
+
+def normalize_events(task: TransformTask, cur: psycopg.Cursor[dict[str, Any]], batch: list[HarvestEventQueue],
+                     skip_unchanged: bool) -> NormalizedBatch:
+    """
+    Parses, normalizes and validates a batch of harvest events.
+    Errors are written to the harvest events.
+
+    :param task: the task providing the JSON schema validator.
+    :param cur: cursor of the connection whose transaction the errors are written in.
+    :param batch: harvest events to be processed.
+    :param skip_unchanged: if True, harvest events whose record is already synced with the same content are skipped.
+        Must be False when indexing into an index that does not contain the records yet.
+    :return: the normalized records, the deleted harvest events and the number of unchanged records.
+    """
+    with measure_stage('content_hash'):
+        content_hashes = {harvest_event.id: get_content_hash(harvest_event.xml, harvest_event.additional_metadata)
+                          for harvest_event in batch if not harvest_event.is_deleted}
+
+    unchanged: set[str] = set()
+    if skip_unchanged:
+        with measure_stage('unchanged'):
+            stored_hashes = get_content_hashes(cur, [(harvest_event.endpoint_id, harvest_event.record_identifier)
+                                                     for harvest_event in batch if not harvest_event.is_deleted], str(EMBEDDING_MODEL))
+
+        unchanged = {harvest_event.id for harvest_event in batch if not harvest_event.is_deleted and
+                     stored_hashes.get((harvest_event.endpoint_id, harvest_event.record_identifier)) == content_hashes[harvest_event.id]}
+        RECORDS.labels('unchanged').inc(len(unchanged))
+
+        if unchanged:
+            logger.info(f'Skipping {len(unchanged)} harvest events with unchanged records')
+
+            # unchanged records are neither transformed nor written, only a previous error is reset
+            cur.execute("""
+            UPDATE harvest_events
+            SET error_message = NULL
+            WHERE id = ANY(%s)
+            """, [list(unchanged)])
+
+    normalized: list[SourceWithEmbeddingText] = []
+    deleted: list[HarvestEventQueue] = []
+    # time spent per stage, summed up over the records of the batch
+    durations = {'parse': 0.0, 'normalize': 0.0, 'validate': 0.0}
+    for harvest_event in batch:
+
+        if harvest_event.is_deleted:
+            deleted.append(harvest_event)
+            continue
+
+        if harvest_event.id in unchanged:
+            continue
+
+        logger.debug(f'Processing {harvest_event}')
+
+        started = time.perf_counter()
+        rec_id, resource = parse_record(harvest_event.xml) if XML_PARSER == 'lxml' else extract_resource(harvest_event.xml)
+        durations['parse'] += time.perf_counter() - started
+
+        if resource is None:
+            # record cannot be processed, log this
+            ERRORS.labels('parse').inc()
+            logger.debug(f'Cannot access resource element in harvest_event {harvest_event.id}')
+            continue
+
+        logger.debug(f'{rec_id}')
+
+        # Catch and log errors
+        stage = 'normalize'
         try:
-            success, failed = bulk(self.client, preprocessed)
-            if success < len(src_with_emb):
-                logger.error(f'Normalized doc size was {len(src_with_emb)} but only {success} were imported into OpenSearch.')
+            started = time.perf_counter()
+            normalized_record = normalize_datacite_json.normalize_datacite_json(resource)
+            durations['normalize'] += time.perf_counter() - started
+
+            stage = 'validate'
+            started = time.perf_counter()
+            task.validator.validate(normalized_record)
+            durations['validate'] += time.perf_counter() - started
+
+            normalized.append(SourceWithEmbeddingText(src=normalized_record,
+                                                      textToEmbed=get_embedding_text_from_fields(normalized_record),
+                                                      event=harvest_event,
+                                                      content_hash=content_hashes[harvest_event.id]
+                                                      ))
 
-            opensearch_synced_at = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f%z')
-            logger.info(f'Bulk results: success {success} failed: {failed}')
-
-            for rec in src_with_emb:
-                # write to records table
-
-                record_identifier = rec.harvest_event.record_identifier
-                datestamp = rec.harvest_event.datestamp
-                repository_id = rec.harvest_event.repository_id
-                endpoint_id = rec.harvest_event.endpoint_id
-                resource_type = 'Dataset' # TODO: get this information from record
-                title = rec.src['titles'][0]['title']
-                xml = rec.harvest_event.xml
-                protocol = 'OAI-PMH'
-                doi = rec.src.get('doi')
-                url = rec.src.get('url')
-                embeddings = rec.src['emb']
-                datacite_json = json.dumps({**rec.src, 'emb': None})
-                opensearch_synced = True
-                additional_metadata = rec.harvest_event.additional_metadata
-
-                # https://neon.com/postgresql/postgresql-tutorial/postgresql-upsert
-                cur.execute("""
-                INSERT INTO records 
-                (   
-                    record_identifier,
-                    repository_id,
-                    endpoint_id,
-                    resource_type,
-                    title,
-                    raw_metadata,
-                    metadata_protocol,
-                    doi,
-                    url,
-                    embeddings,
-                    embedding_model,
-                    datacite_json,
-                    opensearch_synced,
-                    opensearch_synced_at,
-                    additional_metadata,
-                    datestamp
-                    ) 
-                VALUES (
-                    %s, %s, %s, %s, %s, XMLPARSE(DOCUMENT %s), %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                    )
-                    ON CONFLICT (endpoint_id, record_identifier)
-                    DO UPDATE SET resource_type = %s, title = %s, raw_metadata = XMLPARSE(DOCUMENT %s), doi = %s, url = %s, embeddings = %s, embedding_model = %s, datacite_json = %s, opensearch_synced_at = %s, additional_metadata = %s, datestamp = %s      
-                """, (record_identifier, # Insert
-                      repository_id,
-                      endpoint_id,
-                      resource_type,
-                      title,
-                      xml,
-                      protocol,
-                      doi,
-                      url,
-                      embeddings,
-                      EMBEDDING_MODEL,
-                      datacite_json,
-                      opensearch_synced,
-                      opensearch_synced_at,
-                      additional_metadata,
-                      datestamp,
-                      resource_type, # Update
-                      title,
-                      xml,
-                      doi,
-                      url,
-                      embeddings,
-                      EMBEDDING_MODEL,
-                      datacite_json,
-                      opensearch_synced_at,
-                      additional_metadata,
-                      datestamp
-                      )
-                )
-
-                cur.execute(
-                    """
-                    UPDATE harvest_events 
-                    SET error_message = NULL
-                    WHERE id = %s  
-                    """, [rec.harvest_event.id]
-                )
-
-        except BulkIndexError as e:
-            logger.error(f'OpenSearch bulk indexing failed: {e}')
-            raise e
         except Exception as e:
-            logger.error(f'Writing batch failed: {e}')
-            raise e
+            logger.info(f'An error occurred for {rec_id} in harvest_event {harvest_event.id} during transformation or validation: {e}')
+            ERRORS.labels(stage).inc()
+
+            cur.execute(
+                """
+                UPDATE harvest_events 
+                SET error_message = %s
+                WHERE id = %s  
+                """, (str(e), harvest_event.id)
+            )
+            continue
+
+    for stage, duration in durations.items():
+        observe_stage(stage, duration)
+
+    return NormalizedBatch(records=normalized, deleted=deleted, unchanged=len(unchanged))
+
+
+def embed_records(cur: psycopg.Cursor[dict[str, Any]], embedding_transformer: 'TextEmbedding',
+                  records: list[SourceWithEmbeddingText]) -> list[OpenSearchSourceWithEmbedding]:
+    """
+    Calculates the embeddings of normalized records, reusing the embeddings in the records table if EMBEDDING_CACHE is set.
+
+    :param cur: cursor returning rows as dicts.
+    :param embedding_transformer: the embedding model.
+    :param records: the normalized records.
+    :return: the records with embeddings, in the same order.
+    """
+    def lookup_embeddings(text_hashes: list[str]) -> dict[str, np.ndarray[Any, Any]]:
+        with measure_stage('embedding_cache'):
+            cached = get_cached_embeddings(cur, str(EMBEDDING_MODEL), text_hashes)
+        logger.info(f'Found {len(cached)} of {len(text_hashes)} distinct embedding texts in cache')
+        return cached
+
+    try:
+        logger.info(f'About to Calculate embeddings for {len(records)}')
+        with measure_stage('embed', records=len(records)):
+            src_with_emb: list[OpenSearchSourceWithEmbedding] = add_embeddings_to_source(
+                records, embedding_transformer, embedding_cache=lookup_embeddings if EMBEDDING_CACHE else None,
+                embed_params=get_embedding_config().embed_params)
+        logger.info(f'Calculated embeddings for {len(src_with_emb)}')
+    except Exception as e:
+        logger.error(f'Could not calculate embeddings: {e}')
+        raise e
+
+    return src_with_emb
+
+
+def write_records(task: TransformTask, cur: psycopg.Cursor[dict[str, Any]], src_with_emb: list[OpenSearchSourceWithEmbedding],
+                  index_name: str, to_delete: Optional[list[RecordToDelete]] = None) -> tuple[int, UpsertResult, int]:
+    """
+    Writes records with embeddings to OpenSearch and the records table and deletes the records of deleted harvest events.
+    The documents are indexed and deleted with bulk requests, the records are written and deleted with set-based statements.
+
+    Documents that OpenSearch fails to index are written to the records table with opensearch_synced set to false,
+    documents it fails to delete are kept. The errors are written to their harvest events.
+
+    With OPENSEARCH_SYNC=outbox, no requests are sent to OpenSearch: the actions are added to table opensearch_outbox
+    in the same transaction and sent by drain_outbox, which sets opensearch_synced.
+
+    :param task: the task providing the OpenSearch client and config.
+    :param cur: cursor of the connection whose transaction the records are written in.
+    :param src_with_emb: the records with embeddings.
+    :param index_name: name of the OpenSearch index.
+    :param to_delete: the records to be deleted, see `postgres_utils.get_records_to_delete`.
+    :return: number of successful OpenSearch actions (0 with the outbox), numbers of records created and updated,
+        and number of records deleted.
+    """
+    to_delete = to_delete or []
+    outbox = task.opensearch_config.sync_mode == 'outbox'
+    bulk_result = BulkResult(success=0, errors=[])
+    upserted = UpsertResult(created=0, updated=0)
+    deleted: int = 0
+    failed_index: dict[str, BulkError] = {}
+    failed_delete: dict[str, BulkError] = {}
+    opensearch_synced_at: Optional[str] = None
+
+    try:
+        # each document is serialized once for OpenSearch and the records table
+        with measure_stage('serialize'):
+            documents = [dumps_document(rec.src) for rec in src_with_emb]
+
+        if not outbox:
+            delete_actions = [
+                {'_op_type': 'delete', '_id': record.opensearch_id, '_index': index_name}
+                for record in to_delete if record.opensearch_id is not None
+            ]
+            index_actions = [
+                {'_op_type': 'index', '_id': rec.src['id'], '_index': index_name, '_source': document.source}
+                for rec, document in zip(src_with_emb, documents)
+            ]
+
+            with measure_stage('bulk', actions=len(delete_actions) + len(index_actions)):
+                bulk_result = bulk_write(task.client, delete_actions + index_actions, **task.opensearch_config.bulk_params)
+            ERRORS.labels('opensearch').inc(len(bulk_result.errors))
+
+            opensearch_synced_at = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f%z')
+            logger.info(f'Bulk results: success {bulk_result.success} failed: {len(bulk_result.errors)}')
+
+            failed_index = {error.id: error for error in bulk_result.errors if error.op_type != 'delete'}
+            failed_delete = {error.id: error for error in bulk_result.errors if error.op_type == 'delete'}
+            if bulk_result.errors:
+                logger.error(f'OpenSearch failed to index {len(failed_index)} and to delete {len(failed_delete)} documents, '
+                             f'e.g., {bulk_result.errors[0]}')
+
+        records = [
+            RecordRow(
+                harvest_event_id=rec.harvest_event.id,
+                record_identifier=rec.harvest_event.record_identifier,
+                repository_id=rec.harvest_event.repository_id,
+                endpoint_id=rec.harvest_event.endpoint_id,
+                resource_type='Dataset', # TODO: get this information from record
+                title=rec.src['titles'][0]['title'],
+                raw_metadata=rec.harvest_event.xml,
+                metadata_protocol='OAI-PMH',
+                doi=rec.src.get('doi'),
+                url=rec.src.get('url'),
+                embeddings=embedding_to_bytes(rec.src['emb']),
+                embedding_model=EMBEDDING_MODEL,
+                embedding_text_hash=rec.embedding_text_hash,
+                content_hash=rec.content_hash,
+                datacite_json=document.datacite_json,
+                # not synced before drain_outbox has sent the document
+                opensearch_synced=opensearch_synced_at is not None and rec.src['id'] not in failed_index,
+                opensearch_synced_at=opensearch_synced_at if rec.src['id'] not in failed_index else None,
+                additional_metadata=rec.harvest_event.additional_metadata,
+                datestamp=rec.harvest_event.datestamp
+            )
+            for rec, document in zip(src_with_emb, documents)
+        ]
+
+        # write to records table
+        with measure_stage('upsert'):
+            upserted = upsert_records(cur, records)
+
+        with measure_stage('delete'):
+            deleted = delete_records(cur, [record.id for record in to_delete if record.opensearch_id not in failed_delete])
+
+        if outbox:
+            # in the order of the bulk request above: deletes first
+            with measure_stage('outbox'):
+                enqueue_delete_actions(cur, index_name, to_delete)
+                enqueue_index_actions(cur, index_name, records)
+
+        RECORDS.labels('created').inc(upserted.created)
+        RECORDS.labels('updated').inc(upserted.updated)
+        DELETES.inc(deleted)
+
+        # after upsert_records, which resets the errors of the written harvest events
+        errors = {rec.harvest_event.id: str(failed_index[rec.src['id']]) for rec in src_with_emb if rec.src['id'] in failed_index}
+        errors.update({record.harvest_event_id: str(failed_delete[record.opensearch_id])
+                       for record in to_delete if record.opensearch_id in failed_delete})
+        set_harvest_event_errors(cur, errors)
+
+    except Exception as e:
+        logger.error(f'Writing batch failed: {e}')
+        raise e
+
+    logger.debug(f'PostgreSQL connection pool: {task.postgres_config.get_pool_stats()}')
+
+    return bulk_result.success, upserted, deleted
+
+
+def process_batch(task: TransformTask, conn: psycopg.Connection[dict[str, Any]], batch: list[HarvestEventQueue], index_name: str,
+                  harvest_run_id: Optional[str] = None, skip_unchanged: bool = False) -> int:
+    """
+    Transforms and normalizes a batch of harvest events, calculates the embeddings,
+    and writes the results to OpenSearch and the records table, all stages in one task.
+
+    :param task: the task providing the OpenSearch client, the embedding model and the JSON schema.
+    :param conn: connection whose transaction the batch is written in.
+    :param batch: harvest events to be processed.
+    :param index_name: name of the OpenSearch index.
+    :param harvest_run_id: ID of the harvest run whose counters are updated, if given.
+    :param skip_unchanged: if True, harvest events whose record is already synced with the same content are skipped.
+        Must be False when indexing into an index that does not contain the records yet.
+    :return: number of documents imported into OpenSearch.
+    """
+    cur = conn.cursor()
+
+    BATCH_SIZE.observe(len(batch))
+
+    with measure_stage('batch', harvest_run_id=harvest_run_id, index_name=index_name, batch_size=len(batch)):
+        normalized = normalize_events(task, cur, batch, skip_unchanged)
+
+        to_delete = get_records_to_delete(cur, normalized.deleted)
+
+        src_with_emb = embed_records(cur, task.embedding_transformer, normalized.records)
+
+        success, upserted, deleted = write_records(task, cur, src_with_emb, index_name, to_delete)
+
+    logger.info(f'Records created: {upserted.created} updated: {upserted.updated} deleted: {deleted} unchanged: {normalized.unchanged}')
+
+    if harvest_run_id is not None:
+        add_harvest_run_counts(cur, harvest_run_id, upserted.created, upserted.updated, deleted, normalized.unchanged)
 
     return success
@@ -1,18 +1,29 @@
-from datetime import datetime, timezone
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 from json import JSONDecodeError
 from logging.config import dictConfig
-from typing import Optional
-import psycopg
+from typing import Any, NamedTuple, Optional
+import json
 from psycopg import errors as psycopg_errors
-from psycopg.rows import dict_row
 from config.logging_config import LOGGING_CONFIG
 from config.postgres_config import PostgresConfig
-from utils.queue_utils import HarvestEventQueue
-from tasks import transform_batch
+from utils.queue_utils import HARVEST_EVENTS_SELECT, RateLimiter, harvest_event_from_row, split_batches
+from utils.opensearch_utils import get_versioned_index_name
+from utils.metrics_utils import measure_stage, SCHEDULED_BATCHES, SCHEDULED_EVENTS
+from celery_app import celery_app, TRANSFORM_BATCH, TRANSFORM_BATCH_BY_IDS, NORMALIZE_BATCH, NORMALIZE_BATCH_BY_IDS, REINDEX_RECORDS, \
+    FINALIZE_INDEX_BUILD
+from celery import chord
+from celery.result import AsyncResult, GroupResult
+from concurrent.futures import ThreadPoolExecutor
+import uuid
 import os
-from fastapi import FastAPI, Query, HTTPException
+import time
+from fastapi import FastAPI, Query, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 import logging
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
+from prometheus_client import make_asgi_app
 
 dictConfig(LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
@@ -25,6 +36,44 @@ try:
 except (TypeError, ValueError):
     raise ValueError('CELERY_BATCH_SIZE should be an integer')
 
+# maximum size of a batch in bytes (raw and additional metadata of the harvest events), 0 for batches of CELERY_BATCH_SIZE
+# harvest events; if set, CELERY_BATCH_SIZE is the maximum number of harvest events per batch
+BATCH_BYTES = int(os.environ.get('CELERY_BATCH_BYTES') or 0)
+
+# if set with CELERY_BATCH_BYTES, the byte budget is tuned so that a worker takes about this many seconds per batch,
+# see BatchBudget
+BATCH_TARGET_SECONDS = float(os.environ.get('CELERY_BATCH_TARGET_SECONDS') or 0)
+
+# the tuned byte budget stays between CELERY_BATCH_BYTES divided and multiplied by this factor
+BATCH_BYTES_TUNING_RANGE = 4
+
+# the byte budget is tuned every BATCH_TUNING_INTERVAL batches from the latest BATCH_TUNING_SAMPLE batches done
+BATCH_TUNING_INTERVAL = 20
+BATCH_TUNING_SAMPLE = 50
+
+# size of a harvest event in bytes
+HARVEST_EVENT_SIZE = 'octet_length(he.raw_metadata::text) + coalesce(octet_length(he.additional_metadata), 0)'
+
+# number of harvest events written in one transaction by POST /harvest_events
+HARVEST_EVENTS_CHUNK_SIZE = 1000
+
+# if true, only harvest event ids are put in the queue instead of the whole events including the XML
+PASS_BY_REFERENCE = os.environ.get('CELERY_PASS_BY_REFERENCE', 'false').lower() == 'true'
+
+# if true, batches are processed by a pipeline of tasks (normalize, embed, write) instead of a single task, see README
+PIPELINE = os.environ.get('CELERY_PIPELINE', 'false').lower() == 'true'
+
+# maximum number of batches put in the queue per second by all /index calls together, 0 for no limit
+SCHEDULE_RATE_LIMIT = float(os.environ.get('CELERY_SCHEDULE_RATE_LIMIT') or 0)
+schedule_rate_limiter = RateLimiter(SCHEDULE_RATE_LIMIT, burst=max(1, int(SCHEDULE_RATE_LIMIT))) if SCHEDULE_RATE_LIMIT > 0 else None
+
+# number of harvest runs scheduled in parallel by /index/bulk, each uses two connections of the pool
+# (limited to fewer than half of POSTGRES_POOL_MAX_SIZE, see below)
+INDEX_BULK_CONCURRENCY = int(os.environ.get('INDEX_BULK_CONCURRENCY') or 4)
+
+# seconds of the latest batches the throughput for the ETA of /index/progress is calculated from
+PROGRESS_RATE_WINDOW = 300
+
 tags_metadata = [
     {
         'name': 'health',
@@ -44,21 +93,88 @@ tags_metadata = [
     },
     {
         'name': 'harvest_event',
-        'description': 'Register a harvest event'
+        'description': 'Register harvest events'
     }
 ]
 
-app = FastAPI(openapi_tags=tags_metadata)
 postgres_config: PostgresConfig = PostgresConfig()
-connection_params = postgres_config.connection_params
+
+# the harvest runs scheduled in parallel by /index/bulk must leave a connection of the pool for other requests,
+# otherwise they wait for each other's second connection until the pool times out
+max_index_bulk_concurrency = max(1, (postgres_config.pool_max_size - 1) // 2)
+if INDEX_BULK_CONCURRENCY > max_index_bulk_concurrency:
+    logger.warning(f'INDEX_BULK_CONCURRENCY of {INDEX_BULK_CONCURRENCY} needs {INDEX_BULK_CONCURRENCY * 2} connections, '
+                   f'POSTGRES_POOL_MAX_SIZE is {postgres_config.pool_max_size}, using {max_index_bulk_concurrency}')
+    INDEX_BULK_CONCURRENCY = max_index_bulk_concurrency
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # https://fastapi.tiangolo.com/advanced/events/#lifespan
+    # connections are reused across requests instead of connecting to PostgreSQL on every request
+    postgres_config.get_pool()
+    yield
+    postgres_config.close_pool()
+
+
+app = FastAPI(openapi_tags=tags_metadata, lifespan=lifespan)
+
+# metrics of the API for Prometheus, the workers serve theirs on WORKER_METRICS_PORT
+# https://prometheus.github.io/client_python/exporting/http/fastapi-gunicorn/
+app.mount('/metrics', make_asgi_app())
 
 class HealthGetResponse(BaseModel):
     status: str = Field(description='Server status')
     time: datetime = Field(description='Current daytime as UTC')
+    db_pool: Optional[dict[str, int]] = Field(None, description='Statistics of the PostgreSQL connection pool')
 
 
 class IndexGetResponse(BaseModel):
     number_of_batches: int = Field(description='Number of batches created in Celery queue.')
+    number_of_events: int = Field(description='Number of harvest events scheduled for processing.')
+    duration: float = Field(description='Time in seconds it took to schedule the batches.')
+    events_per_second: float = Field(description='Scheduling throughput in harvest events per second.')
+    index_name: Optional[str] = Field(None, description='Name of the new index built behind the alias (only with new_index).')
+
+
+class IndexProgressGetResponse(BaseModel):
+    harvest_run_id: str = Field(description='ID of the harvest run')
+    index_name: str = Field(description='Name of the index the batches are written to')
+    number_of_batches: int = Field(description='Number of batches scheduled for the harvest run')
+    batches_done: int = Field(description='Number of batches written')
+    batches_failed: int = Field(description='Number of batches that failed, scheduled again by /index with resume')
+    batches_remaining: int = Field(description='Number of batches neither done nor failed')
+    number_of_events: int = Field(description='Number of harvest events scheduled for the harvest run')
+    events_processed: int = Field(description='Number of harvest events in batches written')
+    events_failed: int = Field(description='Number of harvest events in failed batches')
+    events_remaining: int = Field(description='Number of harvest events in batches neither done nor failed')
+    started_at: datetime = Field(description='When the first batch was scheduled')
+    last_completed_at: Optional[datetime] = Field(None, description='When the last batch was done or failed')
+    events_per_second: float = Field(description=f'Throughput of the last {PROGRESS_RATE_WINDOW} seconds')
+    eta_seconds: Optional[float] = Field(None, description='Estimated seconds until the remaining batches are done')
+    estimated_completion: Optional[datetime] = Field(None, description='Estimated time when the remaining batches are done')
+    last_error: Optional[str] = Field(None, description='Error of the batch that failed last')
+
+
+class IndexBulkGetResponse(BaseModel):
+    group_id: str = Field(description='Id of the Celery group of all batches, see /index/bulk/status.')
+    number_of_batches: int = Field(description='Number of batches created in Celery queue.')
+    number_of_events: int = Field(description='Number of harvest events scheduled for processing.')
+    duration: float = Field(description='Time in seconds it took to schedule the batches.')
+    harvest_runs: dict[str, IndexGetResponse] = Field(description='Scheduled batches and events by harvest run id.')
+    failed: dict[str, str] = Field(description='Errors by id of the harvest runs that could not be scheduled.')
+
+
+class IndexBulkStatusGetResponse(BaseModel):
+    group_id: str = Field(description='Id of the Celery group of all batches')
+    number_of_batches: int = Field(description='Number of batches in the group')
+    batches_succeeded: int = Field(description='Number of batches that succeeded')
+    batches_failed: int = Field(description='Number of batches that failed')
+    ready: bool = Field(description='Whether all batches are done')
+
+
+class ReindexGetResponse(BaseModel):
+    task_id: str = Field(description='Id of the Celery task rebuilding the index, see flower.')
 
 
 class AdditionalMetadataParams(BaseModel):
@@ -99,6 +215,25 @@ class HarvestEventCreateResponse(BaseModel):
     id: str
 
 
+class HarvestEventBulkItemStatus(BaseModel):
+    record_identifier: Optional[str] = Field(default=None, description='Record identifier of the harvest event if it could be read')
+    status: str = Field(description='Status of the harvest event: created|duplicate|invalid')
+    id: Optional[str] = Field(default=None, description='ID of the new harvest event if it was created')
+    detail: Optional[str] = Field(default=None, description='Reason why the harvest event was not created')
+
+
+class HarvestEventsBulkCreateResponse(BaseModel):
+    created: int = Field(description='Number of harvest events created')
+    failed: int = Field(description='Number of harvest events that were not created')
+    items: list[HarvestEventBulkItemStatus] = Field(description='Status for each harvest event in the order of the request body')
+
+
+class HarvestEventsContext(NamedTuple):
+    harvest_run_id: str
+    endpoint_id: str
+    repository_id: str
+
+
 class HarvestRunCreateRequest(BaseModel):
     harvest_url: str
 
@@ -111,6 +246,11 @@ class HarvestRun(BaseModel):
     until_date: Optional[datetime]
     started_at: Optional[datetime]
     completed_at: Optional[datetime]
+    records_harvested: int = Field(description='Number of harvest events, set when the harvest run is closed')
+    records_created: int = Field(description='Number of records created when indexing the harvest run')
+    records_updated: int = Field(description='Number of records updated when indexing the harvest run')
+    records_deleted: int = Field(description='Number of records deleted when indexing the harvest run')
+    records_unchanged: int = Field(description='Number of harvest events skipped when indexing the harvest run because their record is unchanged')
 
 
 class HarvestRunGetResponse(BaseModel):
@@ -136,14 +276,15 @@ class HarvestRunCloseResponse(BaseModel):
 
 def get_latest_harvest_run_in_db(harvest_url: Optional[str]) -> HarvestRunGetResponse:
 
-    with psycopg.connect(**connection_params, row_factory=dict_row) as conn:
+    with postgres_config.get_pool().connection() as conn:
 
         cur = conn.cursor()
 
         if harvest_url is not None:
 
             cur.execute("""
-                SELECT hr.id, hr.status, hr.from_date, hr.until_date, hr.started_at, hr.completed_at 
+                SELECT hr.id, hr.status, hr.from_date, hr.until_date, hr.started_at, hr.completed_at,
+                hr.records_harvested, hr.records_created, hr.records_updated, hr.records_deleted, hr.records_unchanged
          FROM harvest_runs hr
          JOIN endpoints e ON hr.endpoint_id = e.id
          WHERE e.harvest_url = %s
@@ -162,7 +303,12 @@ def get_latest_harvest_run_in_db(harvest_url: Optional[str]) -> HarvestRunGetRes
                     completed_at=latest_harvest_run['completed_at'],
                     from_date=latest_harvest_run['from_date'],
                     until_date=latest_harvest_run['until_date'],
-                    harvest_url=harvest_url
+                    harvest_url=harvest_url,
+                    records_harvested=latest_harvest_run['records_harvested'],
+                    records_created=latest_harvest_run['records_created'],
+                    records_updated=latest_harvest_run['records_updated'],
+                    records_deleted=latest_harvest_run['records_deleted'],
+                    records_unchanged=latest_harvest_run['records_unchanged']
                 )])
             else:
                 return HarvestRunGetResponse(harvest_runs=None)
@@ -179,10 +325,16 @@ def get_latest_harvest_run_in_db(harvest_url: Optional[str]) -> HarvestRunGetRes
             hr.from_date,
             hr.until_date,
             hr.started_at,
-            hr.completed_at
+            hr.completed_at,
+            hr.records_harvested,
+            hr.records_created,
+            hr.records_updated,
+            hr.records_deleted,
+            hr.records_unchanged
         FROM endpoints e
         JOIN LATERAL (
-            SELECT id, status, until_date, from_date, started_at, completed_at
+            SELECT id, status, until_date, from_date, started_at, completed_at,
+                records_harvested, records_created, records_updated, records_deleted, records_unchanged
             FROM harvest_runs
             WHERE endpoint_id = e.id 
             ORDER BY until_date DESC
@@ -205,7 +357,12 @@ def get_latest_harvest_run_in_db(harvest_url: Optional[str]) -> HarvestRunGetRes
                     completed_at=latest_harvest_run['completed_at'],
                     from_date=latest_harvest_run['from_date'],
                     until_date=latest_harvest_run['until_date'],
-                    harvest_url=latest_harvest_run['harvest_url']
+                    harvest_url=latest_harvest_run['harvest_url'],
+                    records_harvested=latest_harvest_run['records_harvested'],
+                    records_created=latest_harvest_run['records_created'],
+                    records_updated=latest_harvest_run['records_updated'],
+                    records_deleted=latest_harvest_run['records_deleted'],
+                    records_unchanged=latest_harvest_run['records_unchanged']
                 ))
 
             return HarvestRunGetResponse(harvest_runs=harvest_runs)
@@ -217,7 +374,7 @@ def create_harvest_run_in_db(harvest_url: str) -> HarvestRunCreateResponse:
     :param harvest_url: The new entry to be created.
     """
 
-    with psycopg.connect(**connection_params, row_factory=dict_row) as conn:
+    with postgres_config.get_pool().connection() as conn:
         cur = conn.cursor()
         # TODO: only allow one open harvest run per endpoint
         # TODO check (in one transaction):
@@ -271,16 +428,17 @@ def create_harvest_run_in_db(harvest_url: str) -> HarvestRunCreateResponse:
 
 
 def close_harvest_run_in_db(harvest_run: HarvestRunCloseRequest) -> HarvestRunCloseResponse:
-    with psycopg.connect(**connection_params, row_factory=dict_row) as conn:
+    with postgres_config.get_pool().connection() as conn:
         cur = conn.cursor()
 
         state = 'closed' if harvest_run.success else 'failed'
 
         cur.execute("""
             UPDATE harvest_runs
-            SET status = %s, started_at = %s, completed_at = %s 
+            SET status = %s, started_at = %s, completed_at = %s,
+                records_harvested = (SELECT count(*) FROM harvest_events WHERE harvest_run_id = %s)
             WHERE id = %s and status = 'open'
-        """, (state, harvest_run.started_at, harvest_run.completed_at, harvest_run.id))
+        """, (state, harvest_run.started_at, harvest_run.completed_at, harvest_run.id, harvest_run.id))
 
         cur.execute("""
             SELECT id 
@@ -303,7 +461,7 @@ def create_harvest_event_in_db(harvest_event: HarvestEventCreateRequest) -> Harv
     :param harvest_event: The new record to be created.
     """
 
-    with psycopg.connect(**connection_params, row_factory=dict_row) as conn:
+    with postgres_config.get_pool().connection() as conn:
         cur = conn.cursor()
 
         cur.execute("""
@@ -349,6 +507,120 @@ def create_harvest_event_in_db(harvest_event: HarvestEventCreateRequest) -> Harv
         return HarvestEventCreateResponse(id=str(new_harvest_event['id']))
 
 
+def resolve_harvest_events_context_in_db(harvest_event: HarvestEventCreateRequest) -> Optional[HarvestEventsContext]:
+    """
+    Resolves the ids of the open harvest run, the endpoint and the repository a harvest event belongs to.
+
+    :param harvest_event: harvest event providing harvest_run_id, harvest_url and repo_code.
+    :return: the resolved ids or None if the harvest run is not open or the endpoint or repository do not exist.
+    """
+
+    with postgres_config.get_pool().connection() as conn:
+        cur = conn.cursor()
+
+        cur.execute("""
+        SELECT hr.id AS harvest_run_id, e.id AS endpoint_id, r.id AS repository_id
+        FROM harvest_runs hr
+        JOIN endpoints e ON hr.endpoint_id = e.id
+        JOIN repositories r ON r.code = %s
+        WHERE hr.id = %s and hr.status = 'open' and e.harvest_url = %s
+        """, (harvest_event.repo_code, harvest_event.harvest_run_id, harvest_event.harvest_url))
+
+        res = cur.fetchone()
+
+        if res is None:
+            return None
+
+        return HarvestEventsContext(harvest_run_id=str(res['harvest_run_id']), endpoint_id=str(res['endpoint_id']),
+                                    repository_id=str(res['repository_id']))
+
+
+def create_harvest_events_in_db(harvest_events: list[HarvestEventCreateRequest], context: HarvestEventsContext) -> list[HarvestEventBulkItemStatus]:
+    """
+    Creates records in table harvest_events for harvest events of the same harvest run in one transaction.
+
+    The harvest events are copied into a staging table and inserted with a single statement.
+    Harvest events with malformed XML or an already existing record identifier are skipped.
+
+    :param harvest_events: harvest events to be created.
+    :param context: ids of harvest run, endpoint and repository the harvest events belong to.
+    :return: the status of each harvest event in the given order.
+    """
+
+    with postgres_config.get_pool().connection() as conn:
+        cur = conn.cursor()
+
+        cur.execute("""
+        CREATE TEMP TABLE harvest_events_staging (
+            ord INTEGER NOT NULL,
+            record_identifier VARCHAR(255) NOT NULL,
+            datestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+            raw_metadata TEXT NOT NULL,
+            additional_metadata TEXT,
+            is_deleted BOOLEAN NOT NULL
+        ) ON COMMIT DROP
+        """)
+
+        # https://www.psycopg.org/psycopg3/docs/basic/copy.html
+        with cur.copy('COPY harvest_events_staging (ord, record_identifier, datestamp, raw_metadata, additional_metadata, is_deleted) FROM STDIN') as copy:
+            for ord, harvest_event in enumerate(harvest_events):
+                copy.write_row((ord, harvest_event.record_identifier, harvest_event.datestamp, harvest_event.raw_metadata,
+                                harvest_event.additional_metadata, harvest_event.is_deleted))
+
+        cur.execute("""
+        SELECT ord FROM harvest_events_staging WHERE NOT xml_is_well_formed_document(raw_metadata)
+        """)
+        malformed = {row['ord'] for row in cur.fetchall()}
+
+        cur.execute("""
+        INSERT INTO harvest_events 
+            (record_identifier,
+            datestamp, 
+            raw_metadata,
+            additional_metadata,
+            repository_id, 
+            endpoint_id,  
+            metadata_protocol,
+            metadata_format,
+            harvest_run_id,
+            is_deleted
+            ) 
+        SELECT
+            s.record_identifier,
+            s.datestamp,
+            XMLPARSE(DOCUMENT s.raw_metadata),
+            s.additional_metadata,
+            %s,
+            %s,
+            %s,
+            %s,
+            %s,
+            s.is_deleted
+        FROM harvest_events_staging s
+        WHERE xml_is_well_formed_document(s.raw_metadata)
+        ORDER BY s.ord
+        ON CONFLICT (endpoint_id, harvest_run_id, record_identifier) DO NOTHING
+        RETURNING id, record_identifier
+        """, (context.repository_id, context.endpoint_id, 'OAI-PMH', 'XML', context.harvest_run_id))
+
+        created = {row['record_identifier']: str(row['id']) for row in cur.fetchall()}
+
+    statuses: list[HarvestEventBulkItemStatus] = []
+    for ord, harvest_event in enumerate(harvest_events):
+        if ord in malformed:
+            statuses.append(HarvestEventBulkItemStatus(record_identifier=harvest_event.record_identifier, status='invalid',
+                                                       detail='raw_metadata is not a well-formed XML document'))
+        elif harvest_event.record_identifier in created:
+            # pop: a record identifier occurring more than once is created only once
+            statuses.append(HarvestEventBulkItemStatus(record_identifier=harvest_event.record_identifier, status='created',
+                                                       id=created.pop(harvest_event.record_identifier)))
+        else:
+            statuses.append(HarvestEventBulkItemStatus(record_identifier=harvest_event.record_identifier, status='duplicate',
+                                                       detail='The record identifier already exists for the given harvest run.'))
+
+    return statuses
+
+
 def get_config_from_db() -> list[EndpointConfig]:
     """
     Returns the config for the available endpoints.
@@ -356,7 +628,7 @@ def get_config_from_db() -> list[EndpointConfig]:
     endpoints: list[EndpointConfig] = []
 
     try:
-        with psycopg.connect(**connection_params, row_factory=dict_row) as conn:
+        with postgres_config.get_pool().connection() as conn:
 
             cur = conn.cursor()
 
@@ -389,108 +661,615 @@ JOIN repositories r ON e.repository_id = r.id
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def add_index_batch(conn: Any, harvest_run_id: str, index_name: str, event_ids: list[str],
+                    number_of_bytes: Optional[int] = None) -> int:
+    """
+    Records a batch in table index_batches and commits it before the batch is put in the queue,
+    so that the worker can mark it as done in its transaction.
+
+    :param conn: connection the batch is recorded with, not used for anything else.
+    :param harvest_run_id: ID of the harvest run.
+    :param index_name: Name of the OpenSearch index the batch is written to.
+    :param event_ids: IDs of the harvest events of the batch in id order.
+    :param number_of_bytes: Size of the harvest events of the batch, if known.
+    :return: ID of the batch.
+    """
+    row = conn.execute("""
+    INSERT INTO index_batches (harvest_run_id, index_name, first_event_id, last_event_id, number_of_events, number_of_bytes)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    RETURNING id
+    """, (harvest_run_id, index_name, event_ids[0], event_ids[-1], len(event_ids), number_of_bytes)).fetchone()
+    conn.commit()
+
+    return int(row['id'])
+
+
+class BatchBudget:
+    """
+    Byte budget of the batches of /index (CELERY_BATCH_BYTES), called by `split_batches` before each batch.
+
+    If CELERY_BATCH_TARGET_SECONDS is set, the budget is tuned every BATCH_TUNING_INTERVAL batches
+    from the throughput of the workers (bytes per second of a batch) of the latest batches done in table index_batches,
+    so that a batch takes a worker about the target time. The budget moves halfway to the target at a time
+    and stays within a factor of BATCH_BYTES_TUNING_RANGE of CELERY_BATCH_BYTES, which bounds the memory a batch needs.
+    """
+
+    def __init__(self, conn: Any) -> None:
+        """
+        :param conn: connection the throughput is read with.
+        """
+        self.conn = conn
+        self.bytes = BATCH_BYTES
+        self.batches = 0
+
+    def __call__(self) -> int:
+        # the first batch uses the throughput of previous calls
+        if BATCH_BYTES > 0 and BATCH_TARGET_SECONDS > 0 and self.batches % BATCH_TUNING_INTERVAL == 0:
+            self.tune()
+
+        self.batches += 1
+
+        return self.bytes
+
+    def tune(self) -> None:
+        """
+        Moves the budget towards the number of bytes a worker writes in CELERY_BATCH_TARGET_SECONDS.
+        """
+        # uses index idx_index_batches_completed_at
+        throughput = self.conn.execute("""
+        SELECT sum(number_of_bytes)::float8 AS bytes, sum(duration)::float8 AS duration
+        FROM (
+            SELECT number_of_bytes, duration
+            FROM index_batches
+            WHERE status = 'done' AND number_of_bytes IS NOT NULL AND duration > 0
+            ORDER BY completed_at DESC
+            LIMIT %s
+        ) latest
+        """, [BATCH_TUNING_SAMPLE]).fetchone()
+        self.conn.commit()
+
+        if throughput['duration'] is None:
+            # no batches with a duration yet, e.g., with CELERY_PIPELINE
+            return
+
+        target = throughput['bytes'] / throughput['duration'] * BATCH_TARGET_SECONDS
+        tuned = min(max(int((self.bytes + target) / 2), BATCH_BYTES // BATCH_BYTES_TUNING_RANGE),
+                    BATCH_BYTES * BATCH_BYTES_TUNING_RANGE)
+
+        if tuned != self.bytes:
+            logger.info(f'Batch budget tuned from {self.bytes} to {tuned} bytes '
+                        f'({throughput["bytes"] / throughput["duration"]:.0f} bytes/s per batch)')
+            self.bytes = tuned
+
+
+def get_event_size(doc: dict[str, Any]) -> int:
+    """
+    Returns the size of a harvest event read by create_jobs_in_queue in bytes, 0 if CELERY_BATCH_BYTES is not set.
+
+    :param doc: row with the column size (by reference) or the columns of `HARVEST_EVENTS_SELECT` (by value).
+    :return: size in bytes.
+    """
+    if BATCH_BYTES <= 0:
+        return 0
+
+    if 'size' in doc:
+        return int(doc['size'])
+
+    # the XML of the harvest events passed by value is read anyway
+    return len(doc['record'].encode()) + len((doc['additional_metadata'] or '').encode())
+
+
 def create_jobs_in_queue(
     harvest_run_id: str,
-    index_name: str
-) -> int:
+    index_name: str,
+    skip_unchanged: bool = False,
+    new_index: bool = False,
+    delete_old: bool = False,
+    results: Optional[list['AsyncResult[Any]']] = None
+) -> IndexGetResponse:
     """
     Creates and enqueues transformation jobs from harvest_events table.
 
+    The harvest events are streamed from a named (server-side) cursor ordered by id,
+    so the query and the XPath extraction run only once per harvest run
+    and memory usage does not depend on the size of the harvest run.
+
+    If CELERY_BATCH_BYTES is set, a batch is closed when the next harvest event would exceed the byte budget
+    (see BatchBudget) or when it has CELERY_BATCH_SIZE harvest events, so that batches of large records
+    do not exhaust the memory of the workers and batches of small records are not too short.
+
+    Unless CELERY_PIPELINE is set, each batch is recorded in table index_batches as a range of harvest event ids,
+    see resume_jobs_in_queue and get_index_progress_in_db.
+
     :param harvest_run_id: ID of the harvest run the harvest events belong to.
     :param index_name: Name of the OpenSearch index to use.
-    :return: Number of batches scheduled for processing.
+    :param skip_unchanged: If True, harvest events whose record is already synced with the same content are skipped.
+    :param new_index: If True, index_name is an alias and the batches are written to a new index,
+        which replaces the index behind the alias when all batches are done (blue/green build).
+    :param delete_old: If True, the indices the alias pointed to before are deleted (only with new_index).
+    :param results: If given, the results of the batches are stored and their AsyncResults are appended to it
+        to track their completion, see index_harvest_runs (not with new_index).
+    :return: Number of batches and events scheduled for processing.
     """
 
-    batch: list[HarvestEventQueue] = []
     tasks = 0
-    offset = 0
-    limit = BATCH_SIZE
-    fetch = True
-
-    logger.info(f'Preparing jobs for index: {index_name}')
+    events = 0
+
+    # with new_index, the batches are written to a new index and searches keep using the index behind the alias until
+    # finalize_index_build publishes the new index; the batches are collected in a chord to run it when all are done
+    # https://docs.celeryq.dev/en/stable/userguide/canvas.html#chords
+    alias = index_name
+    if new_index:
+        index_name = get_versioned_index_name(alias)
+    header: list[Any] = []
+
+    logger.info(f'Preparing jobs for index: {index_name} (pass by reference: {PASS_BY_REFERENCE}, pipeline: {PIPELINE}, '
+                f'new index: {new_index}, batch bytes: {BATCH_BYTES})')
+
+    # first task of the pipeline or single task
+    # sent by name, see celery_app
+    by_ids_task = NORMALIZE_BATCH_BY_IDS if PIPELINE else TRANSFORM_BATCH_BY_IDS
+    by_value_task = NORMALIZE_BATCH if PIPELINE else TRANSFORM_BATCH
+
+    started = time.perf_counter()
+
+    with postgres_config.get_pool().connection() as conn, postgres_config.get_pool().connection() as batches_conn, \
+            measure_stage('schedule', harvest_run_id=harvest_run_id):
+
+        # the workers add the numbers of each batch
+        conn.execute("""
+        UPDATE harvest_runs
+        SET records_created = 0, records_updated = 0, records_deleted = 0, records_unchanged = 0
+        WHERE id = %s
+        """, [harvest_run_id])
+        # batches of a previous /index of the harvest run
+        conn.execute('DELETE FROM index_batches WHERE harvest_run_id = %s', [harvest_run_id])
+        conn.commit()
+
+        # https://www.psycopg.org/psycopg3/docs/advanced/cursors.html#server-side-cursors
+        with conn.cursor(name='create_jobs_in_queue') as cur:
+            cur.itersize = BATCH_SIZE
+
+            # uses index idx_harvest_events_harvest_run_id_id to read the events in id order
+            if PASS_BY_REFERENCE or new_index:
+                # only ids are put in the queue, the worker fetches the events itself
+                # (the batches of a chord are kept in memory until the chord is sent)
+                size = f', {HARVEST_EVENT_SIZE} AS size' if BATCH_BYTES > 0 else ''
+                cur.execute(f"""
+                SELECT he.id{size}
+                FROM harvest_events he
+                JOIN harvest_runs hr ON he.harvest_run_id = hr.id 
+                WHERE he.harvest_run_id = %s and hr.status = 'closed' 
+                ORDER BY he.id
+                """, [harvest_run_id])
+            else:
+                cur.execute(HARVEST_EVENTS_SELECT + """
+                WHERE he.harvest_run_id = %s and hr.status = 'closed' 
+                ORDER BY he.id
+                """, [harvest_run_id])
 
+            # https://docs.celeryq.dev/en/stable/getting-started/first-steps-with-celery.html#keeping-results
+            options: dict[str, Any] = {} if results is None else {'ignore_result': False}
+
+            # the cursor fetches itersize rows at a time
+            for docs, batch_bytes in split_batches(cur, BATCH_SIZE, BatchBudget(batches_conn), get_event_size):
+                if schedule_rate_limiter is not None:
+                    schedule_rate_limiter.acquire()
+
+                batch_size = f' ({batch_bytes} bytes)' if BATCH_BYTES > 0 else ''
+                logger.info(f'Putting batch of {len(docs)}{batch_size} in queue ({events} events scheduled so far)')
+
+                event_ids = [str(doc['id']) for doc in docs]
+                # the batches of the pipeline are not tracked since they are written by several tasks
+                batch_args = [] if PIPELINE else [new_index, add_index_batch(batches_conn, harvest_run_id, index_name, event_ids,
+                                                                             batch_bytes if BATCH_BYTES > 0 else None)]
+
+                if new_index:
+                    # the results of the batches are stored so that the chord can tell when all are done
+                    header.append(celery_app.signature(TRANSFORM_BATCH_BY_IDS,
+                                                       args=[event_ids, index_name, harvest_run_id, skip_unchanged,
+                                                             *batch_args],
+                                                       options={'ignore_result': False}))
+                else:
+                    if PASS_BY_REFERENCE:
+                        result = celery_app.send_task(by_ids_task, args=[event_ids, index_name, harvest_run_id, skip_unchanged,
+                                                                         *batch_args], **options)
+                    else:
+                        result = celery_app.send_task(by_value_task, args=[[harvest_event_from_row(doc) for doc in docs],
+                                                                           index_name, harvest_run_id, skip_unchanged,
+                                                                           *batch_args], **options)
+                    if results is not None:
+                        results.append(result)
+
+                tasks += 1
+                events += len(docs)
+                SCHEDULED_BATCHES.inc()
+                SCHEDULED_EVENTS.inc(len(docs))
+
+    if new_index:
+        # the records of other harvest runs are added and the alias is flipped by the body of the chord
+        chord(header)(celery_app.signature(FINALIZE_INDEX_BUILD, args=[alias, index_name, delete_old]))
+
+    duration = time.perf_counter() - started
+    events_per_second = events / duration if duration > 0 else 0.0
+
+    logger.info(f'Scheduled {events} events in {tasks} batches in {duration:.2f}s ({events_per_second:.1f} events/s)')
+
+    return IndexGetResponse(number_of_batches=tasks, number_of_events=events, duration=duration,
+                            events_per_second=events_per_second, index_name=index_name if new_index else None)
+
+
+def resume_jobs_in_queue(
+    harvest_run_id: str,
+    index_name: str,
+    skip_unchanged: bool = False,
+    new_index: bool = False,
+    delete_old: bool = False
+) -> IndexGetResponse:
+    """
+    Puts the batches of the latest /index of a harvest run that are not done (failed or lost, e.g., when a worker crashed)
+    in the queue again, with the harvest events of their ranges in table index_batches.
+    The harvest events are passed by reference. Batches that are still queued or running are scheduled again as well.
 
-    with psycopg.connect(**connection_params, row_factory=dict_row) as conn:
+    :param harvest_run_id: ID of the harvest run the harvest events belong to.
+    :param index_name: Name of the OpenSearch index (the alias with new_index) given to the /index to resume.
+    :param skip_unchanged: If True, harvest events whose record is already synced with the same content are skipped.
+    :param new_index: If True, the new index of the /index to resume is completed and published, see create_jobs_in_queue.
+    :param delete_old: If True, the indices the alias pointed to before are deleted (only with new_index).
+    :return: Number of batches and events scheduled for processing.
+    """
+    tasks = 0
+    events = 0
+    alias = index_name
+    header: list[Any] = []
 
+    started = time.perf_counter()
 
+    with postgres_config.get_pool().connection() as conn, measure_stage('schedule', harvest_run_id=harvest_run_id):
         cur = conn.cursor()
-        while fetch:
 
-            cur.execute("""
-            SELECT he.id, 
-            he.repository_id,
-            r.code, 
-            he.endpoint_id, 
-            e.harvest_url,
-            he.record_identifier, 
-            (
-                xpath('/oai:record', he.raw_metadata, '{{oai, http://www.openarchives.org/OAI/2.0/},{datacite, http://datacite.org/schema/kernel-4}}')
-            )[1] AS record,
-            he.additional_metadata,
-            he.is_deleted,
-            he.datestamp
-        FROM harvest_events he
-        JOIN harvest_runs hr ON he.harvest_run_id = hr.id 
-        JOIN endpoints e ON he.endpoint_id = e.id
-        JOIN repositories r ON he.repository_id = r.id
-            WHERE harvest_run_id = %s and hr.status = 'closed' 
-            ORDER BY he.id
-            LIMIT %s
-            OFFSET %s
-            """, (harvest_run_id, limit, offset))
+        cur.execute("""
+        SELECT id, index_name, first_event_id, last_event_id, status
+        FROM index_batches
+        WHERE harvest_run_id = %s
+        ORDER BY first_event_id
+        """, [harvest_run_id])
+        batches = cur.fetchall()
 
-            for doc in cur.fetchall():
-                # https://www.psycopg.org/psycopg3/docs/basic/adapt.html#uuid-adaptation
-                # https://docs.python.org/3/library/uuid.html#uuid.UUID
-                # str(uuid) returns a string in the form 12345678-1234-5678-1234-567812345678 where the 32 hexadecimal digits represent the UUID.
-                batch.append(
-                    HarvestEventQueue(id=str(doc['id']), xml=doc['record'], repository_id=str(doc['repository_id']),
-                                      endpoint_id=str(doc['endpoint_id']), record_identifier=doc['record_identifier'],
-                                      code=doc['code'], harvest_url=doc['harvest_url'],
-                                      additional_metadata=doc['additional_metadata'], is_deleted=doc['is_deleted'],
-                                      datestamp=doc['datestamp'].strftime('%Y-%m-%d %H:%M:%S.%f%z'))
-                )
-
-            if len(batch) == 0:
-                # batch is empty
-                break
+        if len(batches) == 0:
+            raise ValueError(f'No batches recorded for harvest run {harvest_run_id}, start it without resume.')
+
+        # the index the batches were written to, a versioned index behind the alias with new_index
+        index_name = batches[0]['index_name']
+        if index_name != alias and not (new_index and index_name.startswith(f'{alias}_')):
+            raise ValueError(f'Harvest run {harvest_run_id} was indexed into {index_name}, not {alias}'
+                             f'{" (new_index)" if new_index else ""}.')
+
+        pending = [batch for batch in batches if batch['status'] != 'done']
+        logger.info(f'Resuming {len(pending)} of {len(batches)} batches of harvest run {harvest_run_id} in {index_name}')
+
+        cur.execute("""
+        UPDATE index_batches
+        SET status = 'scheduled', scheduled_at = now(), completed_at = NULL, error = NULL
+        WHERE id = ANY(%s)
+        """, [[batch['id'] for batch in pending]])
+        conn.commit()
+
+        for batch in pending:
+            if schedule_rate_limiter is not None:
+                schedule_rate_limiter.acquire()
+
+            # uses index idx_harvest_events_harvest_run_id_id
+            cur.execute("""
+            SELECT id
+            FROM harvest_events
+            WHERE harvest_run_id = %s AND id BETWEEN %s AND %s
+            ORDER BY id
+            """, (harvest_run_id, batch['first_event_id'], batch['last_event_id']))
+            event_ids = [str(row['id']) for row in cur.fetchall()]
+
+            args = [event_ids, index_name, harvest_run_id, skip_unchanged, new_index, batch['id']]
+            if new_index:
+                header.append(celery_app.signature(TRANSFORM_BATCH_BY_IDS, args=args, options={'ignore_result': False}))
+            else:
+                celery_app.send_task(TRANSFORM_BATCH_BY_IDS, args=args)
 
-            # https://docs.celeryq.dev/en/stable/getting-started/first-steps-with-celery.html#keeping-results
-            logger.info(f'Putting batch of {len(batch)} in queue with offset {offset}')
-            transform_batch.delay(batch, index_name)
             tasks += 1
+            events += len(event_ids)
+            SCHEDULED_BATCHES.inc()
+            SCHEDULED_EVENTS.inc(len(event_ids))
+
+    if new_index:
+        chord(header)(celery_app.signature(FINALIZE_INDEX_BUILD, args=[alias, index_name, delete_old]))
+
+    duration = time.perf_counter() - started
+    events_per_second = events / duration if duration > 0 else 0.0
+
+    logger.info(f'Scheduled {events} events in {tasks} batches again in {duration:.2f}s')
+
+    return IndexGetResponse(number_of_batches=tasks, number_of_events=events, duration=duration,
+                            events_per_second=events_per_second, index_name=index_name if new_index else None)
+
+
+def get_latest_closed_harvest_run_ids_in_db() -> list[str]:
+    """
+    Returns the latest closed harvest run of every endpoint.
+
+    :return: IDs of the harvest runs.
+    """
+    with postgres_config.get_pool().connection() as conn:
+        cur = conn.cursor()
+
+        cur.execute("""
+        SELECT hr.id
+        FROM endpoints e
+        JOIN LATERAL (
+            SELECT id
+            FROM harvest_runs
+            WHERE endpoint_id = e.id AND status = 'closed'
+            ORDER BY until_date DESC
+            LIMIT 1
+        ) hr ON true
+        """)
+
+        return [str(row['id']) for row in cur.fetchall()]
+
+
+def index_harvest_runs(harvest_run_ids: list[str], index_name: str, skip_unchanged: bool = False) -> IndexBulkGetResponse:
+    """
+    Schedules the batches of several harvest runs, INDEX_BULK_CONCURRENCY harvest runs in parallel
+    (the rate is limited by CELERY_SCHEDULE_RATE_LIMIT for all of them together).
+    The results of the batches are stored as Celery group whose completion can be queried with get_index_bulk_status.
+
+    :param harvest_run_ids: IDs of the harvest runs.
+    :param index_name: Name of the OpenSearch index to use.
+    :param skip_unchanged: If True, harvest events whose record is already synced with the same content are skipped.
+    :return: Number of batches and events scheduled per harvest run and the id of the group.
+    """
+    started = time.perf_counter()
+    # list.append is thread-safe
+    results: list['AsyncResult[Any]'] = []
+
+    def schedule(harvest_run_id: str) -> IndexGetResponse:
+        return create_jobs_in_queue(harvest_run_id, index_name, skip_unchanged, results=results)
+
+    scheduled: dict[str, IndexGetResponse] = {}
+    failed: dict[str, str] = {}
+
+    with ThreadPoolExecutor(max_workers=INDEX_BULK_CONCURRENCY, thread_name_prefix='index_bulk') as executor:
+        futures = {harvest_run_id: executor.submit(schedule, harvest_run_id) for harvest_run_id in dict.fromkeys(harvest_run_ids)}
+
+        for harvest_run_id, future in futures.items():
+            try:
+                scheduled[harvest_run_id] = future.result()
+            except Exception as e:
+                # the other harvest runs are scheduled anyway
+                logger.exception(f'Scheduling harvest run {harvest_run_id} failed')
+                failed[harvest_run_id] = str(e)
+
+    # https://docs.celeryq.dev/en/stable/reference/celery.result.html#celery.result.GroupResult
+    group_result = GroupResult(str(uuid.uuid4()), results, app=celery_app)
+    group_result.save()
+
+    duration = time.perf_counter() - started
+    logger.info(f'Scheduled {len(scheduled)} harvest runs ({len(failed)} failed) in {len(results)} batches '
+                f'in {duration:.2f}s, group {group_result.id}')
+
+    return IndexBulkGetResponse(group_id=group_result.id, number_of_batches=len(results),
+                                number_of_events=sum(response.number_of_events for response in scheduled.values()),
+                                duration=duration, harvest_runs=scheduled, failed=failed)
+
+
+def get_index_bulk_status(group_id: str) -> Optional[IndexBulkStatusGetResponse]:
+    """
+    Reports the completion of the batches scheduled by index_harvest_runs from the result backend.
+
+    :param group_id: ID of the group.
+    :return: numbers of batches by state, None if the group is not found (e.g., expired).
+    """
+    group_result = GroupResult.restore(group_id, app=celery_app)
+
+    if group_result is None:
+        return None
+
+    states = [result.state for result in group_result.results]
 
-            # increment offset by limit
-            offset += limit
-            # will be false if query returned fewer results than limit
-            fetch = len(batch) == limit
-            # fetch = False
-            batch = []
+    return IndexBulkStatusGetResponse(group_id=group_id, number_of_batches=len(states),
+                                      batches_succeeded=states.count('SUCCESS'), batches_failed=states.count('FAILURE'),
+                                      ready=all(state in ('SUCCESS', 'FAILURE', 'REVOKED') for state in states))
 
-    return tasks
+
+def get_index_progress_in_db(harvest_run_id: str) -> Optional[IndexProgressGetResponse]:
+    """
+    Reports the progress of the latest /index of a harvest run from table index_batches.
+    The ETA is calculated from the throughput of the batches done in the last PROGRESS_RATE_WINDOW seconds.
+
+    :param harvest_run_id: ID of the harvest run.
+    :return: the progress, None if no batches are recorded for the harvest run.
+    """
+    with postgres_config.get_pool().connection() as conn:
+        cur = conn.cursor()
+
+        cur.execute("""
+        SELECT
+            min(index_name) AS index_name,
+            count(*) AS batches,
+            count(*) FILTER (WHERE status = 'done') AS batches_done,
+            count(*) FILTER (WHERE status = 'failed') AS batches_failed,
+            coalesce(sum(number_of_events), 0) AS events,
+            coalesce(sum(number_of_events) FILTER (WHERE status = 'done'), 0) AS events_done,
+            coalesce(sum(number_of_events) FILTER (WHERE status = 'failed'), 0) AS events_failed,
+            min(scheduled_at) AS started_at,
+            max(completed_at) AS last_completed_at,
+            now() AS now
+        FROM index_batches
+        WHERE harvest_run_id = %s
+        """, [harvest_run_id])
+        progress = cur.fetchone()
+
+        if progress is None or progress['batches'] == 0:
+            return None
+
+        # the throughput since the start if it is more recent, e.g., of a resumed run
+        window_start = max(progress['started_at'], progress['now'] - timedelta(seconds=PROGRESS_RATE_WINDOW))
+        cur.execute("""
+        SELECT coalesce(sum(number_of_events), 0) AS events
+        FROM index_batches
+        WHERE harvest_run_id = %s AND status = 'done' AND completed_at >= %s
+        """, (harvest_run_id, window_start))
+        recent = cur.fetchone()
+
+        cur.execute("""
+        SELECT error
+        FROM index_batches
+        WHERE harvest_run_id = %s AND status = 'failed'
+        ORDER BY completed_at DESC
+        LIMIT 1
+        """, [harvest_run_id])
+        last_failed = cur.fetchone()
+
+    elapsed = (progress['now'] - window_start).total_seconds()
+    events_per_second = recent['events'] / elapsed if recent is not None and elapsed > 0 else 0.0
+    events_remaining = progress['events'] - progress['events_done'] - progress['events_failed']
+
+    eta_seconds: Optional[float] = None
+    if events_remaining == 0:
+        eta_seconds = 0.0
+    elif events_per_second > 0:
+        eta_seconds = events_remaining / events_per_second
+
+    return IndexProgressGetResponse(
+        harvest_run_id=harvest_run_id,
+        index_name=progress['index_name'],
+        number_of_batches=progress['batches'],
+        batches_done=progress['batches_done'],
+        batches_failed=progress['batches_failed'],
+        batches_remaining=progress['batches'] - progress['batches_done'] - progress['batches_failed'],
+        number_of_events=progress['events'],
+        events_processed=progress['events_done'],
+        events_failed=progress['events_failed'],
+        events_remaining=events_remaining,
+        started_at=progress['started_at'],
+        last_completed_at=progress['last_completed_at'],
+        events_per_second=events_per_second,
+        eta_seconds=eta_seconds,
+        estimated_completion=progress['now'] + timedelta(seconds=eta_seconds) if eta_seconds is not None else None,
+        last_error=last_failed['error'] if last_failed is not None else None
+    )
 
 
 @app.get('/index', tags=['index'])
 def init_index(
     harvest_run_id: str = Query(default=None, description='Id of the harvest run to be indexed'),
-    index_name: str = Query(default=None, description='Name of the OpenSearch index to use for indexing')
+    index_name: str = Query(default=None, description='Name of the OpenSearch index to use for indexing'),
+    skip_unchanged: bool = Query(default=False, description='Skip harvest events whose record is already indexed with the same content. '
+                                                            'Only use with an index that already contains the records.'),
+    new_index: bool = Query(default=False, description='Build a new index and point the alias index_name to it when all batches are done. '
+                                                       'Searches keep using the current index until then.'),
+    delete_old: bool = Query(default=False, description='Delete the indices the alias pointed to before (only with new_index).'),
+    resume: bool = Query(default=False, description='Only schedule the batches of the previous /index of the harvest run that are not done. '
+                                                    'Use the same parameters as before and make sure its batches are no longer queued.')
 ) -> IndexGetResponse:
+    if new_index and PIPELINE:
+        raise HTTPException(status_code=400, detail='new_index is not supported with CELERY_PIPELINE, use /reindex after indexing instead.')
+    if resume and PIPELINE:
+        raise HTTPException(status_code=400, detail='resume is not supported with CELERY_PIPELINE.')
+
     # this long-running method is synchronous and runs in an external threadpool, see https://fastapi.tiangolo.com/async/#path-operation-functions
     # this way, it does not block the server
     try:
-        results = create_jobs_in_queue(harvest_run_id, index_name)
+        if resume:
+            results = resume_jobs_in_queue(harvest_run_id, index_name, skip_unchanged, new_index, delete_old)
+        else:
+            results = create_jobs_in_queue(harvest_run_id, index_name, skip_unchanged, new_index, delete_old)
+    except ValueError as e:
+        logger.exception('Indexing failed')
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("Indexing failed")
         raise HTTPException(status_code=500, detail=str(e))
 
     logger.info(f'Got results: {results}')
-    return IndexGetResponse(number_of_batches=results)
+    return results
+
+
+@app.get('/index/bulk', tags=['index'], summary='Start the transformation of several harvest runs')
+def init_index_bulk(
+    harvest_run_id: Optional[list[str]] = Query(default=None, description='Ids of the harvest runs to be indexed'),
+    latest: bool = Query(default=False, description='Index the latest closed harvest run of every endpoint (instead of harvest_run_id)'),
+    index_name: str = Query(description='Name of the OpenSearch index to use for indexing'),
+    skip_unchanged: bool = Query(default=False, description='Skip harvest events whose record is already indexed with the same content. '
+                                                            'Only use with an index that already contains the records.')
+) -> IndexBulkGetResponse:
+    # the group would only track the first stage of the pipeline
+    if PIPELINE:
+        raise HTTPException(status_code=400, detail='/index/bulk is not supported with CELERY_PIPELINE, use /index per harvest run instead.')
+    if latest == bool(harvest_run_id):
+        raise HTTPException(status_code=400, detail='Either harvest_run_id or latest=true must be given.')
+
+    try:
+        harvest_run_ids = get_latest_closed_harvest_run_ids_in_db() if latest else harvest_run_id or []
+        results = index_harvest_runs(harvest_run_ids, index_name, skip_unchanged)
+    except Exception as e:
+        logger.exception('Indexing failed')
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return results
+
+
+@app.get('/index/bulk/status', tags=['index'], summary='Get the completion of the batches scheduled by /index/bulk')
+def get_index_bulk(
+    group_id: str = Query(description='Id of the group returned by /index/bulk')
+) -> IndexBulkStatusGetResponse:
+    try:
+        status = get_index_bulk_status(group_id)
+    except Exception as e:
+        logger.exception(f'An error occurred when getting group {group_id}: {e}')
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if status is None:
+        raise HTTPException(status_code=404, detail=f'Group {group_id} not found.')
+
+    return status
+
+
+@app.get('/index/progress', tags=['index'], summary='Get the progress of the latest /index of a harvest run')
+def get_index_progress(
+    harvest_run_id: str = Query(description='Id of the harvest run being indexed')
+) -> IndexProgressGetResponse:
+    try:
+        progress = get_index_progress_in_db(harvest_run_id)
+    except Exception as e:
+        logger.exception(f'An error occurred when getting the progress of harvest run {harvest_run_id}: {e}')
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if progress is None:
+        raise HTTPException(status_code=404, detail=f'No batches recorded for harvest run {harvest_run_id}.')
+
+    return progress
+
+
+@app.get('/reindex', tags=['index'], summary='Rebuild an index from the records table')
+def init_reindex(
+    index_name: str = Query(description='Name of the alias searches use, e.g., INDEX_NAME. '
+                                        'An existing index with this name is replaced by the alias.'),
+    delete_old: bool = Query(default=False, description='Delete the indices the alias pointed to before.')
+) -> ReindexGetResponse:
+    # the normalized records and their embeddings are read from PostgreSQL, the harvest events are not processed again
+    try:
+        result = celery_app.send_task(REINDEX_RECORDS, args=[index_name, delete_old])
+    except Exception as e:
+        logger.exception('Reindexing failed')
+        raise HTTPException(status_code=500, detail=str(e))
+
+    logger.info(f'Reindexing {index_name} in task {result.id}')
+    return ReindexGetResponse(task_id=result.id)
 
 
 @app.get('/health', tags=['health'], summary='Get health status')
 def get_health() -> HealthGetResponse:
     logger.info('health route called')
-    return HealthGetResponse(status='ok', time=datetime.now(timezone.utc))
+    return HealthGetResponse(status='ok', time=datetime.now(timezone.utc), db_pool=postgres_config.get_pool_stats())
 
 
 @app.get('/config', tags=['config'], summary='Get configs of available endpoints')
@@ -516,6 +1295,101 @@ def create_harvest_event(harvest_event: HarvestEventCreateRequest) -> HarvestEve
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def read_harvest_events(request: Request) -> AsyncIterator[bytes | dict[str, Any]]:
+    """
+    Reads harvest events from the request body, either a JSON array or NDJSON (one harvest event per line).
+    NDJSON is read while it is streamed.
+
+    :param request: the request.
+    :return: the harvest events as unparsed JSON lines or dicts.
+    """
+    if request.headers.get('content-type', '').startswith('application/json'):
+        harvest_events = json.loads(await request.body())
+
+        if not isinstance(harvest_events, list):
+            raise HTTPException(status_code=400, detail='Request body must be a JSON array of harvest events.')
+
+        for harvest_event in harvest_events:
+            yield harvest_event
+    else:
+        buffer = b''
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                if line.strip():
+                    yield line
+
+        if buffer.strip():
+            yield buffer
+
+
+@app.post('/harvest_events', tags=['harvest_event'], summary='Register harvest events of a harvest run in bulk',
+          description='Accepts NDJSON (application/x-ndjson) or a JSON array (application/json) of harvest events '
+                      'that all belong to the same harvest run, endpoint and repository. '
+                      f'Harvest events are written in transactions of {HARVEST_EVENTS_CHUNK_SIZE}.')
+async def create_harvest_events(request: Request) -> HarvestEventsBulkCreateResponse:
+    items: list[HarvestEventBulkItemStatus] = []
+    # position in items and harvest event of the current chunk
+    chunk: list[tuple[int, HarvestEventCreateRequest]] = []
+    context: Optional[HarvestEventsContext] = None
+    first: Optional[HarvestEventCreateRequest] = None
+
+    async def write_chunk(ctx: HarvestEventsContext) -> None:
+        statuses = await run_in_threadpool(create_harvest_events_in_db, [harvest_event for _, harvest_event in chunk], ctx)
+        for (pos, _), status in zip(chunk, statuses):
+            items[pos] = status
+        chunk.clear()
+
+    try:
+        async for doc in read_harvest_events(request):
+            try:
+                harvest_event = HarvestEventCreateRequest.model_validate_json(doc) if isinstance(doc, bytes) \
+                    else HarvestEventCreateRequest.model_validate(doc)
+            except ValidationError as e:
+                items.append(HarvestEventBulkItemStatus(status='invalid', detail=str(e)))
+                continue
+
+            if first is None:
+                # resolve ids once for the whole request
+                first = harvest_event
+                context = await run_in_threadpool(resolve_harvest_events_context_in_db, harvest_event)
+                if context is None:
+                    raise HTTPException(status_code=400,
+                                        detail='Harvest run is not open or endpoint or repository do not exist.')
+
+            if (harvest_event.harvest_run_id, harvest_event.harvest_url, harvest_event.repo_code) != (
+                    first.harvest_run_id, first.harvest_url, first.repo_code):
+                items.append(HarvestEventBulkItemStatus(record_identifier=harvest_event.record_identifier, status='invalid',
+                                                        detail='All harvest events must belong to the same harvest run, endpoint and repository.'))
+                continue
+
+            # placeholder, replaced when the chunk is written
+            items.append(HarvestEventBulkItemStatus(record_identifier=harvest_event.record_identifier, status='invalid'))
+            chunk.append((len(items) - 1, harvest_event))
+
+            if context is not None and len(chunk) == HARVEST_EVENTS_CHUNK_SIZE:
+                await write_chunk(context)
+
+        if context is not None and chunk:
+            await write_chunk(context)
+
+    except HTTPException:
+        raise
+    except JSONDecodeError as e:
+        logger.exception(f'Request body could not be parsed: {e}')
+        raise HTTPException(status_code=400, detail=f'Request body could not be parsed: {e}')
+    except Exception as e:
+        logger.exception(f'An error occurred when creating harvest events: {e}')
+        created = len([item for item in items if item.status == 'created'])
+        raise HTTPException(status_code=500, detail=f'{e} ({created} harvest events were created before the error occurred)')
+
+    created = len([item for item in items if item.status == 'created'])
+    logger.info(f'Created {created} of {len(items)} harvest events in bulk')
+
+    return HarvestEventsBulkCreateResponse(created=created, failed=len(items) - created, items=items)
+
+
 @app.get('/harvest_run', tags=['harvest_run'],
          summary='Get id and status of the latest harvest run for a given endpoint.',
          description='If no harvest run exists for the given endpoint, id and status will be null in the response.')
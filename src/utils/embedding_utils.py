@@ -1,18 +1,38 @@
+import hashlib
 from pathlib import Path
-from typing import Any, NamedTuple, Optional
-from fastembed import TextEmbedding
+from typing import Any, Callable, NamedTuple, Optional, TYPE_CHECKING
 from numpy import ndarray
 from .queue_utils import HarvestEventQueue
 
+if TYPE_CHECKING:
+    from fastembed import TextEmbedding
+
 class SourceWithEmbeddingText(NamedTuple):
     src: dict[str, Any] # 0, source document
     textToEmbed: str # 1, text to be embedded
     event: HarvestEventQueue # 2, original harvest event
+    content_hash: Optional[str] = None # 3, hash of the harvested content, see normalize_datacite_xml.get_content_hash
 
 
 class OpenSearchSourceWithEmbedding(NamedTuple):
     src: dict[str, Any]
     harvest_event: HarvestEventQueue
+    embedding_text_hash: Optional[str] = None # SHA-256 of the embedded text
+    content_hash: Optional[str] = None # hash of the harvested content
+
+
+# given the hashes of embedding texts, returns the embeddings already known for them
+EmbeddingCacheLookup = Callable[[list[str]], dict[str, ndarray[Any]]]
+
+
+def get_embedding_text_hash(text: str) -> str:
+    """
+    Calculates the key of an embedding text in the embedding cache.
+
+    :param text: the text to be embedded.
+    :return: the SHA-256 hex digest of the text.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
 
 
 def get_embedding_text_from_fields(source: dict[str, Any]) -> str:
@@ -42,8 +62,8 @@ def extract_fields_from_source(source: dict[str, Any], field_name: str, subfield
     else:
         return []
 
-def create_opensearch_source(src: dict[str, Any], embedding: ndarray[Any], batch_ele: SourceWithEmbeddingText,
-                             embedding_field_name: str) -> OpenSearchSourceWithEmbedding:
+def create_opensearch_source(src: dict[str, Any], embedding: ndarray[Any] | list[float], batch_ele: SourceWithEmbeddingText,
+                             embedding_field_name: str, embedding_text_hash: Optional[str] = None) -> OpenSearchSourceWithEmbedding:
     """
 
 
@@ -51,35 +71,52 @@ def create_opensearch_source(src: dict[str, Any], embedding: ndarray[Any], batch
     :param embedding: embeddings to be added to source
     :param batch_ele: original element in batch
     :param embedding_field_name: name to be used for embedding field
+    :param embedding_text_hash: hash of the embedded text
     """
 
     return OpenSearchSourceWithEmbedding(src={
         **src,
-        embedding_field_name: embedding.tolist(),
+        # kept as array, see json_utils.dumps_document
+        embedding_field_name: embedding,
         '_additional_metadata': batch_ele.event.additional_metadata,
         '_repo': batch_ele.event.code,
         '_harvest_url': batch_ele.event.harvest_url
-    }, harvest_event=batch_ele.event)
+    }, harvest_event=batch_ele.event, embedding_text_hash=embedding_text_hash, content_hash=batch_ele.content_hash)
 
 
-def add_embeddings_to_source(batch: list[SourceWithEmbeddingText], embedding_model: TextEmbedding, embedding_field_name: str = 'emb') -> list[OpenSearchSourceWithEmbedding]:
+def add_embeddings_to_source(batch: list[SourceWithEmbeddingText], embedding_model: 'TextEmbedding', embedding_field_name: str = 'emb',
+                             embedding_cache: Optional[EmbeddingCacheLookup] = None,
+                             embed_params: Optional[dict[str, Any]] = None) -> list[OpenSearchSourceWithEmbedding]:
     """
     Given a batch of `SourceWithEmbeddingText`, calculates the embeddings and returns the documents with the embeddings (integrated).
+    Identical texts are only embedded once per batch.
 
     :param batch: a batch of source documents with their embedding texts.
     :param embedding_model: the model to be used for embedding.
     :param embedding_field_name: name of the embedding field in the source document.
+    :param embedding_cache: lookup of already calculated embeddings by text hash, only texts not found are embedded.
+    :param embed_params: parameters for the model's embed method, e.g., batch_size and parallel (see `EmbeddingConfig`).
     """
-    embedding_texts = [ele.textToEmbed for ele in batch]
-    embeddings = list(embedding_model.embed(embedding_texts))
+    hashes = [get_embedding_text_hash(ele.textToEmbed) for ele in batch]
+
+    # dict preserves insertion order, so the texts to embed are in the order of the batch
+    unique_texts = dict(zip(hashes, (ele.textToEmbed for ele in batch)))
 
-    if len(embeddings) != len(batch):
+    embeddings: dict[str, ndarray[Any] | list[float]] = {}
+    if embedding_cache is not None and len(unique_texts) > 0:
+        embeddings.update(embedding_cache(list(unique_texts)))
+
+    missing = [text_hash for text_hash in unique_texts if text_hash not in embeddings]
+    calculated = list(embedding_model.embed([unique_texts[text_hash] for text_hash in missing], **(embed_params or {}))) \
+        if len(missing) > 0 else []
+
+    if len(calculated) != len(missing):
         raise ValueError("Embedding model returned an unexpected number of vectors.")
 
-    return [create_opensearch_source(batch_ele.src, emb_ele, batch_ele, embedding_field_name) for batch_ele, emb_ele in zip(
-        batch, # original batch
-        embeddings  # embeddings
-    )]
+    embeddings.update(zip(missing, calculated))
+
+    return [create_opensearch_source(batch_ele.src, embeddings[text_hash], batch_ele, embedding_field_name, text_hash)
+            for batch_ele, text_hash in zip(batch, hashes)]
 
 
 def preprocess_batch(batch: list[dict[str, Any]], index_name: str) -> list[dict[str, Any]]:
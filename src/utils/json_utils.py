@@ -0,0 +1,74 @@
+from typing import Any, NamedTuple
+import numpy as np
+import orjson
+
+# numpy arrays (the embeddings) are serialized directly instead of being converted to lists of floats first
+# https://github.com/ijl/orjson#numpy
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+
+class SerializedDocument(NamedTuple):
+    source: str # OpenSearch document with embedding
+    datacite_json: str # the same document without embedding, for records.datacite_json
+
+
+def default(obj: Any) -> Any:
+    """
+    Converts objects orjson cannot serialize natively.
+
+    :param obj: the object.
+    :return: an object orjson can serialize.
+    """
+    if isinstance(obj, np.ndarray):
+        if obj.flags.c_contiguous:
+            # a dtype orjson does not support, e.g., float16
+            return obj.tolist()
+        return np.ascontiguousarray(obj)
+
+    raise TypeError(f'Type is not JSON serializable: {type(obj).__name__}')
+
+
+def dumps(obj: Any) -> str:
+    """
+    Serializes an object to JSON, including numpy arrays.
+
+    :param obj: the object.
+    :return: the JSON string.
+    """
+    return orjson.dumps(obj, default=default, option=OPTIONS).decode()
+
+
+def dumps_document(src: dict[str, Any], embedding_field_name: str = 'emb') -> SerializedDocument:
+    """
+    Serializes an OpenSearch document for the bulk request and for records.datacite_json.
+    The document is serialized once without the embedding, which is then appended for OpenSearch.
+
+    :param src: the document with embedding, see `embedding_utils.add_embeddings_to_source`.
+    :param embedding_field_name: name of the embedding field in the document.
+    :return: the document with and without embedding as JSON.
+    """
+    datacite_json = orjson.dumps({key: value for key, value in src.items() if key != embedding_field_name},
+                                 default=default, option=OPTIONS)
+    embedding = orjson.dumps({embedding_field_name: src[embedding_field_name]}, default=default, option=OPTIONS)
+
+    # merges the objects {...} and {"emb":[...]}
+    source = datacite_json[:-1] + (b',' if len(datacite_json) > 2 else b'') + embedding[1:]
+
+    return SerializedDocument(source=source.decode(), datacite_json=datacite_json.decode())
+
+
+class OrjsonSerializer:
+    """
+    Serializer of the OpenSearch client using orjson, see `opensearchpy.serializer.JSONSerializer`.
+    Strings, e.g., documents serialized with `dumps_document`, are sent as they are.
+    """
+    mimetype = 'application/json'
+
+    def dumps(self, data: Any) -> str:
+        if isinstance(data, str):
+            return data
+
+        return dumps(data)
+
+    def loads(self, s: str) -> Any:
+        return orjson.loads(s)
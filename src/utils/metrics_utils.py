@@ -0,0 +1,94 @@
+import logging
+import os
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+from prometheus_client import Counter, Histogram, CollectorRegistry, start_http_server, multiprocess
+
+try:
+    # optional: spans are only recorded if an OpenTelemetry SDK is configured, otherwise the API does nothing
+    # https://opentelemetry.io/docs/languages/python/
+    from opentelemetry import trace
+    tracer: Any = trace.get_tracer(__name__)
+except ImportError:
+    tracer = None
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics of the transformation, exposed by the workers (see start_metrics_server)
+# https://prometheus.github.io/client_python/
+
+STAGE_DURATION = Histogram('transform_stage_duration_seconds', 'Time spent in a stage of processing a batch',
+                           ['stage'], buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+
+BATCH_SIZE = Histogram('transform_batch_size', 'Number of harvest events per batch',
+                       buckets=(1, 10, 25, 50, 100, 125, 250, 500, 1000))
+
+RECORDS = Counter('transform_records', 'Records written to the records table, by result (created, updated, unchanged)',
+                  ['result'])
+
+ERRORS = Counter('transform_errors', 'Harvest events or documents that failed, by stage', ['stage'])
+
+DELETES = Counter('transform_deletes', 'Records deleted because of deleted harvest events')
+
+# called with the stage and its duration in seconds for each observation of STAGE_DURATION,
+# e.g., to collect the durations for percentiles (see scripts/benchmarks/transform_benchmark.py)
+STAGE_LISTENERS: list[Callable[[str, float], None]] = []
+
+# metrics of the API
+SCHEDULED_BATCHES = Counter('index_scheduled_batches', 'Batches put in the Celery queue by /index')
+
+SCHEDULED_EVENTS = Counter('index_scheduled_events', 'Harvest events put in the Celery queue by /index')
+
+
+def observe_stage(stage: str, duration: float) -> None:
+    """
+    Records the duration of a stage in `STAGE_DURATION` and passes it to the `STAGE_LISTENERS`.
+
+    :param stage: name of the stage, e.g., "embed".
+    :param duration: duration in seconds.
+    """
+    STAGE_DURATION.labels(stage).observe(duration)
+
+    for listener in STAGE_LISTENERS:
+        listener(stage, duration)
+
+
+@contextmanager
+def measure_stage(stage: str, **attributes: Any) -> Iterator[None]:
+    """
+    Measures the duration of a stage in `STAGE_DURATION` and, if OpenTelemetry is installed, records it as span.
+
+    :param stage: name of the stage, e.g., "embed".
+    :param attributes: attributes of the span, e.g., harvest_run_id (None values are left out).
+    """
+    started = time.perf_counter()
+    try:
+        if tracer is None:
+            yield
+        else:
+            with tracer.start_as_current_span(stage, attributes={key: value for key, value in attributes.items()
+                                                                 if value is not None}):
+                yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def start_metrics_server(port: int) -> None:
+    """
+    Serves the metrics for Prometheus on the given port.
+    If PROMETHEUS_MULTIPROC_DIR is set, the metrics of all processes writing to it are collected,
+    e.g., of the child processes of the prefork pool.
+
+    :param port: the port.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # https://prometheus.github.io/client_python/multiprocess/
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)  # type: ignore[no-untyped-call]
+        start_http_server(port, registry=registry)
+    else:
+        start_http_server(port)
+
+    logger.info(f'Serving metrics on port {port}')
@@ -0,0 +1,185 @@
+import hashlib
+from typing import Any, NamedTuple, Optional
+from lxml import etree
+from .normalize_datacite_json import DATACITE, normalize_datacite_json
+
+OAI = 'http://www.openarchives.org/OAI/2.0/'
+ONEDATA = 'http://schema.datacite.org/oai/oai-1.1/'
+
+NAMESPACES = {'oai': OAI, 'datacite': DATACITE, 'onedata': ONEDATA}
+
+# precompiled XPath expressions, relative to the OAI-PMH record
+RECORD_IDENTIFIER = etree.XPath('oai:header/oai:identifier', namespaces=NAMESPACES)
+METADATA = etree.XPath('oai:metadata', namespaces=NAMESPACES)
+# relative to the metadata element, in the order they are tried
+RESOURCE_LOCATIONS = [
+    etree.XPath('datacite:resource', namespaces=NAMESPACES),
+    # HAL
+    etree.XPath('oai:resource', namespaces=NAMESPACES),
+    # extra layer structure from Onedata
+    etree.XPath('onedata:oai_datacite/onedata:payload/datacite:resource', namespaces=NAMESPACES)
+]
+
+# children of the resource that normalize_datacite_json reads, see config/schema.json
+RESOURCE_FIELDS = frozenset(f'{{{DATACITE}}}{name}' for name in
+                            ['identifier', 'titles', 'subjects', 'creators', 'publicationYear', 'descriptions',
+                             'dates', 'resourceType'])
+
+# https://lxml.de/parsing.html#parser-options
+PARSER = etree.XMLParser(no_network=True, huge_tree=True)
+
+
+class ParsedRecord(NamedTuple):
+    identifier: Optional[str] # OAI-PMH identifier from the header
+    resource: Optional[dict[str, Any]] # resource in the structure of xmltodict, only containing RESOURCE_FIELDS
+
+
+def qualified_name(name: str) -> str:
+    """
+    Converts an lxml name in Clark notation to the name used by xmltodict with process_namespaces=True,
+    e.g., '{http://datacite.org/schema/kernel-4}title' to 'http://datacite.org/schema/kernel-4:title'.
+
+    :param name: name of an element or attribute.
+    :return: name as used by xmltodict.
+    """
+    if name[0] == '{':
+        uri, local_name = name[1:].split('}', 1)
+        return f'{uri}:{local_name}'
+    return name
+
+
+def element_to_dict(element: etree._Element) -> Any:
+    """
+    Converts an element to the structure xmltodict.parse(..., process_namespaces=True) creates for it.
+
+    :param element: the element to convert.
+    :return: None, a string, or a dict of attributes ('@' prefix), child elements and text ('#text').
+    """
+    converted: dict[str, Any] = {f'@{qualified_name(str(k))}': v for k, v in element.attrib.items()}
+    text = [element.text] if element.text else []
+
+    for child in element:
+        if child.tail:
+            text.append(child.tail)
+
+        # comments and processing instructions are ignored
+        if not isinstance(child.tag, str):
+            continue
+
+        add_child(converted, qualified_name(child.tag), element_to_dict(child))
+
+    stripped = ''.join(text).strip()
+
+    if not converted:
+        return stripped if stripped else None
+
+    if stripped:
+        converted['#text'] = stripped
+
+    return converted
+
+
+def add_child(converted: dict[str, Any], name: str, value: Any) -> None:
+    """
+    Adds a child to a converted element, repeated children are collected in a list like xmltodict does.
+    """
+    if name not in converted:
+        converted[name] = value
+    elif isinstance(converted[name], list):
+        converted[name].append(value)
+    else:
+        converted[name] = [converted[name], value]
+
+
+def find(xpath: etree.XPath, element: etree._Element) -> list[etree._Element]:
+    """
+    Evaluates a precompiled XPath expression that selects elements.
+
+    :param xpath: the XPath expression.
+    :param element: the context element.
+    :return: the selected elements.
+    """
+    result = xpath(element)
+    return [ele for ele in result if isinstance(ele, etree._Element)] if isinstance(result, list) else []
+
+
+def resource_to_dict(resource: etree._Element) -> dict[str, Any]:
+    """
+    Converts the children of the resource that are needed for normalization, all other children are skipped.
+    """
+    converted: dict[str, Any] = {}
+
+    for child in resource:
+        if child.tag in RESOURCE_FIELDS:
+            add_child(converted, qualified_name(child.tag), element_to_dict(child))
+
+    return converted
+
+
+def parse_record(xml: str) -> ParsedRecord:
+    """
+    Parses an OAI-PMH record and extracts its DataCite resource.
+
+    :param xml: the OAI-PMH record.
+    :return: the record's identifier and resource, resource is None if the record has no metadata or no supported resource.
+    """
+    root = etree.fromstring(xml.encode('utf-8'), PARSER)
+
+    if root.tag != f'{{{OAI}}}record':
+        return ParsedRecord(identifier=None, resource=None)
+
+    identifier = find(RECORD_IDENTIFIER, root)
+    record_identifier = identifier[0].text.strip() if identifier and identifier[0].text else None
+
+    metadata = find(METADATA, root)
+    if not metadata:
+        return ParsedRecord(identifier=record_identifier, resource=None)
+
+    for location in RESOURCE_LOCATIONS:
+        resource = find(location, metadata[0])
+        if resource:
+            return ParsedRecord(identifier=record_identifier, resource=resource_to_dict(resource[0]))
+
+    return ParsedRecord(identifier=record_identifier, resource=None)
+
+
+def normalize_datacite_xml(xml: str) -> Optional[dict[str, Any]]:
+    """
+    Normalizes an OAI-PMH record with a DataCite resource.
+    Gives the same result as parsing the record with xmltodict and normalizing its resource with `normalize_datacite_json`,
+    but only the fields needed for normalization are converted.
+
+    :param xml: the OAI-PMH record.
+    :return: the normalized record or None if the record does not contain a supported resource.
+    """
+    resource = parse_record(xml).resource
+
+    if resource is None:
+        return None
+
+    return normalize_datacite_json(resource)
+
+
+def get_content_hash(xml: str, additional_metadata: Optional[str]) -> str:
+    """
+    Calculates a hash of the content of an OAI-PMH record that does not change when an endpoint re-emits the same record.
+    Only the metadata element is taken into account (not the header with its datestamp),
+    serialized as canonical XML so that differences in formatting of attributes or namespace prefixes do not matter.
+
+    :param xml: the OAI-PMH record.
+    :param additional_metadata: additional metadata of the record.
+    :return: the SHA-256 hex digest.
+    """
+    root = etree.fromstring(xml.encode('utf-8'), PARSER)
+
+    metadata = find(METADATA, root)
+
+    # https://lxml.de/api.html#serialisation
+    content_hash = hashlib.sha256(etree.tostring(metadata[0] if metadata else root, method='c14n'))
+
+    # separator, so that metadata and additional metadata cannot be shifted into each other
+    content_hash.update(b'\0')
+    if additional_metadata is not None:
+        content_hash.update(additional_metadata.encode('utf-8'))
+
+    return content_hash.hexdigest()
@@ -0,0 +1,207 @@
+import copy
+import datetime
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator
+from typing import Any, NamedTuple, TYPE_CHECKING
+import logging
+
+if TYPE_CHECKING:
+    # opensearch-py is imported when used, so that the API can import get_versioned_index_name without it
+    from opensearchpy import OpenSearch
+
+logger = logging.getLogger(__name__)
+
+# settings of an index while it is built: no refreshes and no replicas, restored by publish_index
+# https://docs.opensearch.org/latest/tuning-your-cluster/performance/
+BULK_SETTINGS = {'refresh_interval': '-1', 'number_of_replicas': 0}
+
+# seconds to wait for a force merge
+FORCE_MERGE_TIMEOUT = 3600
+
+# statuses of rejected requests or documents that are retried (too many requests, service unavailable)
+RETRY_STATUS = (429, 503)
+
+
+class BulkError(NamedTuple):
+    id: str # document id
+    op_type: str # e.g., "index" or "delete"
+    status: Any # HTTP status, "N/A" for a connection error
+    error: str
+
+    def __str__(self) -> str:
+        return f'OpenSearch {self.op_type} of {self.id} failed ({self.status}): {self.error}'
+
+
+class BulkResult(NamedTuple):
+    success: int
+    errors: list[BulkError]
+
+
+def bulk_write(client: 'OpenSearch', actions: Iterable[dict[str, Any]], chunk_size: int = 500,
+               max_chunk_bytes: int = 10 * 1024 * 1024, thread_count: int = 1, max_retries: int = 5,
+               initial_backoff: float = 2, max_backoff: float = 60) -> BulkResult:
+    """
+    Sends actions to OpenSearch in bulk requests without raising on failed documents.
+
+    The actions are split into chunks by number of documents and by bytes and sent one after another
+    or, if thread_count is greater than 1, in parallel. Documents and chunks rejected with a status in `RETRY_STATUS`
+    are retried with exponential backoff, the remaining failures are returned per document.
+    A delete of a document that does not exist and a create of a document that already exists count as success.
+
+    :param client: the OpenSearch client.
+    :param actions: the bulk actions, see `embedding_utils.preprocess_batch`.
+    :param chunk_size: maximum number of documents per bulk request.
+    :param max_chunk_bytes: maximum size of a bulk request in bytes.
+    :param thread_count: number of bulk requests sent in parallel.
+    :param max_retries: maximum number of retries of a rejected document.
+    :param initial_backoff: seconds to wait before the first retry, doubled for each further retry.
+    :param max_backoff: maximum number of seconds to wait before a retry.
+    :return: number of successful actions and the failed documents.
+    """
+    success = 0
+    errors: list[BulkError] = []
+    pending: Iterable[dict[str, Any]] = actions
+
+    for attempt in range(max_retries + 1):
+        to_retry: list[dict[str, Any]] = []
+
+        for action, ok, item in send_bulk(client, pending, chunk_size, max_chunk_bytes, thread_count):
+            op_type, info = next(iter(item.items()))
+            status = info.get('status')
+
+            if ok or (op_type == 'delete' and status == 404) or (op_type == 'create' and status == 409):
+                success += 1
+            elif status in RETRY_STATUS and attempt < max_retries:
+                to_retry.append(action)
+            else:
+                errors.append(BulkError(id=str(action.get('_id')), op_type=op_type, status=status,
+                                        error=str(info.get('error'))))
+
+        if len(to_retry) == 0:
+            break
+
+        backoff = min(max_backoff, initial_backoff * 2 ** attempt)
+        logger.warning(f'Retrying {len(to_retry)} rejected bulk actions in {backoff}s (retry {attempt + 1} of {max_retries})')
+        time.sleep(backoff)
+
+        pending = to_retry
+
+    return BulkResult(success=success, errors=errors)
+
+
+def send_bulk(client: 'OpenSearch', actions: Iterable[dict[str, Any]], chunk_size: int, max_chunk_bytes: int,
+              thread_count: int) -> Iterator[tuple[dict[str, Any], bool, dict[str, Any]]]:
+    """
+    Sends actions in bulk requests and yields the result of each action together with the action.
+
+    :return: the action, whether it succeeded and the item of the bulk response
+        (a failed request is reported as failure of all of its actions).
+    """
+    # the helpers yield the results in the order of the actions, so only the actions sent but not reported are kept
+    in_flight: deque[dict[str, Any]] = deque()
+
+    def track(actions: Iterable[dict[str, Any]]) -> Iterator[dict[str, Any]]:
+        for action in actions:
+            in_flight.append(action)
+            yield action
+
+    from opensearchpy.helpers import streaming_bulk, parallel_bulk
+
+    # errors are reported per document instead of raising BulkIndexError or TransportError
+    options: dict[str, Any] = {'chunk_size': chunk_size, 'max_chunk_bytes': max_chunk_bytes,
+                               'raise_on_error': False, 'raise_on_exception': False}
+
+    if thread_count > 1:
+        results = parallel_bulk(client, track(actions), thread_count=thread_count, queue_size=thread_count, **options)
+    else:
+        results = streaming_bulk(client, track(actions), **options)
+
+    for ok, item in results:
+        yield in_flight.popleft(), ok, item
+
+
+def get_versioned_index_name(alias: str) -> str:
+    """
+    Returns the name of a new index version behind an alias.
+
+    :param alias: the alias the index is searched by.
+    :return: the alias suffixed by the current UTC time.
+    """
+    return f'{alias}_{datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d%H%M%S%f")}'
+
+
+def create_index(client: 'OpenSearch', index_name: str, mapping: dict[str, Any], embedding_dims: int,
+                 bulk_settings: bool = False) -> None:
+    """
+    Creates an index if it does not exist yet.
+
+    :param client: the OpenSearch client.
+    :param index_name: name of the index.
+    :param mapping: settings and mappings of the index, see config/opensearch_mapping.json.
+    :param embedding_dims: dimension of the embeddings (field emb).
+    :param bulk_settings: if True, the index is created with `BULK_SETTINGS` for building it, see `publish_index`.
+    """
+    body = copy.deepcopy(mapping)
+    body['mappings']['properties']['emb']['dimension'] = embedding_dims
+
+    if bulk_settings:
+        body.setdefault('settings', {}).setdefault('index', {}).update(BULK_SETTINGS)
+
+    # tasks of the same build may try to create the index concurrently
+    client.indices.create(index=index_name, body=body, ignore=400)
+
+
+def publish_index(client: 'OpenSearch', alias: str, index_name: str, mapping: dict[str, Any], delete_old: bool = False) -> list[str]:
+    """
+    Prepares an index built with `BULK_SETTINGS` for searching and atomically points the alias to it:
+    the index is refreshed and force merged, and the settings of the mapping are restored.
+
+    :param client: the OpenSearch client.
+    :param alias: the alias searches use.
+    :param index_name: the index built.
+    :param mapping: settings and mappings the index was created with, see config/opensearch_mapping.json.
+    :param delete_old: if True, the indices the alias pointed to are deleted afterwards.
+    :return: names of the indices the alias pointed to.
+    """
+    client.indices.refresh(index=index_name)
+    # merging while there are no replicas yet, so that the merged segments are copied to the replicas
+    client.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=FORCE_MERGE_TIMEOUT)
+
+    # null resets a setting not given in the mapping to its default
+    index_settings = mapping.get('settings', {}).get('index', {})
+    client.indices.put_settings(index=index_name, body={'index': {key: index_settings.get(key) for key in BULK_SETTINGS}})
+
+    return swap_alias(client, alias, index_name, delete_old)
+
+
+def swap_alias(client: 'OpenSearch', alias: str, index_name: str, delete_old: bool = False) -> list[str]:
+    """
+    Atomically points an alias to an index, so that searches switch from the old to the new index at once.
+    An index with the name of the alias (created before aliases were used) is deleted in the same request.
+
+    :param client: the OpenSearch client.
+    :param alias: the alias.
+    :param index_name: the index the alias points to afterwards.
+    :param delete_old: if True, the indices the alias pointed to are deleted afterwards.
+    :return: names of the indices the alias pointed to.
+    """
+    actions: list[dict[str, Any]] = []
+    old: list[str] = []
+
+    if client.indices.exists_alias(name=alias):
+        old = [name for name in client.indices.get_alias(name=alias).keys() if name != index_name]
+        actions.extend({'remove': {'index': name, 'alias': alias}} for name in old)
+    elif client.indices.exists(index=alias):
+        actions.append({'remove_index': {'index': alias}})
+
+    actions.append({'add': {'index': index_name, 'alias': alias}})
+
+    # https://docs.opensearch.org/latest/api-reference/index-apis/alias/
+    client.indices.update_aliases(body={'actions': actions})
+
+    if delete_old:
+        for name in old:
+            client.indices.delete(index=name)
+
+    return old
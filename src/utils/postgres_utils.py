@@ -0,0 +1,468 @@
+from collections.abc import Sequence
+from typing import Any, NamedTuple, Optional
+import numpy as np
+import psycopg
+from .normalize_datacite_json import DOI_BASE
+from .queue_utils import HarvestEventQueue
+
+
+# records.embeddings are stored as float32 in network byte order (BYTEA), the format of PostgreSQL's float4send,
+# which takes a quarter of the space of FLOAT8[] as text (see migrate_sql/embeddings_bytea.sql)
+EMBEDDING_DTYPE = np.dtype('>f4')
+
+
+class UpsertResult(NamedTuple):
+    created: int
+    updated: int
+
+
+class RecordToDelete(NamedTuple):
+    id: str
+    opensearch_id: Optional[str]
+    harvest_event_id: str # the harvest event the record is deleted by
+
+
+class OutboxEntry(NamedTuple):
+    id: int
+    index_name: str
+    op_type: str # "index" or "delete"
+    document_id: str
+    record_id: Optional[str]
+    harvest_event_id: str
+    source: Optional[dict[str, Any]] # the document with embedding to be indexed, None for delete or if the record is gone
+
+
+class RecordRow(NamedTuple):
+    harvest_event_id: str
+    record_identifier: str
+    repository_id: str
+    endpoint_id: str
+    resource_type: str
+    title: str
+    raw_metadata: str # XML
+    metadata_protocol: str
+    doi: Optional[str]
+    url: Optional[str]
+    embeddings: Optional[bytes] # see embedding_to_bytes
+    embedding_model: Optional[str]
+    embedding_text_hash: Optional[str]
+    content_hash: Optional[str]
+    datacite_json: str # JSON (stringified)
+    opensearch_synced: bool
+    opensearch_synced_at: Optional[str]
+    additional_metadata: Optional[str]
+    datestamp: str
+
+
+# temporary table the batch is copied into, dropped at the end of the transaction
+CREATE_RECORDS_STAGING = """
+    CREATE TEMP TABLE records_staging (
+        harvest_event_id UUID NOT NULL,
+        record_identifier VARCHAR(255) NOT NULL,
+        repository_id UUID NOT NULL,
+        endpoint_id UUID NOT NULL,
+        resource_type resource_type NOT NULL,
+        title TEXT NOT NULL,
+        raw_metadata TEXT NOT NULL,
+        metadata_protocol harvest_protocol NOT NULL,
+        doi VARCHAR(255),
+        url VARCHAR(2048),
+        embeddings BYTEA,
+        embedding_model VARCHAR(100),
+        embedding_text_hash CHAR(64),
+        content_hash CHAR(64),
+        datacite_json JSONB,
+        opensearch_synced BOOLEAN NOT NULL,
+        opensearch_synced_at TIMESTAMP WITH TIME ZONE,
+        additional_metadata TEXT,
+        datestamp TIMESTAMP WITH TIME ZONE NOT NULL
+    ) ON COMMIT DROP
+"""
+
+
+def embedding_to_bytes(embedding: Sequence[float] | np.ndarray[Any, Any]) -> bytes:
+    """
+    Converts an embedding to its representation in records.embeddings.
+
+    :param embedding: the embedding.
+    :return: the embedding as float32 in network byte order.
+    """
+    return np.asarray(embedding, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def embedding_from_bytes(data: bytes) -> np.ndarray[Any, Any]:
+    """
+    Reads an embedding from records.embeddings.
+
+    :param data: the value of records.embeddings.
+    :return: the embedding as float32 array in native byte order (orjson ignores the byte order of arrays).
+    """
+    return np.frombuffer(data, dtype=EMBEDDING_DTYPE).astype(np.float32)
+
+
+def upsert_records(cur: psycopg.Cursor[Any], records: list[RecordRow]) -> UpsertResult:
+    """
+    Inserts or updates the given records in table records and resets the error message of their harvest events.
+
+    The records are copied into a staging table first, so the whole batch is written
+    with one COPY and two set-based statements instead of two statements per record.
+    Must be called at most once per transaction.
+
+    :param cur: cursor of the connection whose transaction the records are written in, returning rows as dicts.
+    :param records: records to be written.
+    :return: number of records created and updated.
+    """
+    if len(records) == 0:
+        return UpsertResult(created=0, updated=0)
+
+    cur.execute(CREATE_RECORDS_STAGING)
+
+    # https://www.psycopg.org/psycopg3/docs/basic/copy.html
+    with cur.copy(f'COPY records_staging ({", ".join(RecordRow._fields)}) FROM STDIN') as copy:
+        for rec in records:
+            copy.write_row(rec)
+
+    # DISTINCT ON: a record must not be affected twice by the same INSERT ... ON CONFLICT statement
+    # https://neon.com/postgresql/postgresql-tutorial/postgresql-upsert
+    cur.execute("""
+    INSERT INTO records
+    (
+        record_identifier,
+        repository_id,
+        endpoint_id,
+        resource_type,
+        title,
+        raw_metadata,
+        metadata_protocol,
+        doi,
+        url,
+        embeddings,
+        embedding_model,
+        embedding_text_hash,
+        content_hash,
+        datacite_json,
+        opensearch_synced,
+        opensearch_synced_at,
+        additional_metadata,
+        datestamp
+    )
+    SELECT DISTINCT ON (endpoint_id, record_identifier)
+        record_identifier,
+        repository_id,
+        endpoint_id,
+        resource_type,
+        title,
+        XMLPARSE(DOCUMENT raw_metadata),
+        metadata_protocol,
+        doi,
+        url,
+        embeddings,
+        embedding_model,
+        embedding_text_hash,
+        content_hash,
+        datacite_json,
+        opensearch_synced,
+        opensearch_synced_at,
+        additional_metadata,
+        datestamp
+    FROM records_staging
+    ORDER BY endpoint_id, record_identifier, datestamp DESC
+    ON CONFLICT (endpoint_id, record_identifier)
+    DO UPDATE SET resource_type = EXCLUDED.resource_type, title = EXCLUDED.title, raw_metadata = EXCLUDED.raw_metadata,
+        doi = EXCLUDED.doi, url = EXCLUDED.url, embeddings = EXCLUDED.embeddings, embedding_model = EXCLUDED.embedding_model,
+        embedding_text_hash = EXCLUDED.embedding_text_hash, content_hash = EXCLUDED.content_hash,
+        datacite_json = EXCLUDED.datacite_json, opensearch_synced = EXCLUDED.opensearch_synced,
+        opensearch_synced_at = EXCLUDED.opensearch_synced_at, additional_metadata = EXCLUDED.additional_metadata,
+        datestamp = EXCLUDED.datestamp
+    RETURNING (xmax = 0) AS created
+    """)
+
+    # xmax is 0 for a newly inserted row and set for a row that was updated
+    # https://stackoverflow.com/questions/34762732/how-to-find-out-if-an-upsert-was-an-update-with-postgresql-9-5-upsert
+    upserted = cur.fetchall()
+    created = sum(1 for row in upserted if row['created'])
+    result = UpsertResult(created=created, updated=len(upserted) - created)
+
+    cur.execute("""
+    UPDATE harvest_events he
+    SET error_message = NULL
+    FROM records_staging s
+    WHERE he.id = s.harvest_event_id
+    """)
+
+    return result
+
+
+def get_cached_embeddings(cur: psycopg.Cursor[Any], embedding_model: str, text_hashes: list[str]) -> dict[str, np.ndarray[Any, Any]]:
+    """
+    Looks up the embeddings already stored in table records for the given embedding texts.
+    The records table serves as embedding cache, keyed by embedding model and hash of the embedding text.
+
+    :param cur: cursor returning rows as dicts.
+    :param embedding_model: the model the embeddings must have been calculated with.
+    :param text_hashes: hashes of the embedding texts, see `embedding_utils.get_embedding_text_hash`.
+    :return: the embeddings by hash for the hashes found.
+    """
+    if len(text_hashes) == 0:
+        return {}
+
+    cur.execute("""
+    SELECT DISTINCT ON (embedding_text_hash) embedding_text_hash, embeddings
+    FROM records
+    WHERE embedding_model = %s AND embedding_text_hash = ANY(%s) AND embeddings IS NOT NULL
+    """, (embedding_model, text_hashes))
+
+    return {row['embedding_text_hash']: embedding_from_bytes(row['embeddings']) for row in cur.fetchall()}
+
+
+def get_content_hashes(cur: psycopg.Cursor[Any], keys: list[tuple[str, str]], embedding_model: str) -> dict[tuple[str, str], str]:
+    """
+    Looks up the content hashes of the records that are synced to OpenSearch with embeddings of the given model.
+
+    :param cur: cursor returning rows as dicts.
+    :param keys: endpoint id and record identifier of the records.
+    :param embedding_model: the model the embeddings must have been calculated with.
+    :return: the content hashes by endpoint id and record identifier for the records found.
+    """
+    if len(keys) == 0:
+        return {}
+
+    cur.execute("""
+    SELECT r.endpoint_id, r.record_identifier, r.content_hash
+    FROM records r
+    JOIN unnest(%s::uuid[], %s::varchar[]) AS k(endpoint_id, record_identifier)
+        ON r.endpoint_id = k.endpoint_id AND r.record_identifier = k.record_identifier
+    WHERE r.content_hash IS NOT NULL AND r.opensearch_synced AND r.embedding_model = %s
+    """, ([endpoint_id for endpoint_id, _ in keys], [record_identifier for _, record_identifier in keys], embedding_model))
+
+    return {(str(row['endpoint_id']), row['record_identifier']): row['content_hash'] for row in cur.fetchall()}
+
+
+def get_records_to_delete(cur: psycopg.Cursor[Any], deleted: list[HarvestEventQueue]) -> list[RecordToDelete]:
+    """
+    Looks up the records of deleted harvest events with a single query.
+
+    :param cur: cursor returning rows as dicts.
+    :param deleted: the deleted harvest events.
+    :return: the records found with the ids of their OpenSearch documents, harvest events without a record are ignored.
+    """
+    if len(deleted) == 0:
+        return []
+
+    cur.execute("""
+    SELECT r.id, r.doi, r.url, r.datacite_json->>'id' AS opensearch_id, k.harvest_event_id
+    FROM records r
+    JOIN unnest(%s::uuid[], %s::uuid[], %s::varchar[]) AS k(harvest_event_id, endpoint_id, record_identifier)
+        ON r.endpoint_id = k.endpoint_id AND r.record_identifier = k.record_identifier
+    """, ([harvest_event.id for harvest_event in deleted], [harvest_event.endpoint_id for harvest_event in deleted],
+          [harvest_event.record_identifier for harvest_event in deleted]))
+
+    return [
+        RecordToDelete(
+            id=str(row['id']),
+            # the document id is the id of the normalized record, see normalize_datacite_json.make_id
+            opensearch_id=row['opensearch_id'] if row['opensearch_id'] is not None
+            else DOI_BASE + row['doi'] if row['doi'] is not None else row['url'],
+            harvest_event_id=str(row['harvest_event_id'])
+        )
+        for row in cur.fetchall()
+    ]
+
+
+def delete_records(cur: psycopg.Cursor[Any], ids: list[str]) -> int:
+    """
+    Deletes records with a single statement.
+
+    :param cur: cursor of the connection whose transaction the records are deleted in.
+    :param ids: ids of the records.
+    :return: number of records deleted.
+    """
+    if len(ids) == 0:
+        return 0
+
+    cur.execute('DELETE FROM records WHERE id = ANY(%s)', [ids])
+
+    return cur.rowcount
+
+
+def set_harvest_event_errors(cur: psycopg.Cursor[Any], errors: dict[str, str]) -> None:
+    """
+    Writes error messages to harvest events with a single statement.
+
+    :param cur: cursor of the connection whose transaction the errors are written in.
+    :param errors: the error messages by harvest event id.
+    """
+    if len(errors) == 0:
+        return
+
+    cur.execute("""
+    UPDATE harvest_events he
+    SET error_message = e.error_message
+    FROM unnest(%s::uuid[], %s::text[]) AS e(id, error_message)
+    WHERE he.id = e.id
+    """, (list(errors.keys()), list(errors.values())))
+
+
+def add_harvest_run_counts(cur: psycopg.Cursor[Any], harvest_run_id: str, created: int, updated: int, deleted: int, unchanged: int) -> None:
+    """
+    Adds the numbers of records affected by a batch to the counters of its harvest run.
+
+    :param cur: cursor of the connection whose transaction the batch is written in.
+    :param harvest_run_id: ID of the harvest run.
+    :param created: number of records created.
+    :param updated: number of records updated.
+    :param deleted: number of records deleted.
+    :param unchanged: number of harvest events skipped because their record is unchanged.
+    """
+    cur.execute("""
+    UPDATE harvest_runs
+    SET records_created = records_created + %s, records_updated = records_updated + %s,
+        records_deleted = records_deleted + %s, records_unchanged = records_unchanged + %s
+    WHERE id = %s
+    """, (created, updated, deleted, unchanged, harvest_run_id))
+
+
+def enqueue_index_actions(cur: psycopg.Cursor[Any], index_name: str, records: list[RecordRow]) -> None:
+    """
+    Adds an index action for each of the given records to table opensearch_outbox, see `tasks.drain_outbox`.
+    Must be called after `upsert_records` in the same transaction: the documents are read from the records table when sent.
+
+    :param cur: cursor of the connection whose transaction the records are written in.
+    :param index_name: name of the OpenSearch index.
+    :param records: the records written.
+    """
+    if len(records) == 0:
+        return
+
+    cur.execute("""
+    INSERT INTO opensearch_outbox (index_name, op_type, document_id, record_id, harvest_event_id)
+    SELECT %s, 'index', r.datacite_json->>'id', r.id, k.harvest_event_id
+    FROM records r
+    JOIN unnest(%s::uuid[], %s::uuid[], %s::varchar[]) AS k(harvest_event_id, endpoint_id, record_identifier)
+        ON r.endpoint_id = k.endpoint_id AND r.record_identifier = k.record_identifier
+    WHERE r.datacite_json IS NOT NULL
+    """, (index_name, [rec.harvest_event_id for rec in records], [rec.endpoint_id for rec in records],
+          [rec.record_identifier for rec in records]))
+
+
+def enqueue_delete_actions(cur: psycopg.Cursor[Any], index_name: str, records: list[RecordToDelete]) -> None:
+    """
+    Adds a delete action for each of the given records to table opensearch_outbox, see `tasks.drain_outbox`.
+
+    :param cur: cursor of the connection whose transaction the records are deleted in.
+    :param index_name: name of the OpenSearch index.
+    :param records: the records deleted, see `get_records_to_delete`.
+    """
+    records = [record for record in records if record.opensearch_id is not None]
+    if len(records) == 0:
+        return
+
+    cur.execute("""
+    INSERT INTO opensearch_outbox (index_name, op_type, document_id, harvest_event_id)
+    SELECT %s, 'delete', k.document_id, k.harvest_event_id
+    FROM unnest(%s::varchar[], %s::uuid[]) AS k(document_id, harvest_event_id)
+    """, (index_name, [record.opensearch_id for record in records], [record.harvest_event_id for record in records]))
+
+
+def lock_outbox_entries(cur: psycopg.Cursor[Any], limit: int, max_attempts: int, exclude: list[int]) -> list[OutboxEntry]:
+    """
+    Locks the oldest pending entries of table opensearch_outbox until the end of the transaction.
+    Entries locked by another transaction are skipped so that several drainers can run in parallel.
+
+    :param cur: cursor returning rows as dicts.
+    :param limit: maximum number of entries.
+    :param max_attempts: entries that failed this often are left for inspection.
+    :param exclude: ids of entries not to lock, e.g., that already failed in the current run.
+    :return: the entries in the order they were added, with the documents of their records.
+    """
+    # https://www.postgresql.org/docs/current/sql-select.html#SQL-FOR-UPDATE-SHARE
+    cur.execute("""
+    SELECT o.id, o.index_name, o.op_type, o.document_id, o.record_id, o.harvest_event_id, r.datacite_json, r.embeddings
+    FROM opensearch_outbox o
+    LEFT JOIN records r ON r.id = o.record_id
+    WHERE o.attempts < %s AND NOT (o.id = ANY(%s))
+    ORDER BY o.id
+    LIMIT %s
+    FOR UPDATE OF o SKIP LOCKED
+    """, (max_attempts, exclude, limit))
+
+    return [
+        OutboxEntry(
+            id=row['id'],
+            index_name=row['index_name'],
+            op_type=row['op_type'],
+            document_id=row['document_id'],
+            record_id=row['record_id'],
+            harvest_event_id=str(row['harvest_event_id']),
+            source={**row['datacite_json'], 'emb': embedding_from_bytes(row['embeddings'])}
+            if row['op_type'] == 'index' and row['datacite_json'] is not None and row['embeddings'] is not None else None
+        )
+        for row in cur.fetchall()
+    ]
+
+
+def complete_outbox_entries(cur: psycopg.Cursor[Any], entry_ids: list[int], record_ids: list[str]) -> None:
+    """
+    Removes entries that were sent to OpenSearch from table opensearch_outbox and marks their records as synced.
+
+    :param cur: cursor of the connection whose transaction locked the entries.
+    :param entry_ids: ids of the entries.
+    :param record_ids: ids of the records indexed.
+    """
+    if len(entry_ids) > 0:
+        cur.execute('DELETE FROM opensearch_outbox WHERE id = ANY(%s)', [entry_ids])
+
+    if len(record_ids) > 0:
+        cur.execute("""
+        UPDATE records
+        SET opensearch_synced = true, opensearch_synced_at = now()
+        WHERE id = ANY(%s)
+        """, [record_ids])
+
+
+def fail_outbox_entries(cur: psycopg.Cursor[Any], errors: dict[int, str]) -> None:
+    """
+    Counts a failed attempt for entries of table opensearch_outbox, they are retried by the next drain.
+
+    :param cur: cursor of the connection whose transaction locked the entries.
+    :param errors: the error messages by entry id.
+    """
+    if len(errors) == 0:
+        return
+
+    cur.execute("""
+    UPDATE opensearch_outbox o
+    SET attempts = o.attempts + 1, last_error = e.error
+    FROM unnest(%s::bigint[], %s::text[]) AS e(id, error)
+    WHERE o.id = e.id
+    """, (list(errors.keys()), list(errors.values())))
+
+
+def complete_index_batch(cur: psycopg.Cursor[Any], batch_id: int, duration: Optional[float] = None) -> None:
+    """
+    Marks a batch of /index as done, in the transaction the batch is written in so that it is done if and only if it is committed.
+
+    :param cur: cursor of the connection whose transaction the batch is written in.
+    :param batch_id: id of the batch in table index_batches.
+    :param duration: seconds the worker took to write the batch.
+    """
+    cur.execute("""
+    UPDATE index_batches
+    SET status = 'done', completed_at = now(), error = NULL, duration = %s
+    WHERE id = %s
+    """, (duration, batch_id))
+
+
+def fail_index_batch(cur: psycopg.Cursor[Any], batch_id: int, error: str) -> None:
+    """
+    Marks a batch of /index as failed, unless it is already done (e.g., a redelivered task).
+
+    :param cur: cursor of the connection the error is written in.
+    :param batch_id: id of the batch in table index_batches.
+    :param error: the error message.
+    """
+    cur.execute("""
+    UPDATE index_batches
+    SET status = 'failed', completed_at = now(), error = %s
+    WHERE id = %s AND status <> 'done'
+    """, (error, batch_id))
@@ -1,4 +1,31 @@
-from typing import NamedTuple, Optional
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any, NamedTuple, Optional, TypeVar
+
+DATESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f%z'
+
+T = TypeVar('T')
+
+# selects the columns needed to build a HarvestEventQueue, to be completed with a WHERE clause
+HARVEST_EVENTS_SELECT = """
+            SELECT he.id, 
+            he.repository_id,
+            r.code, 
+            he.endpoint_id, 
+            e.harvest_url,
+            he.record_identifier, 
+            (
+                xpath('/oai:record', he.raw_metadata, '{{oai, http://www.openarchives.org/OAI/2.0/},{datacite, http://datacite.org/schema/kernel-4}}')
+            )[1] AS record,
+            he.additional_metadata,
+            he.is_deleted,
+            he.datestamp
+        FROM harvest_events he
+        JOIN harvest_runs hr ON he.harvest_run_id = hr.id 
+        JOIN endpoints e ON he.endpoint_id = e.id
+        JOIN repositories r ON he.repository_id = r.id
+"""
 
 
 class HarvestEventQueue(NamedTuple):
@@ -12,3 +39,84 @@ class HarvestEventQueue(NamedTuple):
     additional_metadata: Optional[str] # 7
     is_deleted: bool # 8
     datestamp: str # 9
+
+
+def harvest_event_from_row(doc: dict[str, Any]) -> HarvestEventQueue:
+    """
+    Given a row selected with `HARVEST_EVENTS_SELECT`, creates a `HarvestEventQueue`.
+
+    :param doc: row as a dict.
+    :return: harvest event that can be serialized for the broker.
+    """
+    # https://www.psycopg.org/psycopg3/docs/basic/adapt.html#uuid-adaptation
+    # https://docs.python.org/3/library/uuid.html#uuid.UUID
+    # str(uuid) returns a string in the form 12345678-1234-5678-1234-567812345678 where the 32 hexadecimal digits represent the UUID.
+    return HarvestEventQueue(id=str(doc['id']), xml=doc['record'], repository_id=str(doc['repository_id']),
+                             endpoint_id=str(doc['endpoint_id']), record_identifier=doc['record_identifier'],
+                             code=doc['code'], harvest_url=doc['harvest_url'],
+                             additional_metadata=doc['additional_metadata'], is_deleted=doc['is_deleted'],
+                             datestamp=doc['datestamp'].strftime(DATESTAMP_FORMAT))
+
+
+class RateLimiter:
+    """
+    Limits the rate of an operation across threads, e.g., putting batches in the queue (token bucket).
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        """
+        :param rate: operations per second.
+        :param burst: number of operations allowed at once after a pause.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Waits until the operation is allowed.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            # the token is reserved, the caller waits for it outside the lock
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+def split_batches(rows: Iterable[T], max_events: int, max_bytes: Callable[[], int],
+                  get_size: Callable[[T], int]) -> Iterator[tuple[list[T], int]]:
+    """
+    Splits rows into batches of at most max_events rows and at most max_bytes() bytes.
+    A row larger than the byte budget is put in a batch of its own.
+
+    :param rows: the rows, e.g., harvest events read from a cursor.
+    :param max_events: maximum number of rows per batch.
+    :param max_bytes: returns the byte budget of the next batch, 0 for no budget. Called once per batch so that it can be tuned.
+    :param get_size: returns the size of a row in bytes.
+    :return: the batches with their size in bytes.
+    """
+    batch: list[T] = []
+    batch_bytes = 0
+    budget = max_bytes()
+
+    for row in rows:
+        size = get_size(row)
+
+        if batch and (len(batch) >= max_events or (budget > 0 and batch_bytes + size > budget)):
+            yield batch, batch_bytes
+            batch = []
+            batch_bytes = 0
+            budget = max_bytes()
+
+        batch.append(row)
+        batch_bytes += size
+
+    if batch:
+        yield batch, batch_bytes
@@ -0,0 +1,74 @@
+import json
+from typing import Any, TypedDict
+from jsonschema.protocols import Validator
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+
+class ValidationErrorEntry(TypedDict):
+    path: str # JSON path of the invalid value in the record
+    message: str
+    validator: str # keyword of the schema that failed, e.g. "required"
+
+
+class RecordValidationError(Exception):
+    """Raised when a record is invalid and all errors were collected, the message is the JSON encoded list of errors."""
+
+    errors: list[ValidationErrorEntry]
+
+    def __init__(self, errors: list[ValidationErrorEntry]) -> None:
+        super().__init__(json.dumps(errors))
+        self.errors = errors
+
+
+class RecordValidator:
+    """
+    Validates normalized records against a JSON schema.
+
+    Unlike `jsonschema.validate`, the schema is checked and the validator is created only once,
+    so one instance should be reused for all records validated by a worker.
+    """
+
+    validator: Validator
+    collect_all_errors: bool
+
+    def __init__(self, schema: dict[str, Any], collect_all_errors: bool = False) -> None:
+        """
+        :param schema: the JSON schema.
+        :param collect_all_errors: if True, all errors of an invalid record are reported instead of the best match.
+        """
+        # same validator class as chosen by jsonschema.validate, based on $schema
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        self.validator = cls(schema)
+        self.collect_all_errors = collect_all_errors
+
+    def validate(self, instance: dict[str, Any]) -> None:
+        """
+        Validates a record.
+
+        :param instance: the record.
+        :raises jsonschema.exceptions.ValidationError: if the record is invalid, like `jsonschema.validate`.
+        :raises RecordValidationError: if the record is invalid and collect_all_errors is set.
+        """
+        if self.collect_all_errors:
+            errors = self.get_errors(instance)
+            if errors:
+                raise RecordValidationError(errors)
+            return
+
+        error = best_match(self.validator.iter_errors(instance))
+        if error is not None:
+            raise error
+
+    def get_errors(self, instance: dict[str, Any]) -> list[ValidationErrorEntry]:
+        """
+        Returns all errors of a record, ordered by their path.
+
+        :param instance: the record.
+        :return: the errors, empty if the record is valid.
+        """
+        return [
+            ValidationErrorEntry(path=error.json_path, message=error.message, validator=str(error.validator))
+            for error in sorted(self.validator.iter_errors(instance), key=lambda e: list(map(str, e.path)))
+        ]
@@ -0,0 +1,38 @@
+import os
+import unittest
+from unittest.mock import patch
+from src.config.embedding_config import EmbeddingConfig
+
+
+class TestEmbeddingConfig(unittest.TestCase):
+
+    @patch.dict(os.environ, {'EMBEDDING_MODEL': 'BAAI/bge-small-en-v1.5', 'EMBEDDING_BATCH_SIZE': '',
+                             'EMBEDDING_PARALLEL': '', 'EMBEDDING_THREADS': '', 'EMBEDDING_PROVIDERS': '',
+                             'EMBEDDING_CACHE_DIR': '', 'EMBEDDING_LOCAL_FILES_ONLY': ''})
+    def test_defaults(self):
+        config = EmbeddingConfig()
+
+        self.assertEqual(config.model_name, 'BAAI/bge-small-en-v1.5')
+        self.assertEqual(config.embed_params, {'batch_size': 256, 'parallel': None})
+        self.assertIsNone(config.threads)
+        self.assertIsNone(config.providers)
+        self.assertIsNone(config.cache_dir)
+        self.assertFalse(config.local_files_only)
+
+    @patch.dict(os.environ, {'EMBEDDING_MODEL': 'BAAI/bge-small-en-v1.5', 'EMBEDDING_BATCH_SIZE': '64',
+                             'EMBEDDING_PARALLEL': '0', 'EMBEDDING_THREADS': '4',
+                             'EMBEDDING_PROVIDERS': 'CUDAExecutionProvider, CPUExecutionProvider',
+                             'EMBEDDING_CACHE_DIR': '/models', 'EMBEDDING_LOCAL_FILES_ONLY': 'true'})
+    def test_settings(self):
+        config = EmbeddingConfig()
+
+        self.assertEqual(config.embed_params, {'batch_size': 64, 'parallel': 0})
+        self.assertEqual(config.threads, 4)
+        self.assertEqual(config.providers, ['CUDAExecutionProvider', 'CPUExecutionProvider'])
+        self.assertEqual(config.cache_dir, '/models')
+        self.assertTrue(config.local_files_only)
+
+    @patch.dict(os.environ, {'EMBEDDING_MODEL': ''})
+    def test_missing_model(self):
+        with self.assertRaises(ValueError):
+            EmbeddingConfig()
@@ -86,15 +86,15 @@ class TestEmbeddingsUtils(unittest.TestCase):
         self.assertEqual(len(res), 3)
 
         self.assertEqual(res[0].src['titles'][0], 'a title')
-        self.assertEqual(res[0].src['emb'], [1, 2, 3])
+        self.assertEqual(list(res[0].src['emb']), [1, 2, 3])
         self.assertEqual(res[0].harvest_event.id, '1')
 
         self.assertEqual(res[1].src['titles'][0], 'a title 1')
-        self.assertEqual(res[1].src['emb'], [4, 5, 6])
+        self.assertEqual(list(res[1].src['emb']), [4, 5, 6])
         self.assertEqual(res[1].harvest_event.id, '2')
 
         self.assertEqual(res[2].src['titles'][0], 'a title 2')
-        self.assertEqual(res[2].src['emb'], [7, 8, 9])
+        self.assertEqual(list(res[2].src['emb']), [7, 8, 9])
         self.assertEqual(res[2].harvest_event.id, '3')
 
     def test_preprocess_batch(self):
@@ -111,3 +111,53 @@ class TestEmbeddingsUtils(unittest.TestCase):
         self.assertEqual(res[0]['_id'], '1')
         self.assertEqual(res[0]['_source'], source[0])
         self.assertEqual(res[0]['_index'], 'myindex')
+
+    def test_add_embeddings_to_source_with_cache(self):
+        embedding_model = MagicMock(name='embedding_model')
+        embedding_model.embed.return_value = [np.array([4, 5, 6])]
+
+        def event(id: str) -> HarvestEventQueue:
+            return HarvestEventQueue(id=id, xml='<root></root', repository_id='1', endpoint_id='2',
+                                     record_identifier=id, code='DANS', harvest_url='https://oai.org',
+                                     additional_metadata='{}', is_deleted=False,
+                                     datestamp='2025-11-13T14:50:35.397Z')
+
+        data = [
+            SourceWithEmbeddingText(src={'titles': ['cached']}, textToEmbed='cached', event=event('1')),
+            SourceWithEmbeddingText(src={'titles': ['new']}, textToEmbed='new', event=event('2')),
+            SourceWithEmbeddingText(src={'titles': ['new']}, textToEmbed='new', event=event('3'))
+        ]
+
+        cached_hash = embedding_utils.get_embedding_text_hash('cached')
+        cache_lookup = MagicMock(name='cache_lookup', return_value={cached_hash: [1.0, 2.0, 3.0]})
+
+        res = embedding_utils.add_embeddings_to_source(data, embedding_model, embedding_cache=cache_lookup)
+
+        # the cache is asked once for each distinct text
+        cache_lookup.assert_called_once_with([cached_hash, embedding_utils.get_embedding_text_hash('new')])
+        # only the text not in the cache is embedded, once
+        embedding_model.embed.assert_called_once_with(['new'])
+
+        self.assertEqual(len(res), 3)
+        self.assertEqual(list(res[0].src['emb']), [1.0, 2.0, 3.0])
+        self.assertEqual(res[0].embedding_text_hash, cached_hash)
+        self.assertEqual(list(res[1].src['emb']), [4, 5, 6])
+        self.assertEqual(list(res[2].src['emb']), [4, 5, 6])
+        self.assertEqual(res[2].harvest_event.id, '3')
+
+    def test_get_embedding_text_hash(self):
+        res = embedding_utils.get_embedding_text_hash('a title')
+
+        self.assertEqual(len(res), 64)
+        self.assertEqual(res, embedding_utils.get_embedding_text_hash('a title'))
+        self.assertNotEqual(res, embedding_utils.get_embedding_text_hash('a title 1'))
+
+    def test_add_embeddings_to_source_embed_params(self):
+        embedding_model = MagicMock(name='embedding_model')
+        embedding_model.embed.return_value = [np.array([1, 2, 3])]
+
+        data = [SourceWithEmbeddingText(src={'titles': ['title']}, textToEmbed='title', event=MagicMock(name='event'))]
+
+        embedding_utils.add_embeddings_to_source(data, embedding_model, embed_params={'batch_size': 32, 'parallel': 2})
+
+        embedding_model.embed.assert_called_once_with(['title'], batch_size=32, parallel=2)
@@ -0,0 +1,36 @@
+import json
+import unittest
+import numpy as np
+from src.utils import json_utils
+
+
+class TestJsonUtils(unittest.TestCase):
+
+    def test_dumps_document(self):
+        src = {'id': 'https://doi.org/10.1/a', 'titles': [{'title': 'Ä title'}], 'emb': np.array([0.5, 1.5], dtype=np.float32)}
+
+        res = json_utils.dumps_document(src)
+
+        self.assertEqual(json.loads(res.source), {'id': 'https://doi.org/10.1/a', 'titles': [{'title': 'Ä title'}], 'emb': [0.5, 1.5]})
+        self.assertEqual(json.loads(res.datacite_json), {'id': 'https://doi.org/10.1/a', 'titles': [{'title': 'Ä title'}]})
+        # the document is not changed
+        self.assertIn('emb', src)
+
+    def test_dumps_document_only_embedding(self):
+        res = json_utils.dumps_document({'emb': [1.0]})
+
+        self.assertEqual(res.source, '{"emb":[1.0]}')
+        self.assertEqual(res.datacite_json, '{}')
+
+    def test_dumps_arrays(self):
+        arrays = {'a': np.array([0.25, 2.0], dtype=np.float32), 'b': np.array([1, 2]),
+                  'c': np.array([1.0], dtype=np.float16), 'd': np.array([[1, 2], [3, 4]])[:, 0]}
+
+        self.assertEqual(json_utils.dumps(arrays), '{"a":[0.25,2.0],"b":[1,2],"c":[1.0],"d":[1,3]}')
+
+    def test_serializer(self):
+        serializer = json_utils.OrjsonSerializer()
+
+        self.assertEqual(serializer.dumps('{"a":1}'), '{"a":1}')
+        self.assertEqual(serializer.dumps({'a': np.array([1.0])}), '{"a":[1.0]}')
+        self.assertEqual(serializer.loads('{"a":1}'), {'a': 1})
@@ -0,0 +1,27 @@
+import unittest
+from prometheus_client import REGISTRY
+from src.utils import metrics_utils
+
+
+class TestMetricsUtils(unittest.TestCase):
+
+    def get_count(self, stage: str) -> float:
+        return REGISTRY.get_sample_value('transform_stage_duration_seconds_count', {'stage': stage}) or 0.0
+
+    def test_measure_stage(self):
+        count = self.get_count('test')
+
+        with metrics_utils.measure_stage('test', harvest_run_id='abc', batch_size=None):
+            pass
+
+        self.assertEqual(self.get_count('test'), count + 1)
+
+    def test_measure_stage_error(self):
+        count = self.get_count('test_error')
+
+        with self.assertRaises(ValueError):
+            with metrics_utils.measure_stage('test_error'):
+                raise ValueError('failed')
+
+        # the duration of a failed stage is measured, too
+        self.assertEqual(self.get_count('test_error'), count + 1)
@@ -0,0 +1,104 @@
+import unittest
+import xmltodict
+from src.utils import normalize_datacite_json
+from src.utils import normalize_datacite_xml
+
+OAI = 'http://www.openarchives.org/OAI/2.0/'
+DATACITE_RESOURCE = 'http://datacite.org/schema/kernel-4:resource'
+
+RECORD = """<?xml version="1.0" encoding="UTF-8"?>
+<record xmlns="http://www.openarchives.org/OAI/2.0/">
+  <header><identifier> oai:example.org:1 </identifier></header>
+  <metadata>
+    {resource}
+  </metadata>
+</record>"""
+
+RESOURCE = """<resource xmlns="http://datacite.org/schema/kernel-4" xmlns:xml="http://www.w3.org/XML/1998/namespace">
+  <identifier identifierType="DOI">10.1234/ABC</identifier>
+  <creators>
+    <creator>
+      <creatorName nameType="Personal">Doe, <!-- comment --> Jane</creatorName>
+      <nameIdentifier nameIdentifierScheme="ORCID">0000-0000-0000-0000</nameIdentifier>
+      <affiliation/>
+    </creator>
+    <creator><creatorName>Roe, Richard</creatorName></creator>
+  </creators>
+  <titles>
+    <title xml:lang="en">A title</title>
+    <title titleType="Subtitle">A subtitle</title>
+  </titles>
+  <publisher>Publisher</publisher>
+  <publicationYear>2024</publicationYear>
+  <subjects><subject subjectScheme="keywords">Archaeology</subject></subjects>
+  <dates><date dateType="Issued">2024-01-01</date></dates>
+  <resourceType resourceTypeGeneral="Dataset">Dataset</resourceType>
+  <descriptions>
+    <description descriptionType="Abstract">Text with <![CDATA[<markup>]]> and a <br/> break</description>
+  </descriptions>
+</resource>"""
+
+
+def normalize_with_xmltodict(xml: str):
+    metadata = xmltodict.parse(xml, process_namespaces=True)[f'{OAI}:record'][f'{OAI}:metadata']
+    return normalize_datacite_json.normalize_datacite_json(metadata[DATACITE_RESOURCE])
+
+
+class TestNormalizeDataciteXml(unittest.TestCase):
+
+    def test_same_result_as_xmltodict(self):
+        for file in ['tests/testdata/doi_10.17026_SS_78HHDK.oai_datacite.xml', 'e2e/test_data/dans.xml']:
+            with open(file) as f:
+                xml = f.read()
+
+            self.assertEqual(normalize_datacite_xml.normalize_datacite_xml(xml), normalize_with_xmltodict(xml))
+
+    def test_same_result_as_xmltodict_mixed_content(self):
+        xml = RECORD.format(resource=RESOURCE)
+
+        res = normalize_datacite_xml.normalize_datacite_xml(xml)
+
+        self.assertEqual(res, normalize_with_xmltodict(xml))
+        self.assertEqual(res['doi'], '10.1234/ABC')
+        self.assertEqual(len(res['creators']), 2)
+
+    def test_element_to_dict(self):
+        expected = xmltodict.parse(RESOURCE, process_namespaces=True)[DATACITE_RESOURCE]
+        # namespace declarations are not part of the converted element
+        del expected['@xmlns']
+
+        res = normalize_datacite_xml.element_to_dict(normalize_datacite_xml.etree.fromstring(RESOURCE))
+
+        self.assertEqual(res, expected)
+
+    def test_parse_record_onedata(self):
+        xml = RECORD.format(resource=f"""<oai_datacite xmlns="http://schema.datacite.org/oai/oai-1.1/">
+        <payload>{RESOURCE}</payload></oai_datacite>""")
+
+        res = normalize_datacite_xml.parse_record(xml)
+
+        self.assertEqual(res.identifier, 'oai:example.org:1')
+        self.assertIsNotNone(res.resource)
+        self.assertIn('http://datacite.org/schema/kernel-4:titles', res.resource)
+        self.assertNotIn('http://datacite.org/schema/kernel-4:publisher', res.resource)
+
+    def test_parse_record_without_resource(self):
+        xml = RECORD.format(resource='<dc xmlns="http://purl.org/dc/elements/1.1/"/>')
+
+        res = normalize_datacite_xml.parse_record(xml)
+
+        self.assertEqual(res.identifier, 'oai:example.org:1')
+        self.assertIsNone(res.resource)
+        self.assertIsNone(normalize_datacite_xml.normalize_datacite_xml(xml))
+
+    def test_get_content_hash(self):
+        xml = RECORD.format(resource=RESOURCE)
+        res = normalize_datacite_xml.get_content_hash(xml, None)
+
+        # header and formatting of attributes are not part of the content
+        reformatted = xml.replace('<identifier> oai:example.org:1 </identifier>', '<identifier>oai:example.org:2</identifier>') \
+            .replace('identifierType="DOI"', "identifierType='DOI'")
+        self.assertEqual(normalize_datacite_xml.get_content_hash(reformatted, None), res)
+
+        self.assertNotEqual(normalize_datacite_xml.get_content_hash(xml.replace('A title', 'Another title'), None), res)
+        self.assertNotEqual(normalize_datacite_xml.get_content_hash(xml, '{}'), res)
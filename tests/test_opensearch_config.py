@@ -0,0 +1,29 @@
+import os
+import unittest
+from unittest.mock import patch
+from src.config.opensearch_config import OpenSearchConfig
+
+
+class TestOpenSearchConfig(unittest.TestCase):
+
+    @patch.dict(os.environ, {'OPENSEARCH_SYNC': '', 'OPENSEARCH_OUTBOX_CHUNK_SIZE': '', 'OPENSEARCH_OUTBOX_MAX_ATTEMPTS': ''})
+    def test_sync_defaults(self):
+        config = OpenSearchConfig()
+
+        self.assertEqual(config.sync_mode, 'direct')
+        self.assertEqual(config.outbox_chunk_size, 5000)
+        self.assertEqual(config.outbox_max_attempts, 5)
+
+    @patch.dict(os.environ, {'OPENSEARCH_SYNC': 'Outbox', 'OPENSEARCH_OUTBOX_CHUNK_SIZE': '1000',
+                             'OPENSEARCH_OUTBOX_MAX_ATTEMPTS': '3'})
+    def test_sync_outbox(self):
+        config = OpenSearchConfig()
+
+        self.assertEqual(config.sync_mode, 'outbox')
+        self.assertEqual(config.outbox_chunk_size, 1000)
+        self.assertEqual(config.outbox_max_attempts, 3)
+
+    @patch.dict(os.environ, {'OPENSEARCH_SYNC': 'queue'})
+    def test_sync_invalid(self):
+        with self.assertRaises(ValueError):
+            OpenSearchConfig()
@@ -0,0 +1,150 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from opensearchpy import OpenSearch, TransportError
+from src.utils import opensearch_utils
+
+
+def response(*statuses: tuple[str, str, int]) -> dict:
+    return {'errors': any(status >= 300 for _, _, status in statuses),
+            'items': [{op_type: {'_id': id, 'status': status, **({'error': 'rejected'} if status >= 300 else {})}}
+                      for op_type, id, status in statuses]}
+
+
+class TestOpenSearchUtils(unittest.TestCase):
+
+    def setUp(self):
+        self.client = OpenSearch()
+        self.client.bulk = MagicMock(name='bulk')
+        self.actions = [
+            {'_op_type': 'delete', '_id': 'd', '_index': 'idx'},
+            {'_op_type': 'index', '_id': 'a', '_index': 'idx', '_source': {'id': 'a'}},
+            {'_op_type': 'index', '_id': 'b', '_index': 'idx', '_source': {'id': 'b'}}
+        ]
+
+    def test_bulk_write(self):
+        self.client.bulk.return_value = response(('delete', 'd', 404), ('index', 'a', 201), ('index', 'b', 400))
+
+        res = opensearch_utils.bulk_write(self.client, self.actions)
+
+        # a missing document to be deleted is not an error
+        self.assertEqual(res.success, 2)
+        self.assertEqual(res.errors, [opensearch_utils.BulkError(id='b', op_type='index', status=400, error='rejected')])
+
+    def test_bulk_write_deletes(self):
+        self.client.bulk.return_value = response(('delete', 'd', 200), ('delete', 'e', 404), ('delete', 'f', 500))
+        actions = [{'_op_type': 'delete', '_id': id, '_index': 'idx'} for id in 'def']
+
+        res = opensearch_utils.bulk_write(self.client, actions)
+
+        # a document that is already gone counts as deleted, so that its record is deleted as well
+        self.assertEqual(res.success, 2)
+        self.assertEqual(res.errors, [opensearch_utils.BulkError(id='f', op_type='delete', status=500, error='rejected')])
+        # delete actions have no source line
+        body = self.client.bulk.call_args.kwargs['body']
+        self.assertEqual(len(body.strip().split('\n')), 3)
+        self.assertTrue(all('"delete"' in line for line in body.strip().split('\n')))
+
+    @patch('src.utils.opensearch_utils.time.sleep')
+    def test_bulk_write_retry(self, sleep):
+        self.client.bulk.side_effect = [
+            response(('delete', 'd', 200), ('index', 'a', 429), ('index', 'b', 201)),
+            TransportError(503, 'unavailable'),
+            response(('index', 'a', 201))
+        ]
+
+        res = opensearch_utils.bulk_write(self.client, self.actions, initial_backoff=1)
+
+        self.assertEqual(res.success, 3)
+        self.assertEqual(res.errors, [])
+        self.assertEqual(self.client.bulk.call_count, 3)
+        # only the rejected document is sent again
+        self.assertIn('"_id":"a"', self.client.bulk.call_args.kwargs['body'])
+        self.assertNotIn('"_id":"b"', self.client.bulk.call_args.kwargs['body'])
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1, 2])
+
+    @patch('src.utils.opensearch_utils.time.sleep')
+    def test_bulk_write_retries_exhausted(self, sleep):
+        self.client.bulk.side_effect = TransportError(429, 'too many requests')
+
+        res = opensearch_utils.bulk_write(self.client, self.actions, max_retries=2)
+
+        self.assertEqual(res.success, 0)
+        self.assertEqual([error.id for error in res.errors], ['d', 'a', 'b'])
+        self.assertEqual(self.client.bulk.call_count, 3)
+
+    def test_bulk_write_chunks(self):
+        self.client.bulk.side_effect = lambda body, *args, **kwargs: response(
+            *[('index', line.split('"_id":"')[1][0], 201) for line in body.split('\n') if '"_id"' in line])
+
+        res = opensearch_utils.bulk_write(self.client, self.actions[1:], chunk_size=1, thread_count=2)
+
+        self.assertEqual(res.success, 2)
+        self.assertEqual(self.client.bulk.call_count, 2)
+
+    def test_create_index(self):
+        client = MagicMock(name='client')
+        mapping = {'settings': {}, 'mappings': {'properties': {'emb': {'type': 'knn_vector', 'dimension': 0}}}}
+
+        opensearch_utils.create_index(client, 'idx_1', mapping, 384)
+
+        body = client.indices.create.call_args.kwargs['body']
+        self.assertEqual(body['mappings']['properties']['emb']['dimension'], 384)
+        # the mapping passed in is not changed
+        self.assertEqual(mapping['mappings']['properties']['emb']['dimension'], 0)
+        self.assertEqual(body['settings'], {})
+
+    def test_create_index_bulk_settings(self):
+        client = MagicMock(name='client')
+        mapping = {'settings': {'index': {'number_of_replicas': 1}},
+                   'mappings': {'properties': {'emb': {'type': 'knn_vector', 'dimension': 0}}}}
+
+        opensearch_utils.create_index(client, 'idx_1', mapping, 384, bulk_settings=True)
+
+        body = client.indices.create.call_args.kwargs['body']
+        self.assertEqual(body['settings']['index'], {'refresh_interval': '-1', 'number_of_replicas': 0})
+        self.assertEqual(mapping['settings']['index'], {'number_of_replicas': 1})
+
+    def test_publish_index(self):
+        client = MagicMock(name='client')
+        client.indices.exists_alias.return_value = True
+        client.indices.get_alias.return_value = {'idx_1': {'aliases': {'idx': {}}}}
+        mapping = {'settings': {'index': {'number_of_replicas': 1}}, 'mappings': {}}
+
+        res = opensearch_utils.publish_index(client, 'idx', 'idx_2', mapping)
+
+        self.assertEqual(res, ['idx_1'])
+        client.indices.refresh.assert_called_once_with(index='idx_2')
+        client.indices.forcemerge.assert_called_once()
+        # settings not given in the mapping are reset to their defaults
+        client.indices.put_settings.assert_called_once_with(
+            index='idx_2', body={'index': {'refresh_interval': None, 'number_of_replicas': 1}})
+        client.indices.update_aliases.assert_called_once()
+        client.indices.delete.assert_not_called()
+
+    def test_swap_alias(self):
+        client = MagicMock(name='client')
+        client.indices.exists_alias.return_value = True
+        client.indices.get_alias.return_value = {'idx_1': {'aliases': {'idx': {}}}}
+
+        res = opensearch_utils.swap_alias(client, 'idx', 'idx_2', delete_old=True)
+
+        self.assertEqual(res, ['idx_1'])
+        client.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'remove': {'index': 'idx_1', 'alias': 'idx'}},
+            {'add': {'index': 'idx_2', 'alias': 'idx'}}
+        ]})
+        client.indices.delete.assert_called_once_with(index='idx_1')
+
+    def test_swap_alias_replaces_index(self):
+        client = MagicMock(name='client')
+        client.indices.exists_alias.return_value = False
+        client.indices.exists.return_value = True
+
+        res = opensearch_utils.swap_alias(client, 'idx', 'idx_2')
+
+        self.assertEqual(res, [])
+        client.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'remove_index': {'index': 'idx'}},
+            {'add': {'index': 'idx_2', 'alias': 'idx'}}
+        ]})
+        client.indices.delete.assert_not_called()
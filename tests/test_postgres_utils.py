@@ -0,0 +1,146 @@
+import unittest
+import numpy as np
+from unittest.mock import MagicMock
+from src.utils.postgres_utils import embedding_to_bytes, embedding_from_bytes, enqueue_delete_actions, RecordToDelete, \
+    RecordRow, UpsertResult, upsert_records, get_records_to_delete, delete_records, set_harvest_event_errors, \
+    complete_index_batch, fail_index_batch
+from src.utils.queue_utils import HarvestEventQueue
+
+
+def record_row(record_identifier: str, datestamp: str = '2025-01-01T00:00:00Z') -> RecordRow:
+    return RecordRow(harvest_event_id='e-' + record_identifier, record_identifier=record_identifier, repository_id='r',
+                     endpoint_id='e', resource_type='Dataset', title='title', raw_metadata='<record/>',
+                     metadata_protocol='OAI-PMH', doi='10.1234/' + record_identifier, url=None, embeddings=None,
+                     embedding_model=None, embedding_text_hash=None, content_hash=None, datacite_json='{}',
+                     opensearch_synced=True, opensearch_synced_at=None, additional_metadata=None, datestamp=datestamp)
+
+
+def deleted_event(record_identifier: str) -> HarvestEventQueue:
+    return HarvestEventQueue(id='e-' + record_identifier, xml='', repository_id='r', endpoint_id='e',
+                             record_identifier=record_identifier, code='test', harvest_url='https://example.org/oai',
+                             additional_metadata=None, is_deleted=True, datestamp='2025-01-01 00:00:00.000000+0000')
+
+
+class TestPostgresUtils(unittest.TestCase):
+
+    def test_embedding_bytes(self):
+        embedding = [0.5, -1.25, 3.0]
+
+        data = embedding_to_bytes(embedding)
+
+        # float32 in network byte order, like PostgreSQL's float4send
+        self.assertEqual(data, np.array(embedding, dtype='>f4').tobytes())
+        self.assertEqual(len(data), 12)
+        self.assertEqual(embedding_from_bytes(data).tolist(), embedding)
+        self.assertTrue(embedding_from_bytes(data).dtype.isnative)
+        self.assertEqual(embedding_to_bytes(np.array(embedding)), data)
+
+    def test_enqueue_delete_actions_without_document(self):
+        cur = MagicMock()
+
+        # records without OpenSearch document are not added to the outbox
+        enqueue_delete_actions(cur, 'test', [RecordToDelete(id='1', opensearch_id=None, harvest_event_id='a')])
+
+        cur.execute.assert_not_called()
+
+        enqueue_delete_actions(cur, 'test', [RecordToDelete(id='1', opensearch_id=None, harvest_event_id='a'),
+                                             RecordToDelete(id='2', opensearch_id='doc', harvest_event_id='b')])
+
+        self.assertEqual(cur.execute.call_args.args[1], ('test', ['doc'], ['b']))
+
+    def test_upsert_records(self):
+        cur = MagicMock()
+        # RETURNING (xmax = 0) AS created: true for inserted rows, false for updated rows
+        cur.fetchall.return_value = [{'created': True}, {'created': False}, {'created': True}]
+        records = [record_row('a'), record_row('b'), record_row('c')]
+
+        res = upsert_records(cur, records)
+
+        self.assertEqual(res, UpsertResult(created=2, updated=1))
+        # the whole batch is copied into the staging table
+        copy = cur.copy.return_value.__enter__.return_value
+        self.assertEqual([call.args[0] for call in copy.write_row.call_args_list], records)
+        self.assertIn('records_staging (harvest_event_id, record_identifier', cur.copy.call_args.args[0])
+
+    def test_upsert_records_duplicates(self):
+        cur = MagicMock()
+        # two harvest events of the same record in the batch are written as one record, the latest by datestamp
+        cur.fetchall.return_value = [{'created': False}]
+
+        res = upsert_records(cur, [record_row('a', '2025-01-01T00:00:00Z'), record_row('a', '2025-02-01T00:00:00Z')])
+
+        self.assertEqual(res, UpsertResult(created=0, updated=1))
+        upsert = next(call.args[0] for call in cur.execute.call_args_list if 'INSERT INTO records' in call.args[0])
+        self.assertIn('DISTINCT ON (endpoint_id, record_identifier)', upsert)
+        self.assertIn('ORDER BY endpoint_id, record_identifier, datestamp DESC', upsert)
+        # the error messages of both harvest events are reset
+        self.assertIn('UPDATE harvest_events', cur.execute.call_args_list[-1].args[0])
+
+    def test_upsert_records_empty(self):
+        cur = MagicMock()
+
+        self.assertEqual(upsert_records(cur, []), UpsertResult(created=0, updated=0))
+        cur.execute.assert_not_called()
+
+    def test_get_records_to_delete(self):
+        cur = MagicMock()
+        cur.fetchall.return_value = [
+            {'id': 'e::a', 'doi': '10.1234/a', 'url': None, 'opensearch_id': 'https://doi.org/10.1234/a', 'harvest_event_id': 'e-a'},
+            # written before datacite_json had an id: the document id is derived like normalize_datacite_json.make_id
+            {'id': 'e::b', 'doi': '10.1234/b', 'url': 'https://example.org/b', 'opensearch_id': None, 'harvest_event_id': 'e-b'},
+            {'id': 'e::c', 'doi': None, 'url': 'https://example.org/c', 'opensearch_id': None, 'harvest_event_id': 'e-c'}
+        ]
+
+        records = get_records_to_delete(cur, [deleted_event('a'), deleted_event('b'), deleted_event('c'), deleted_event('d')])
+
+        self.assertEqual(records, [RecordToDelete(id='e::a', opensearch_id='https://doi.org/10.1234/a', harvest_event_id='e-a'),
+                                   RecordToDelete(id='e::b', opensearch_id='https://doi.org/10.1234/b', harvest_event_id='e-b'),
+                                   RecordToDelete(id='e::c', opensearch_id='https://example.org/c', harvest_event_id='e-c')])
+        # all harvest events are looked up with one query
+        cur.execute.assert_called_once()
+        self.assertEqual(cur.execute.call_args.args[1][2], ['a', 'b', 'c', 'd'])
+
+    def test_get_records_to_delete_empty(self):
+        cur = MagicMock()
+
+        self.assertEqual(get_records_to_delete(cur, []), [])
+        cur.execute.assert_not_called()
+
+    def test_delete_records(self):
+        cur = MagicMock()
+        cur.rowcount = 2
+
+        self.assertEqual(delete_records(cur, ['e::a', 'e::b']), 2)
+        self.assertEqual(cur.execute.call_args.args[1], [['e::a', 'e::b']])
+
+        cur.reset_mock()
+        self.assertEqual(delete_records(cur, []), 0)
+        cur.execute.assert_not_called()
+
+    def test_set_harvest_event_errors(self):
+        cur = MagicMock()
+
+        set_harvest_event_errors(cur, {'e-a': 'not found', 'e-b': 'rejected'})
+
+        self.assertEqual(cur.execute.call_args.args[1], (['e-a', 'e-b'], ['not found', 'rejected']))
+
+        cur.reset_mock()
+        set_harvest_event_errors(cur, {})
+        cur.execute.assert_not_called()
+
+    def test_complete_index_batch(self):
+        cur = MagicMock()
+
+        complete_index_batch(cur, 7, 1.5)
+
+        self.assertIn("SET status = 'done'", cur.execute.call_args.args[0])
+        self.assertEqual(cur.execute.call_args.args[1], (1.5, 7))
+
+    def test_fail_index_batch(self):
+        cur = MagicMock()
+
+        fail_index_batch(cur, 7, 'failed')
+
+        # a batch done by a redelivered task stays done
+        self.assertIn("WHERE id = %s AND status <> 'done'", cur.execute.call_args.args[0])
+        self.assertEqual(cur.execute.call_args.args[1], ('failed', 7))
@@ -0,0 +1,44 @@
+import threading
+import time
+import unittest
+from src.utils.queue_utils import RateLimiter, split_batches
+
+
+class TestQueueUtils(unittest.TestCase):
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(rate=50)
+
+        started = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+
+        # the first operation is allowed immediately, the others 20 ms apart
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_rate_limiter_threads(self):
+        limiter = RateLimiter(rate=50, burst=2)
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=lambda: [limiter.acquire() for _ in range(3)]) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # the limit applies to all threads together: 2 operations at once, the other 4 20 ms apart
+        self.assertGreaterEqual(time.monotonic() - started, 0.07)
+
+    def test_split_batches(self):
+        batches = list(split_batches([1, 2, 3, 4, 5, 6, 7], max_events=3, max_bytes=lambda: 0, get_size=lambda row: 1))
+
+        self.assertEqual(batches, [([1, 2, 3], 3), ([4, 5, 6], 3), ([7], 1)])
+
+    def test_split_batches_bytes(self):
+        budgets = iter([5, 10, 10, 10, 10])
+        sizes = {'a': 2, 'b': 2, 'c': 2, 'd': 20, 'e': 4, 'f': 4, 'g': 4}
+
+        batches = list(split_batches(list(sizes), max_events=10, max_bytes=lambda: next(budgets), get_size=sizes.get))
+
+        # the budget is read once per batch, a row larger than the budget is a batch of its own
+        self.assertEqual(batches, [(['a', 'b'], 4), (['c'], 2), (['d'], 20), (['e', 'f'], 8), (['g'], 4)])
@@ -0,0 +1,206 @@
+import importlib
+import json
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+from fastapi.testclient import TestClient
+
+# the API imports its modules relative to src (like the workers), they are aliased to the modules imported
+# by the other tests so that they are loaded once, e.g., the Prometheus metrics are registered once
+sys.path.append('src')
+for name in ('config', 'config.logging_config', 'config.postgres_config', 'utils', 'utils.queue_utils',
+             'utils.opensearch_utils', 'utils.metrics_utils', 'celery_app'):
+    sys.modules.setdefault(name, importlib.import_module(f'src.{name}'))
+
+os.environ.setdefault('POSTGRES_USER', 'test')
+os.environ.setdefault('POSTGRES_PASSWORD', 'test')
+os.environ.setdefault('POSTGRES_DB', 'test')
+
+from src import transform
+
+
+def harvest_event(record_identifier: str, **kwargs: object) -> dict:
+    return {'record_identifier': record_identifier, 'datestamp': '2025-01-01T00:00:00Z', 'raw_metadata': '<record/>',
+            'harvest_url': 'https://example.org/oai', 'repo_code': 'test', 'harvest_run_id': 'run', 'is_deleted': False,
+            **kwargs}
+
+
+class TestTransform(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(transform, 'postgres_config')
+        self.postgres_config = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.conn = self.postgres_config.get_pool.return_value.connection.return_value.__enter__.return_value
+        self.cur = self.conn.cursor.return_value
+        self.client = TestClient(transform.app)
+
+    def test_create_harvest_events(self):
+        self.cur.fetchone.return_value = {'harvest_run_id': 'run', 'endpoint_id': 'endpoint', 'repository_id': 'repository'}
+        self.cur.fetchall.side_effect = [
+            # not well-formed XML (by position in the staging table)
+            [{'ord': 1}],
+            # inserted, a record identifier that already exists for the harvest run is not returned
+            [{'id': 'id-a', 'record_identifier': 'a'}]
+        ]
+        body = '\n'.join([json.dumps(harvest_event('a')), json.dumps(harvest_event('b', raw_metadata='<record>')),
+                          '{"record_identifier": ', json.dumps(harvest_event('a')), ''])
+
+        res = self.client.post('/harvest_events', content=body, headers={'content-type': 'application/x-ndjson'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['created'], 1)
+        self.assertEqual(res.json()['failed'], 3)
+        self.assertEqual([(item['record_identifier'], item['status'], item['id']) for item in res.json()['items']],
+                         [('a', 'created', 'id-a'), ('b', 'invalid', None), (None, 'invalid', None), ('a', 'duplicate', None)])
+        # the valid lines are copied in one chunk
+        copy = self.cur.copy.return_value.__enter__.return_value
+        self.assertEqual([call.args[0][:2] for call in copy.write_row.call_args_list], [(0, 'a'), (1, 'b'), (2, 'a')])
+
+    def test_create_harvest_events_json_array(self):
+        self.cur.fetchone.return_value = {'harvest_run_id': 'run', 'endpoint_id': 'endpoint', 'repository_id': 'repository'}
+        self.cur.fetchall.side_effect = [[], [{'id': 'id-a', 'record_identifier': 'a'}]]
+
+        res = self.client.post('/harvest_events', json=[harvest_event('a'), harvest_event('b', harvest_run_id='other')])
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual((res.json()['created'], res.json()['failed']), (1, 1))
+        # all harvest events must belong to the harvest run of the first one
+        self.assertEqual(res.json()['items'][1]['status'], 'invalid')
+
+    def test_create_harvest_events_chunks(self):
+        self.cur.fetchone.return_value = {'harvest_run_id': 'run', 'endpoint_id': 'endpoint', 'repository_id': 'repository'}
+        self.cur.fetchall.side_effect = [[], [{'id': 'id-a', 'record_identifier': 'a'}],
+                                         [], [{'id': 'id-c', 'record_identifier': 'c'}]]
+        body = '\n'.join(json.dumps(harvest_event(record_identifier)) for record_identifier in 'abc')
+
+        with patch.object(transform, 'HARVEST_EVENTS_CHUNK_SIZE', 2):
+            res = self.client.post('/harvest_events', content=body, headers={'content-type': 'application/x-ndjson'})
+
+        # one transaction per chunk, the positions are kept across chunks
+        self.assertEqual(self.postgres_config.get_pool.return_value.connection.call_count, 3)
+        self.assertEqual([item['status'] for item in res.json()['items']], ['created', 'duplicate', 'created'])
+
+    def test_create_harvest_events_closed_run(self):
+        self.cur.fetchone.return_value = None
+
+        res = self.client.post('/harvest_events', json=[harvest_event('a')])
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_add_index_batch(self):
+        conn = MagicMock()
+        conn.execute.return_value.fetchone.return_value = {'id': 7}
+
+        batch_id = transform.add_index_batch(conn, 'run', 'idx', ['e1', 'e2', 'e3'])
+
+        self.assertEqual(batch_id, 7)
+        # the range of the batch, committed before the batch is put in the queue
+        self.assertEqual(conn.execute.call_args.args[1], ('run', 'idx', 'e1', 'e3', 3, None))
+        conn.commit.assert_called_once()
+
+    @patch.object(transform.celery_app, 'send_task')
+    def test_resume_jobs_in_queue(self, send_task):
+        self.cur.fetchall.side_effect = [
+            [{'id': 1, 'index_name': 'idx', 'first_event_id': 'a', 'last_event_id': 'b', 'status': 'done'},
+             {'id': 2, 'index_name': 'idx', 'first_event_id': 'c', 'last_event_id': 'd', 'status': 'failed'},
+             {'id': 3, 'index_name': 'idx', 'first_event_id': 'e', 'last_event_id': 'f', 'status': 'scheduled'}],
+            # harvest events of the ranges of the batches not done
+            [{'id': 'c'}, {'id': 'd'}],
+            [{'id': 'e'}]
+        ]
+
+        res = transform.resume_jobs_in_queue('run', 'idx', skip_unchanged=True)
+
+        self.assertEqual((res.number_of_batches, res.number_of_events), (2, 3))
+        # failed and lost batches are scheduled again
+        update = next(call for call in self.cur.execute.call_args_list if 'UPDATE index_batches' in call.args[0])
+        self.assertEqual(update.args[1], [[2, 3]])
+        self.assertEqual(self.cur.execute.call_args_list[-1].args[1], ('run', 'e', 'f'))
+        self.assertEqual([call.kwargs['args'] for call in send_task.call_args_list],
+                         [[['c', 'd'], 'idx', 'run', True, False, 2], [['e'], 'idx', 'run', True, False, 3]])
+
+    @patch.object(transform, 'chord')
+    @patch.object(transform.celery_app, 'send_task')
+    def test_resume_jobs_in_queue_new_index(self, send_task, chord):
+        self.cur.fetchall.side_effect = [
+            [{'id': 1, 'index_name': 'idx_20250101', 'first_event_id': 'a', 'last_event_id': 'b', 'status': 'failed'}],
+            [{'id': 'a'}, {'id': 'b'}]
+        ]
+
+        res = transform.resume_jobs_in_queue('run', 'idx', new_index=True, delete_old=True)
+
+        # the versioned index of the /index to resume is completed and published
+        self.assertEqual(res.index_name, 'idx_20250101')
+        send_task.assert_not_called()
+        header = chord.call_args.args[0]
+        self.assertEqual(header[0].args, (['a', 'b'], 'idx_20250101', 'run', False, True, 1))
+        self.assertEqual(chord.return_value.call_args.args[0].args, ('idx', 'idx_20250101', True))
+
+    def test_resume_jobs_in_queue_other_index(self):
+        self.cur.fetchall.return_value = [
+            {'id': 1, 'index_name': 'other', 'first_event_id': 'a', 'last_event_id': 'b', 'status': 'failed'}]
+
+        with self.assertRaises(ValueError):
+            transform.resume_jobs_in_queue('run', 'idx')
+
+        self.cur.fetchall.return_value = []
+
+        with self.assertRaises(ValueError):
+            transform.resume_jobs_in_queue('run', 'idx')
+
+    def test_get_index_progress(self):
+        now = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        self.cur.fetchone.side_effect = [
+            {'index_name': 'idx', 'batches': 10, 'batches_done': 6, 'batches_failed': 1, 'events': 1000, 'events_done': 600,
+             'events_failed': 100, 'started_at': now - timedelta(minutes=10), 'last_completed_at': now, 'now': now},
+            # events done in the last PROGRESS_RATE_WINDOW seconds
+            {'events': 150},
+            {'error': 'failed'}
+        ]
+
+        progress = transform.get_index_progress_in_db('run')
+
+        self.assertEqual(self.cur.execute.call_args_list[1].args[1],
+                         ('run', now - timedelta(seconds=transform.PROGRESS_RATE_WINDOW)))
+        self.assertEqual((progress.batches_remaining, progress.events_remaining), (3, 300))
+        self.assertEqual(progress.events_per_second, 0.5)
+        self.assertEqual(progress.eta_seconds, 600)
+        self.assertEqual(progress.estimated_completion, now + timedelta(minutes=10))
+        self.assertEqual(progress.last_error, 'failed')
+
+    def test_get_index_progress_started_recently(self):
+        now = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        progress = {'index_name': 'idx', 'batches': 2, 'batches_done': 1, 'batches_failed': 0, 'events': 200,
+                    'events_done': 100, 'events_failed': 0, 'started_at': now - timedelta(seconds=50),
+                    'last_completed_at': None, 'now': now}
+        self.cur.fetchone.side_effect = [progress, {'events': 100}, None]
+
+        res = transform.get_index_progress_in_db('run')
+
+        # the throughput is calculated since the start
+        self.assertEqual(res.events_per_second, 2)
+        self.assertEqual(res.eta_seconds, 50)
+
+        # no batch done yet: no ETA
+        self.cur.fetchone.side_effect = [{**progress, 'batches_done': 0, 'events_done': 0}, {'events': 0}, None]
+        self.assertIsNone(transform.get_index_progress_in_db('run').eta_seconds)
+
+        # all batches done or failed
+        self.cur.fetchone.side_effect = [{**progress, 'batches_failed': 1, 'events_failed': 100}, {'events': 100}, None]
+        self.assertEqual(transform.get_index_progress_in_db('run').eta_seconds, 0)
+
+    def test_get_index_progress_not_recorded(self):
+        self.cur.fetchone.return_value = {'batches': 0}
+
+        self.assertIsNone(transform.get_index_progress_in_db('run'))
+
+    def test_index_bulk_pipeline(self):
+        with patch.object(transform, 'PIPELINE', True):
+            res = self.client.get('/index/bulk', params={'latest': True, 'index_name': 'idx'})
+
+        # the status of the group would only cover the first stage of the pipeline
+        self.assertEqual(res.status_code, 400)
+        self.postgres_config.get_pool.assert_not_called()
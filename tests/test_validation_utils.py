@@ -0,0 +1,48 @@
+import unittest
+import json
+from jsonschema import validate
+from jsonschema.exceptions import ValidationError
+from src.utils.normalize_datacite_xml import normalize_datacite_xml
+from src.utils.validation_utils import RecordValidator, RecordValidationError
+
+
+class TestValidationUtils(unittest.TestCase):
+
+    def setUp(self):
+        with open('src/config/schema.json') as f:
+            self.schema = json.load(f)
+
+        with open('tests/testdata/doi_10.17026_SS_78HHDK.oai_datacite.xml') as f:
+            self.record = normalize_datacite_xml(f.read())
+
+    def test_validate_valid_record(self):
+        RecordValidator(self.schema).validate(self.record)
+        RecordValidator(self.schema, collect_all_errors=True).validate(self.record)
+
+    def test_validate_same_error_as_jsonschema(self):
+        invalid = {**self.record, 'titles': 'A title'}
+        del invalid['id']
+
+        with self.assertRaises(ValidationError) as expected:
+            validate(instance=invalid, schema=self.schema)
+
+        with self.assertRaises(ValidationError) as res:
+            RecordValidator(self.schema).validate(invalid)
+
+        self.assertEqual(str(res.exception), str(expected.exception))
+
+    def test_validate_collect_all_errors(self):
+        invalid = {**self.record, 'titles': 'A title'}
+        del invalid['id']
+
+        with self.assertRaises(RecordValidationError) as res:
+            RecordValidator(self.schema, collect_all_errors=True).validate(invalid)
+
+        self.assertEqual(len(res.exception.errors), 2)
+        self.assertEqual(json.loads(str(res.exception)), res.exception.errors)
+        self.assertEqual([error['validator'] for error in res.exception.errors], ['required', 'type'])
+        self.assertEqual(res.exception.errors[1]['path'], '$.titles')
+
+    def test_invalid_schema(self):
+        with self.assertRaises(Exception):
+            RecordValidator({'type': 'no type'})